@@ -1,16 +1,27 @@
 import os, sys
+from contextlib import asynccontextmanager
 from typing import List
 sys.path.append(os.path.dirname(__file__))
 
 from fastapi import UploadFile, File
 from fastapi import FastAPI, Request, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
 
-from api.models import ImageUploadResponse, TemplateResponse, GenerateRequest, GenerateResponse, CardType, AspectRatio, BackgroundUploadResponse, TemplateUploadResponse
-from api.services import get_random_template_service, get_templates_service, generate_card_service, upload_image_service, upload_background_service, upload_template_service
+from api.models import ImageUploadResponse, TemplateResponse, GenerateRequest, GenerateResponse, CardType, AspectRatio, ColorSpace, BackgroundUploadResponse, TemplateUploadResponse, BulkIngestResponse, CacheStatsResponse
+from api.services import get_random_template_service, get_templates_service, generate_card_service, generate_card_stream_service, upload_image_service, upload_background_service, upload_template_service, bulk_upload_service, cache_stats_service
+from core_ai.utils.nodes import get_render_pool, shutdown_render_pool
 
-app = FastAPI(title="Card Generator API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start and warm the render workers (RENDER_WORKERS) before the first request
+    await run_in_threadpool(get_render_pool)
+    yield
+    await run_in_threadpool(shutdown_render_pool)
+
+app = FastAPI(title="Card Generator API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -60,14 +71,39 @@ def get_random_template(card_type: CardType, aspect_ratio: AspectRatio, request:
 
     - The `greeting_text_instructions` is used to generate a meaningful greeting text (required).
     - If just `foreground_path` is provided, it will use the provided foreground image with a similar background to merge.
+    - If `foreground_path` and `background_path` are provided without `merged_image_path`, the foreground is blended onto that background (e.g. a suggestion from `/upload-foreground`).
     - If `merge_image_path`, `background_path` and `foreground_path` are not provided, it will automatically select appropriate templates based on the `greeting_text_instructions`.
     - The `aspect_ratio` can be 3:4 or 4:3, which determines the layout of the card.
+    - The card is encoded as `output_format` (png, webp or jpeg). When omitted, the image type preferred by the `Accept` header is used (e.g. `Accept: image/webp, application/json`), falling back to `CARD_FORMAT`.
+    - With `preview` set, the card is rendered at `PREVIEW_HEIGHT` (default 480px) with the same layout. Send the returned `recipe` back to render the same card at full resolution without generating new text.
+    - Replies of the LLM are cached by instructions (`LLM_CACHE`, `LLM_CACHE_TTL`). Set `no_cache` for a fresh greeting, or `variety` to pick among that many cached greetings.
     """,
     tags=["Card Generation"]
 )
-def generate_card(req: GenerateRequest, request: Request):
+async def generate_card(req: GenerateRequest, request: Request):
     """Generate a birthday card based on the provided request."""
-    return generate_card_service(req, request)
+    return await generate_card_service(req, request)
+
+@app.post(
+    "/generate-card/stream",
+    response_class=StreamingResponse,
+    description="""
+    Generate a card like `/generate-card`, streaming the progress as server-sent events (`text/event-stream`).
+
+    - `token`: `{"field": "title" | "greeting_text", "text": ...}`, pieces of the title and greeting as the LLM writes them.
+    - `node`: `{"node": ..., ...}`, the fields a step set as it finishes: card type, template or matched background, colors, and `merged_preview_url` (the image before its text).
+    - `card`: the `/generate-card` response, last.
+    - `error`: `{"status_code": ..., "detail": ...}` when generation fails after the stream started.
+    """,
+    tags=["Card Generation"]
+)
+async def generate_card_stream(req: GenerateRequest, request: Request):
+    """Generate a card, streaming progress and greeting tokens as server-sent events."""
+    return StreamingResponse(
+        await generate_card_stream_service(req, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.post(
     "/upload-foreground",
@@ -75,9 +111,14 @@ def generate_card(req: GenerateRequest, request: Request):
     description="Upload a foreground image for the card.",
     tags=["Image Upload"]
 )
-async def upload_foreground(req: Request, file: UploadFile = File(...)):
+async def upload_foreground(
+    req: Request,
+    file: UploadFile = File(...),
+    suggest_backgrounds: int = Query(0, ge=0, le=20, description="Number of color-matched backgrounds to suggest"),
+    color_space: ColorSpace = Query(ColorSpace.hsv, description="Color space used to match backgrounds"),
+):
     """Upload a foreground image for the card."""
-    return upload_image_service(file, req)
+    return await run_in_threadpool(upload_image_service, file, req, suggest_backgrounds, color_space.value)
 
 @app.post(
     "/upload-background",
@@ -87,7 +128,7 @@ async def upload_foreground(req: Request, file: UploadFile = File(...)):
 )
 async def upload_background(req: Request, file: UploadFile = File(...)):
     """Upload a background image and automatically add metadata (Admin only)."""
-    return upload_background_service(file, req)
+    return await run_in_threadpool(upload_background_service, file, req)
 
 @app.post(
     "/upload-template",
@@ -103,4 +144,34 @@ async def upload_template(
     background_file: UploadFile = File(..., description="Background image file")
 ):
     """Upload foreground and background images to create a template with metadata (Admin only)."""
-    return upload_template_service(foreground_file, background_file, card_type, aspect_ratio.value, req)
\ No newline at end of file
+    return await run_in_threadpool(upload_template_service, foreground_file, background_file, card_type, aspect_ratio.value, req)
+
+@app.post(
+    "/upload-bulk",
+    response_model=BulkIngestResponse,
+    description="""
+    (Admin only) Upload a zip archive of backgrounds and templates and ingest them in one batch.
+
+    - `backgrounds/*` images are added as backgrounds.
+    - `foregrounds/*` images are stored as template foregrounds.
+    - `templates/<card_type>.txt` files list one '<foreground> <background>' pair per line.
+    """,
+    tags=["Template Management"]
+)
+def upload_bulk(
+    req: Request,
+    aspect_ratio: AspectRatio,
+    file: UploadFile = File(..., description="Zip archive")
+):
+    """Bulk ingest backgrounds and templates from a zip archive (Admin only)."""
+    return bulk_upload_service(file, aspect_ratio.value, req)
+
+@app.get(
+    "/cache-stats",
+    response_model=CacheStatsResponse,
+    description="Hit and miss counters of the LLM response cache and the image caches of this worker process.",
+    tags=["Monitoring"]
+)
+def cache_stats():
+    """Get the cache counters of this worker process."""
+    return cache_stats_service()
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Dict, List, Optional
 from enum import Enum
 from pydantic import BaseModel, Field
 
@@ -27,12 +27,47 @@ class AspectRatio(float, Enum):
     ratio_3_4 = 3 / 4
     ratio_4_3 = 4 / 3
 
+class ColorSpace(str, Enum):
+    """
+    Enum representing color spaces used to match backgrounds.
+    """
+    hsv = "hsv"
+    lab = "lab"
+
+class OutputFormat(str, Enum):
+    """
+    Enum representing encodings of the generated card.
+    """
+    png = "png"
+    webp = "webp"
+    jpeg = "jpeg"
+
+class CardRecipe(BaseModel):
+    """
+    Everything generated or picked at random for a card, so it can be rendered again identically.
+    """
+    title: Optional[str] = Field(None, description="Title of the card")
+    greeting_text: str = Field(..., description="Greeting text of the card")
+    font_color: str = Field(..., description="Font color in hex format")
+    font_path: str = Field(..., description="Path to the greeting text font")
+    title_font_path: str = Field(..., description="Path to the title font")
+    foreground_path: str = Field(..., description="Path to the foreground image")
+    background_path: str = Field(..., description="Path to the background image")
+    merge_mode: str = Field(..., description="'template' for a template composite, 'blend' for an uploaded foreground")
+    aspect_ratio: float = Field(..., description="Aspect ratio of the card")
+    card_type: Optional[str] = Field(None, description="Type of the card")
+
 class GenerateRequest(BaseModel):
     greeting_text_instructions: str = Field(..., description="Instructions for the greeting text")
     background_path: Optional[str] = Field(None, description="Path to the background image")
     foreground_path: Optional[str] = Field(None, description="Path to the foreground image")
     merged_image_path: Optional[str] = Field(None, description="Path to the merged image")
     aspect_ratio: Optional[float] = Field(3/4, description="Aspect ratio of the card, 3:4 or 4:3")
+    output_format: Optional[OutputFormat] = Field(None, description="Encoding of the card, negotiated from the Accept header when omitted")
+    preview: bool = Field(False, description="Render a quick low-resolution preview")
+    recipe: Optional[CardRecipe] = Field(None, description="Recipe of a previous card (e.g. a preview) to render again, skipping text generation")
+    no_cache: bool = Field(False, description="Generate a fresh greeting instead of reusing a cached LLM reply for the same instructions")
+    variety: int = Field(1, ge=1, le=10, description="Pick among this many cached greetings for the same instructions")
 
     class Config:
         json_schema_extra = {
@@ -41,42 +76,87 @@ class GenerateRequest(BaseModel):
                 "background_path": "static/images/backgrounds/back_23.png",
                 "foreground_path": "static/images/foregrounds/birthday_4.png",
                 "merged_image_path": "static/images/card_types/birthday/77cf8c00-0e67-4ea5-96e9-b29d530a3fbc.png",
-                "aspect_ratio": 0.75
+                "aspect_ratio": 0.75,
+                "output_format": "webp"
             }
         }
 
+class BackgroundSuggestion(BaseModel):
+    background_url: str = Field(..., description="URL of the background image")
+    background_path: str = Field(..., description="Path to the background image")
+    color: str = Field(..., description="Dominant color of the background image")
+    distance: float = Field(..., description="Color distance to the foreground's dominant color")
+
 class ImageUploadResponse(BaseModel):
     foreground_url: str = Field(..., description="URL of the foreground image")
-    foreground_path: str = Field(..., description="Path to the foreground image")
+    foreground_path: str = Field(..., description="Path to the normalized foreground image, used for rendering")
+    original_path: Optional[str] = Field(None, description="Path to the image as uploaded, set when originals are kept")
+    content_hash: Optional[str] = Field(None, description="SHA-256 of the uploaded bytes, the stored file is named after it")
+    duplicate: bool = Field(False, description="Whether the same image was already uploaded and its stored copy reused")
+    foreground_color: Optional[str] = Field(None, description="Dominant color of the foreground image, set when backgrounds are suggested")
+    background_suggestions: List[BackgroundSuggestion] = Field(default_factory=list, description="Backgrounds closest in color to the foreground, closest first")
 
     class Config:
         json_schema_extra = {
             "example": {
-                "foreground_url": "https://example.com/static/images/foregrounds/uploads/upload.png",
-                "foreground_path": "static/images/foregrounds/uploads/upload.png"
+                "foreground_url": "https://example.com/static/images/foregrounds/uploads/528661eeec89207117435db0faa97796.webp",
+                "foreground_path": "static/images/foregrounds/uploads/528661eeec89207117435db0faa97796.webp",
+                "original_path": None,
+                "content_hash": "528661eeec89207117435db0faa97796c2047fb046e139b759377b4a205dd4fe",
+                "duplicate": False,
+                "foreground_color": "#b4232c",
+                "background_suggestions": [
+                    {
+                        "background_url": "https://example.com/static/images/backgrounds/back_32.png",
+                        "background_path": "static/images/backgrounds/back_32.png",
+                        "color": "#b00404",
+                        "distance": 0.21
+                    }
+                ]
             }
         }
 
 class GenerateResponse(BaseModel):
     card_url: str = Field(..., description="URL of the generated card")
+    preview: bool = Field(False, description="Whether the card is a low-resolution preview")
+    recipe: Optional[CardRecipe] = Field(None, description="Recipe to render this card again, e.g. at full resolution after a preview")
 
     class Config:
         json_schema_extra = {
             "example": {
-                "card_url": "https://example.com/static/images/cards/generated_card.png"
+                "card_url": "https://example.com/static/images/cards/generated_card.png",
+                "preview": True,
+                "recipe": {
+                    "title": "Chúc mừng sinh nhật",
+                    "greeting_text": "Chúc bạn tuổi mới thật nhiều niềm vui, sức khỏe và thành công!",
+                    "font_color": "#8a3b12",
+                    "font_path": "static/fonts/text_fonts/DancingScript-Bold.ttf",
+                    "title_font_path": "static/fonts/title_fonts/DancingScript-Bold.ttf",
+                    "foreground_path": "static/images/foregrounds/birthday_4.png",
+                    "background_path": "static/images/backgrounds/back_23.png",
+                    "merge_mode": "template",
+                    "aspect_ratio": 0.75,
+                    "card_type": "birthday"
+                }
             }
         }
 
 class BackgroundUploadResponse(BaseModel):
     background_url: str = Field(..., description="URL of the background image")
-    background_path: str = Field(..., description="Path to the background image")
+    background_path: str = Field(..., description="Path to the normalized background image, used for rendering")
+    original_path: Optional[str] = Field(None, description="Path to the image as uploaded, set when originals are kept")
+    content_hash: Optional[str] = Field(None, description="SHA-256 of the uploaded bytes, the stored file is named after it")
+    duplicate: bool = Field(False, description="Whether the same image was already uploaded and its stored copy reused")
     color: str = Field(..., description="Dominant color of the background image")
 
     class Config:
         json_schema_extra = {
             "example": {
-                "background_url": "https://example.com/static/images/backgrounds/uploads/background.png",
-                "background_path": "static/images/backgrounds/uploads/background.png",
+                "background_url": "https://example.com/static/images/backgrounds/88544bd8eec94717fa2df7addf398935.jpg",
+                "background_path": "static/images/backgrounds/88544bd8eec94717fa2df7addf398935.jpg",
+                "original_path": "static/images/originals/backgrounds/88544bd8eec94717fa2df7addf398935.png",
+                "content_hash": "88544bd8eec94717fa2df7addf39893505e78bfbf863fdac62e0f769b5bd1fee",
+                "duplicate": True,
                 "color": "#FF5733"
             }
         }
@@ -110,6 +190,9 @@ class TemplateResponse(BaseModel):
     merge_margin_ratio: Optional[float] = Field(None, description="Merge margin ratio")
     merge_foreground_ratio: Optional[float] = Field(None, description="Merge foreground ratio")
     merged_image_url: str = Field(..., description="URL of the merged image")
+    thumbnail_urls: Dict[str, str] = Field({}, description="URLs of WebP thumbnails of the merged image, keyed by width in pixels")
+    placeholder: Optional[str] = Field(None, description="Tiny blurred preview as a data URI, to paint before the thumbnail loads")
+    placeholder_color: Optional[str] = Field(None, description="Average color of the merged image in hex format")
 
     class Config:
         json_schema_extra = {
@@ -121,6 +204,55 @@ class TemplateResponse(BaseModel):
                 "merge_position": "top",
                 "merge_margin_ratio": 0.02,
                 "merge_foreground_ratio": 0.5,
-                "merged_image_url": "https://example.com/static/images/cards/template_1.png"
+                "merged_image_url": "https://example.com/static/images/cards/template_1.png",
+                "thumbnail_urls": {
+                    "160": "https://example.com/static/images/thumbnails/6f1c2a9e0b7d4e3a5c81_160.webp",
+                    "320": "https://example.com/static/images/thumbnails/6f1c2a9e0b7d4e3a5c81_320.webp",
+                    "640": "https://example.com/static/images/thumbnails/6f1c2a9e0b7d4e3a5c81_640.webp"
+                },
+                "placeholder": "data:image/webp;base64,UklGRlQAAABXRUJQVlA4IEgAAAAwAwCdASoQABUAPxFysFAsJqSisAgBgCIJYwAAetJ2MCvgAP7uMC1x1swfS22aVGoQV/cDrkZ7rOX4jZyK4yjTC9RHGtwYAAA=",
+                "placeholder_color": "#eedfe4"
+            }
+        }
+
+class CacheStatsResponse(BaseModel):
+    llm: Optional[dict] = Field(None, description="LLM response cache counters, None when the cache is disabled")
+    assets: dict = Field(..., description="Decoded image cache counters")
+    composites: dict = Field(..., description="Template composite cache counters")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "llm": {"backend": "memory", "items": 42, "max_entries": 1024, "ttl": 86400.0, "hits": 310,
+                        "store_hits": 0, "misses": 42, "bypasses": 3, "hit_rate": 0.8807},
+                "assets": {"items": 12, "bytes": 61440000, "max_bytes": 268435456, "hits": 95, "misses": 12, "evictions": 0},
+                "composites": {"items": 4, "bytes": 23040000, "max_bytes": 134217728, "hits": 20, "misses": 4, "evictions": 0}
+            }
+        }
+
+class BulkIngestFailure(BaseModel):
+    kind: str = Field(..., description="Item kind, 'background' or 'template'")
+    path: str = Field(..., description="Path or description of the failed item")
+    error: str = Field(..., description="Error message")
+
+class BulkIngestResponse(BaseModel):
+    backgrounds_added: int = Field(..., description="Number of new backgrounds")
+    templates_added: int = Field(..., description="Number of new templates")
+    skipped: int = Field(..., description="Number of items already present in the metadata store")
+    failed: List[BulkIngestFailure] = Field(default_factory=list, description="Items that could not be ingested")
+    elapsed_seconds: float = Field(..., description="Wall-clock time of the ingest")
+    images_per_second: float = Field(..., description="Ingest throughput")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "backgrounds_added": 12,
+                "templates_added": 8,
+                "skipped": 3,
+                "failed": [
+                    {"kind": "background", "path": "static/images/backgrounds/broken.png", "error": "cannot identify image file"}
+                ],
+                "elapsed_seconds": 4.2,
+                "images_per_second": 5.0
             }
         }
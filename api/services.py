@@ -1,58 +1,91 @@
+import asyncio
+import io
 import json
 import os
-from pathlib import Path
-import shutil
-from typing import List
+import zipfile
+from typing import AsyncIterator, List
 import logging
 from fastapi import HTTPException, Request, UploadFile
-from api.models import ImageUploadResponse, TemplateResponse, GenerateRequest, GenerateResponse, BackgroundUploadResponse, TemplateUploadResponse, CardType
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image, UnidentifiedImageError
+from api.models import CacheStatsResponse, CardRecipe, ImageUploadResponse, BackgroundSuggestion, TemplateResponse, GenerateRequest, GenerateResponse, BackgroundUploadResponse, TemplateUploadResponse, CardType, BulkIngestResponse
 
-from core_ai.utils.tools import get_templates_by_type, get_random_template_by_type, get_dominant_color
+from core_ai.utils.tools import PREVIEW_HEIGHT, get_templates_by_type, get_random_template_by_type, get_dominant_color_cached, get_matching_backgrounds
 from core_ai.graph import build_card_gen_graph
-from utils.metadata import add_background_metadata, add_template_metadata
+from core_ai.utils.assets import ImageTooLargeError, asset_cache, composite_cache
+from core_ai.utils.encoding import negotiate_format, save_image, with_format_extension
+from core_ai.utils.llm_cache import get_llm_cache
+from core_ai.utils.nodes import get_image_executor
+from core_ai.utils.render import RenderQueueFullError
+from core_ai.utils.thumbnails import ensure_thumbnails
+from core_ai.utils.uploads import store_upload
+from utils.metadata import add_background_metadata, add_template_metadata, bulk_ingest
 
 logger = logging.getLogger(__name__)
 
 STATIC_DIR = "static"
 CARDS_DIR = os.path.join(STATIC_DIR, "images", "cards")
+FONTS_DIR = os.path.join(STATIC_DIR, "fonts")
 
 graph = build_card_gen_graph()
 
+# State fields sent in the node events of a streamed card, when they change
+STREAM_FIELDS = ("card_type", "title", "greeting_text", "foreground_path", "background_path", "merged_image_path",
+                 "dominant_color", "font_color", "font_contrast")
+
+def _template_response(temp: dict, request: Request) -> TemplateResponse:
+    base_url = str(request.base_url).rstrip("/")
+    merged_image_path = temp.get("merged_image_path")
+    return TemplateResponse(
+        background_path=temp.get("background_path"),
+        foreground_path=temp.get("foreground_path"),
+        merged_image_path=merged_image_path,
+        aspect_ratio=temp.get("aspect_ratio"),
+        merge_position=temp.get("merge_position"),
+        merge_margin_ratio=temp.get("merge_margin_ratio"),
+        merge_foreground_ratio=temp.get("merge_foreground_ratio"),
+        merged_image_url=base_url + f"/{merged_image_path.replace(os.sep, '/')}",
+        thumbnail_urls={width: base_url + f"/{path.replace(os.sep, '/')}" for width, path in (temp.get("thumbnails") or {}).items()},
+        placeholder=temp.get("placeholder"),
+        placeholder_color=temp.get("placeholder_color"),
+    )
+
+def _store_upload(file: UploadFile, upload_dir: str, kind: str) -> dict:
+    try:
+        return store_upload(file.file, file.filename, upload_dir, kind)
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnidentifiedImageError:
+        raise HTTPException(status_code=400, detail=f"Unsupported or corrupt image: {file.filename}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OSError as e:
+        # e.g. a truncated image
+        raise HTTPException(status_code=400, detail=f"Corrupt image {file.filename}: {e}")
+
 def get_templates_service(card_type: str, aspect_ratio: float, request: Request, page: int = 1, page_size: int = 10) -> List[TemplateResponse]:
     templates = get_templates_by_type(card_type, aspect_ratio)
     start = (page - 1) * page_size
     end = start + page_size
-    paged_cards = templates[start:end]
-    result = []
-    for temp in paged_cards:
-        merged_image_path = temp.get("merged_image_path")
-        merged_image_url = str(request.base_url).rstrip("/") + f"/{merged_image_path.replace(os.sep, '/')}"
-        result.append(TemplateResponse(
-            background_path=temp.get("background_path"),
-            foreground_path=temp.get("foreground_path"),
-            merged_image_path=merged_image_path,
-            aspect_ratio=temp.get("aspect_ratio"),
-            merge_position=temp.get("merge_position"),
-            merge_margin_ratio=temp.get("merge_margin_ratio"),
-            merge_foreground_ratio=temp.get("merge_foreground_ratio"),
-            merged_image_url=merged_image_url
-        ))
-    return result
+    paged_cards = ensure_thumbnails(templates[start:end])
+    return [_template_response(temp, request) for temp in paged_cards]
 
 def get_random_template_service(card_type: str, aspect_ratio: float, request: Request) -> TemplateResponse:
     template = get_random_template_by_type(card_type, aspect_ratio)
-    merged_image_url = str(request.base_url).rstrip("/") + f"/{template['merged_image_path'].replace(os.sep, '/')}"
-    template['merged_image_url'] = merged_image_url
     if not template:
         raise HTTPException(status_code=404, detail="No template found")
-    return TemplateResponse(**template)
+    return _template_response(ensure_thumbnails([template])[0], request)
 
-def generate_card_service(req: GenerateRequest, request: Request, foreground_file: UploadFile = None) -> GenerateResponse:
+def _card_input(req: GenerateRequest, request: Request, foreground_file: UploadFile = None) -> dict:
     input = {
         "greeting_text_instructions": req.greeting_text_instructions,
         "aspect_ratio": req.aspect_ratio,
+        "output_format": req.output_format.value if req.output_format else negotiate_format(request.headers.get("accept")),
+        "preview": req.preview,
+        "no_cache": req.no_cache,
+        "variety": req.variety,
     }
-    
+
     # Handle foreground file upload if provided
     if foreground_file:
         allowed_ext = (".png", ".jpg", ".jpeg", ".webp")
@@ -60,44 +93,154 @@ def generate_card_service(req: GenerateRequest, request: Request, foreground_fil
             raise HTTPException(status_code=400, detail="Only image files are allowed (png, jpg, jpeg, webp)")
 
         upload_dir = os.path.join("static", "images", "foregrounds", "uploads")
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        file_path = os.path.join(upload_dir, foreground_file.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(foreground_file.file, buffer)
-        
-        input["foreground_path"] = file_path
+        input["foreground_path"] = _store_upload(foreground_file, upload_dir, "foreground")["path"]
     elif req.foreground_path:
         input["foreground_path"] = req.foreground_path
     
     if req.merged_image_path and req.background_path:
         input["merged_image_path"] = req.merged_image_path
         input["background_path"] = req.background_path
+    elif req.background_path and input.get("foreground_path"):
+        # Uploaded foreground with a chosen (e.g. suggested) background
+        input["background_path"] = req.background_path
 
-    try:
-        result = graph.invoke(input)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    if req.recipe:
+        # Replay a previous card, e.g. the full-resolution render of a preview
+        fonts_dir = os.path.abspath(FONTS_DIR)
+        for font_path in (req.recipe.font_path, req.recipe.title_font_path):
+            if os.path.commonpath([os.path.abspath(font_path), fonts_dir]) != fonts_dir or not os.path.isfile(font_path):
+                raise HTTPException(status_code=400, detail=f"Unknown font: {font_path}")
+        input.update(req.recipe.model_dump())
+    return input
+
+def _card_response(result: dict, req: GenerateRequest, request: Request) -> GenerateResponse:
     card_path = result.get("card_path")
     if not card_path:
         raise HTTPException(status_code=500, detail="Card generation failed")
     card_url = str(request.base_url).rstrip("/") + f"/{card_path.replace(os.sep, '/')}"
-    return GenerateResponse(card_url=card_url)
+    try:
+        recipe = CardRecipe(**{field: result.get(field) for field in CardRecipe.model_fields})
+    except ValueError:
+        recipe = None
+    return GenerateResponse(card_url=card_url, preview=req.preview, recipe=recipe)
+
+async def _acard_input(req: GenerateRequest, request: Request, foreground_file: UploadFile = None) -> dict:
+    if foreground_file:
+        # Storing the upload decodes and encodes it
+        return await run_in_threadpool(_card_input, req, request, foreground_file)
+    return _card_input(req, request)
+
+async def generate_card_service(req: GenerateRequest, request: Request, foreground_file: UploadFile = None) -> GenerateResponse:
+    input = await _acard_input(req, request, foreground_file)
+    try:
+        result = await graph.ainvoke(input)
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except RenderQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return _card_response(result, req, request)
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _save_merged_preview(img: Image.Image, card_path: str) -> str:
+    """Save a PREVIEW_HEIGHT WebP of a merged image (before its text) next to the card it becomes."""
+    preview_path = with_format_extension(os.path.splitext(card_path)[0] + "_merged", "webp")
+    if img.height > PREVIEW_HEIGHT:
+        img = img.resize((round(img.width * PREVIEW_HEIGHT / img.height), PREVIEW_HEIGHT), Image.LANCZOS, reducing_gap=2.0)
+    save_image(img, preview_path, "webp")
+    return preview_path
+
+async def generate_card_stream_service(req: GenerateRequest, request: Request, foreground_file: UploadFile = None) -> AsyncIterator[str]:
+    """
+    Generate a card like generate_card_service, as server-sent events:
+    - token: {"field": "title" | "greeting_text", "text"} as the LLM writes them
+    - node: {"node", ...} the fields a graph node set (template, colors, a merged_preview_url of the image before its text)
+    - card: the GenerateResponse, last
+    - error: {"status_code", "detail"} when generation fails
+    Invalid requests are rejected before the stream starts.
+    """
+    input = await _acard_input(req, request, foreground_file)
+    input["stream"] = True
+    base_url = str(request.base_url).rstrip("/")
+
+    async def events() -> AsyncIterator[str]:
+        result, sent = dict(input), {}
+        try:
+            async for mode, chunk in graph.astream(input, stream_mode=["updates", "custom"]):
+                if mode == "custom":
+                    yield _sse("token", chunk)
+                    continue
+                for node, update in chunk.items():
+                    if not update:
+                        continue
+                    result.update(update)
+                    data = {field: update[field] for field in STREAM_FIELDS
+                            if update.get(field) is not None and sent.get(field) != update[field]}
+                    if node in ("merge", "add_text"):
+                        # The path the card is being written to
+                        data.pop("merged_image_path", None)
+                    sent.update(data)
+                    if update.get("merged_image") is not None:
+                        data["merged_preview_path"] = await asyncio.get_running_loop().run_in_executor(
+                            get_image_executor(), _save_merged_preview, update["merged_image"], update["merged_image_path"])
+                    for field in [field for field in data if field.endswith("_path")]:
+                        data[field[:-len("_path")] + "_url"] = base_url + f"/{data[field].replace(os.sep, '/')}"
+                    if data:
+                        yield _sse("node", {"node": node, **data})
+            response = _card_response(result, req, request)
+        except HTTPException as e:
+            yield _sse("error", {"status_code": e.status_code, "detail": e.detail})
+            return
+        except Exception as e:
+            logger.error(f"Error streaming card generation: {e}")
+            status_code = 413 if isinstance(e, ImageTooLargeError) else 503 if isinstance(e, RenderQueueFullError) else 500
+            yield _sse("error", {"status_code": status_code, "detail": str(e)})
+            return
+        yield _sse("card", response.model_dump(mode="json"))
+
+    return events()
 
-def upload_image_service(file: UploadFile, request: Request) -> ImageUploadResponse:
+def upload_image_service(file: UploadFile, request: Request, suggest_backgrounds: int = 0, color_space: str = "hsv") -> ImageUploadResponse:
     allowed_ext = (".png", ".jpg", ".jpeg", ".webp")
     if not file.filename.lower().endswith(allowed_ext):
         raise ValueError("Only image files are allowed (png, jpg, jpeg, webp)")
 
     upload_dir = os.path.join("static", "images", "foregrounds", "uploads")
-    os.makedirs(upload_dir, exist_ok=True)
-    
-    file_path = os.path.join(upload_dir, file.filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    stored = _store_upload(file, upload_dir, "foreground")
+    file_path = stored["path"]
 
     file_url = str(request.base_url).rstrip("/") + f"/{file_path.replace(os.sep, '/')}"
-    return ImageUploadResponse(foreground_url=file_url, foreground_path=file_path)
+    if suggest_backgrounds <= 0:
+        return ImageUploadResponse(
+            foreground_url=file_url,
+            foreground_path=file_path,
+            original_path=stored["original_path"],
+            content_hash=stored["content_hash"],
+            duplicate=stored["duplicate"],
+        )
+
+    foreground_color = get_dominant_color_cached(file_path, quality=50)
+    suggestions = [
+        BackgroundSuggestion(
+            background_url=str(request.base_url).rstrip("/") + f"/{bg['background_path'].replace(os.sep, '/')}",
+            background_path=bg["background_path"],
+            color=bg["color"],
+            distance=bg["distance"],
+        )
+        for bg in get_matching_backgrounds(foreground_color, k=suggest_backgrounds, color_space=color_space)
+    ]
+    return ImageUploadResponse(
+        foreground_url=file_url,
+        foreground_path=file_path,
+        original_path=stored["original_path"],
+        content_hash=stored["content_hash"],
+        duplicate=stored["duplicate"],
+        foreground_color=foreground_color,
+        background_suggestions=suggestions,
+    )
 
 def upload_background_service(file: UploadFile, request: Request) -> BackgroundUploadResponse:
     allowed_ext = (".png", ".jpg", ".jpeg", ".webp")
@@ -105,29 +248,16 @@ def upload_background_service(file: UploadFile, request: Request) -> BackgroundU
         raise ValueError("Only image files are allowed (png, jpg, jpeg, webp)")
 
     upload_dir = os.path.join("static", "images", "backgrounds")
-    os.makedirs(upload_dir, exist_ok=True)
-    
-    file_path = os.path.join(upload_dir, file.filename)
-    
-    if os.path.exists(file_path):
-        file_url = str(request.base_url).rstrip("/") + f"/{file_path.replace(os.sep, '/')}"
-        color = get_dominant_color(file_path)
-        return BackgroundUploadResponse(
-            background_url=file_url, 
-            background_path=file_path,
-            color=color
-        )
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    stored = _store_upload(file, upload_dir, "background")
+    file_path = stored["path"]
 
-    json_path = "static/images/background_metadata.json"
     try:
-        result = add_background_metadata(file_path, json_path)
+        # Returns the stored metadata of a duplicate upload
+        result = add_background_metadata(file_path)
         if result:
             color = result.get("color", "#000000")
         else:
-            color = get_dominant_color(file_path)
+            color = get_dominant_color_cached(file_path)
     except Exception as e:
         color = "#000000"
         logger.error(f"Failed to add background metadata: {e}")
@@ -136,6 +266,9 @@ def upload_background_service(file: UploadFile, request: Request) -> BackgroundU
     return BackgroundUploadResponse(
         background_url=file_url, 
         background_path=file_path,
+        original_path=stored["original_path"],
+        content_hash=stored["content_hash"],
+        duplicate=stored["duplicate"],
         color=color
     )
 
@@ -155,53 +288,25 @@ def upload_template_service(
 
     fg_upload_dir = os.path.join("static", "images", "foregrounds")
     bg_upload_dir = os.path.join("static", "images", "backgrounds")
-    os.makedirs(fg_upload_dir, exist_ok=True)
-    os.makedirs(bg_upload_dir, exist_ok=True)
-    
-    fg_file_path = os.path.join(fg_upload_dir, foreground_file.filename)
-    bg_file_path = os.path.join(bg_upload_dir, background_file.filename)
     
-    if not os.path.exists(fg_file_path):
-        with open(fg_file_path, "wb") as buffer:
-            shutil.copyfileobj(foreground_file.file, buffer)
+    fg_file_path = _store_upload(foreground_file, fg_upload_dir, "foreground")["path"]
+    bg_stored = _store_upload(background_file, bg_upload_dir, "background")
+    bg_file_path = bg_stored["path"]
     
-    if not os.path.exists(bg_file_path):
-        with open(bg_file_path, "wb") as buffer:
-            shutil.copyfileobj(background_file.file, buffer)
-        
-        bg_json_path = "static/images/background_metadata.json"
+    if not bg_stored["duplicate"]:
         try:
-            add_background_metadata(bg_file_path, bg_json_path)
+            add_background_metadata(bg_file_path)
         except Exception as e:
             logger.error(f"Warning: Failed to add background metadata: {e}")
 
-    json_path = "static/images/template_metadata.json"
     try:
         result = add_template_metadata(
             foreground_path=fg_file_path,
             background_path=bg_file_path,
-            json_path=json_path,
             card_type=card_type.value,
             aspect_ratio=aspect_ratio
         )
-        
-        if result:
-            merged_image_path = result.get("merged_image_path")
-        else:
-            fg_path_normalized = Path(fg_file_path).as_posix()
-            bg_path_normalized = Path(bg_file_path).as_posix()
-            
-            with open(json_path, "r", encoding="utf-8") as f:
-                templates = json.load(f)
-            
-            merged_image_path = None
-            for template in templates:
-                if (template.get("foreground_path") == fg_path_normalized and 
-                    template.get("background_path") == bg_path_normalized and
-                    template.get("aspect_ratio") == aspect_ratio and
-                    template.get("card_type") == card_type.value):
-                    merged_image_path = template.get("merged_image_path")
-                    break
+        merged_image_path = result.get("merged_image_path") if result else None
         
         if not merged_image_path:
             raise HTTPException(status_code=500, detail="Failed to find generated template")
@@ -218,4 +323,83 @@ def upload_template_service(
         background_path=bg_file_path,
         card_type=card_type.value,
         aspect_ratio=aspect_ratio
-    )
\ No newline at end of file
+    )
+
+def bulk_upload_service(file: UploadFile, aspect_ratio: float, request: Request) -> BulkIngestResponse:
+    """
+    Ingest a zip archive of backgrounds and templates in one batch.
+
+    The archive may contain `backgrounds/*`, `foregrounds/*` and `templates/<card_type>.txt`
+    files whose lines are '<foreground> <background>'. Names in the pair files are resolved
+    against the archive folders first and are otherwise treated as existing library paths.
+    """
+    allowed_ext = (".png", ".jpg", ".jpeg", ".webp")
+    if not file.filename.lower().endswith(".zip"):
+        raise HTTPException(status_code=400, detail="Only zip archives are allowed")
+
+    target_dirs = {
+        "backgrounds": os.path.join("static", "images", "backgrounds"),
+        "foregrounds": os.path.join("static", "images", "foregrounds"),
+    }
+    for target_dir in target_dirs.values():
+        os.makedirs(target_dir, exist_ok=True)
+
+    extracted = {"backgrounds": {}, "foregrounds": {}}
+    pair_files, failed = {}, []
+    try:
+        with zipfile.ZipFile(file.file) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                parts = info.filename.replace("\\", "/").split("/")
+                folder, name = (parts[-2] if len(parts) > 1 else ""), os.path.basename(parts[-1])
+                if folder in target_dirs and name.lower().endswith(allowed_ext):
+                    try:
+                        with archive.open(info) as src:
+                            stored = store_upload(io.BytesIO(src.read()), name, target_dirs[folder], folder[:-1])
+                    except UnidentifiedImageError:
+                        failed.append({"kind": folder[:-1], "path": info.filename, "error": "Unsupported or corrupt image"})
+                        continue
+                    except (OSError, ValueError) as e:
+                        # e.g. a truncated image, or one above MAX_IMAGE_PIXELS
+                        failed.append({"kind": folder[:-1], "path": info.filename, "error": str(e)})
+                        continue
+                    extracted[folder][name] = stored["path"]
+                elif folder == "templates" and name.endswith(".txt"):
+                    pair_files[name[:-4]] = archive.read(info).decode("utf-8")
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Invalid zip archive")
+
+    valid_types = {card_type.value for card_type in CardType}
+    template_specs = []
+    for card_type, content in pair_files.items():
+        if card_type not in valid_types:
+            failed.append({"kind": "template", "path": f"templates/{card_type}.txt", "error": f"Unknown card type: {card_type}"})
+            continue
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            try:
+                fg_name, bg_name = line.split()
+            except ValueError:
+                failed.append({"kind": "template", "path": f"templates/{card_type}.txt", "error": f"Invalid line: {line}"})
+                continue
+            fg_path = extracted["foregrounds"].get(fg_name, fg_name)
+            bg_path = extracted["backgrounds"].get(bg_name, bg_name)
+            template_specs.append((fg_path, bg_path, card_type))
+
+    report = bulk_ingest(
+        background_paths=list(extracted["backgrounds"].values()),
+        template_specs=template_specs,
+        aspect_ratios=(aspect_ratio,),
+    )
+    report["failed"] = failed + report["failed"]
+    return BulkIngestResponse(**report)
+
+def cache_stats_service() -> CacheStatsResponse:
+    llm_cache = get_llm_cache()
+    return CacheStatsResponse(
+        llm=llm_cache.stats() if llm_cache else None,
+        assets=asset_cache.stats(),
+        composites=composite_cache.stats(),
+    )
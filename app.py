@@ -1,3 +1,4 @@
+import json
 import logging
 import os
 from dotenv import load_dotenv
@@ -31,6 +32,17 @@ def fetch_random_template(card_type: str = "birthday", aspect_ratio: float = 3/4
         st.error(f"Lỗi khi lấy mẫu ngẫu nhiên: {e}")
         return {}
 
+def stream_card(payload: Dict):
+    """Yield (event, data) pairs of the server-sent events of /generate-card/stream."""
+    with requests.post(f"{BACKEND_URL}/generate-card/stream", json=payload, stream=True) as resp:
+        resp.raise_for_status()
+        event = "message"
+        for line in resp.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                yield event, json.loads(line[len("data:"):])
+
 def main():
     st.markdown(
         "<h1 style='text-align: center; color: #3495eb;'> 🌟 Tạo Thiệp Chúc Mừng</h1>", 
@@ -179,7 +191,7 @@ def main():
                         with cols[idx % 2]:
                             if has_templates and idx < len(templates):
                                 template = templates[idx]
-                                img_url = template.get('merged_image_url', f"{BACKEND_URL}/{template['merged_image_path']}")
+                                img_url = (template.get('thumbnail_urls') or {}).get('320') or template.get('merged_image_url', f"{BACKEND_URL}/{template['merged_image_path']}")
                                 st.image(img_url, caption=f"Mẫu {idx+1}", use_container_width=True)
                                 if st.button(f"Chọn mẫu {idx+1}", key=f"select_template_{idx}_{st.session_state.templates_page}", use_container_width=True):
                                     st.session_state.selected_template = template
@@ -211,7 +223,7 @@ def main():
                             st.rerun()
                     if "random_template" in st.session_state:
                         template = st.session_state.random_template
-                        img_url = template.get("merged_image_url", f"{BACKEND_URL}/{template['merged_image_path']}")
+                        img_url = (template.get("thumbnail_urls") or {}).get("640") or template.get("merged_image_url", f"{BACKEND_URL}/{template['merged_image_path']}")
                         col1, col2, col3 = st.columns([1, 2, 1])
                         with col2:
                             st.image(img_url, caption="Mẫu ngẫu nhiên", use_container_width=True)
@@ -304,15 +316,33 @@ def main():
                         
                 logger.info(f"Payload for card generation: {payload}")
                 
-                with st.status("Đang tạo thiệp...", expanded=True):
+                with st.status("Đang tạo thiệp...", expanded=True) as status:
+                    # The greeting and the image before its text are shown as soon as they are ready
+                    title_box, greeting_box, preview_box = st.empty(), st.empty(), st.empty()
+                    streamed = {"title": "", "greeting_text": ""}
                     try:
-                        resp = requests.post(f"{BACKEND_URL}/generate-card", json=payload)
-                        resp.raise_for_status()
-                        result = resp.json()
+                        result = None
+                        for event, data in stream_card(payload):
+                            if event == "token":
+                                streamed[data["field"]] += data["text"]
+                                title_box.markdown(f"**{streamed['title']}**")
+                                greeting_box.markdown(streamed["greeting_text"])
+                            elif event == "node":
+                                if data.get("card_type"):
+                                    status.update(label=f"Đang tạo thiệp {data['card_type']}...")
+                                if data.get("merged_preview_url"):
+                                    preview_box.image(data["merged_preview_url"], width=300)
+                            elif event == "card":
+                                result = data
+                            elif event == "error":
+                                raise RuntimeError(data.get("detail"))
+                        if not result:
+                            raise RuntimeError("Card generation failed")
                         st.session_state.generated_card = result
-                        st.success("✅ Tạo thiệp thành công!")
+                        status.update(label="✅ Tạo thiệp thành công!", state="complete")
                         st.rerun()
                     except Exception as e:
+                        status.update(state="error")
                         st.error(f"Lỗi khi tạo thiệp: {e}")
 
     with right_col:
@@ -347,8 +377,8 @@ def main():
                         st.download_button(
                             "📥 Tải thiệp về máy",
                             data=card_response.content,
-                            file_name="thiep_chuc.png",
-                            mime="image/png",
+                            file_name="thiep_chuc" + os.path.splitext(card_url)[1],
+                            mime=card_response.headers.get("content-type", "image/png"),
                             use_container_width=True
                         )
                     except Exception as e:
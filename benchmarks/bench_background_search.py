@@ -0,0 +1,70 @@
+"""
+Benchmark nearest-background search: per-item Python loop vs the vectorized color index.
+
+Usage:
+    python -m benchmarks.bench_background_search
+"""
+import colorsys
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core_ai.utils.color_index import BackgroundColorIndex
+from core_ai.utils.store import MetadataStore
+from core_ai.utils.tools import color_distance_hsv, hex_to_rgb
+
+
+def loop_search(backgrounds: list, target_color: str) -> dict:
+    target_rgb = hex_to_rgb(target_color)
+    target_hsv = colorsys.rgb_to_hsv(*(c / 255.0 for c in target_rgb))
+    best, best_distance = None, float("inf")
+    for background in backgrounds:
+        bg_hsv = colorsys.rgb_to_hsv(*(c / 255.0 for c in hex_to_rgb(background["color"])))
+        distance = color_distance_hsv(target_hsv, bg_hsv)
+        if distance < best_distance:
+            best, best_distance = background, distance
+    return best
+
+
+def timeit(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e3
+
+
+def main():
+    random.seed(0)
+    targets = [f"#{random.randrange(1 << 24):06x}" for _ in range(20)]
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'backgrounds':>12} {'loop (ms)':>10} {'index hsv (ms)':>15} {'index lab (ms)':>15} {'top-10 (ms)':>12} {'build (ms)':>11}")
+        for size in (10_000, 100_000):
+            backgrounds = [
+                {"background_path": f"static/images/backgrounds/bg_{i}.png", "color": f"#{random.randrange(1 << 24):06x}"}
+                for i in range(size)
+            ]
+            store = MetadataStore(os.path.join(tmp, f"metadata_{size}.db"))
+            store.upsert_backgrounds(backgrounds)
+            index = BackgroundColorIndex(store)
+            start = time.perf_counter()
+            index.refresh()
+            build = (time.perf_counter() - start) * 1e3
+
+            for target in targets:
+                expected = loop_search(backgrounds, target)["background_path"]
+                assert index.nearest(target)[0][0]["background_path"] == expected
+
+            it = iter(targets * 1000)
+            loop = timeit(lambda: loop_search(backgrounds, next(it)), 3)
+            hsv = timeit(lambda: index.nearest(next(it)), 50)
+            lab = timeit(lambda: index.nearest(next(it), color_space="lab"), 50)
+            top = timeit(lambda: index.nearest(next(it), k=10), 50)
+            print(f"{size:>12} {loop:>10.1f} {hsv:>15.2f} {lab:>15.2f} {top:>12.2f} {build:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Microbenchmark of the blending merge with the legacy per-pixel gradient loop
+vs the mask broadcast from a memoized ramp, for 3:4 and 4:3 canvases.
+
+Usage:
+    python -m benchmarks.bench_blend_mask
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageChops
+
+from core_ai.utils import tools
+
+FOREGROUND = "static/images/foregrounds/birthday_4.png"
+BACKGROUND = "static/images/backgrounds/back_23.png"
+
+
+def legacy_blend_mask(size, merge_position, blend_ratio, foreground_ratio, edge_only):
+    """The per-row/column putpixel gradient used before the vectorized mask."""
+    fg_width, fg_height = size
+    if merge_position in ("top", "bottom"):
+        n, horizontal = fg_height, False
+    else:
+        n, horizontal = fg_width, True
+    gradient = Image.new("L", (n, 1) if horizontal else (1, n), color=0x00)
+    blend_len = int(n * blend_ratio)
+    fade_from_start = merge_position in ("bottom", "right")
+    for i in range(n):
+        if edge_only and not fade_from_start:
+            alpha = 255 if i < n - blend_len else int(255 * (n - i) / blend_len)
+        elif edge_only:
+            alpha = int(255 * i / blend_len) if i < blend_len else 255
+        elif fade_from_start:
+            blend_start = int(n * (1 - foreground_ratio))
+            if i < blend_start:
+                alpha = 0
+            elif i < blend_start + blend_len:
+                alpha = int(255 * (i - blend_start) / blend_len)
+            else:
+                alpha = 255
+        else:
+            blend_start = int(n * foreground_ratio)
+            if i > blend_start:
+                alpha = 0
+            elif i > blend_start - blend_len:
+                alpha = int(255 * (blend_start - i) / blend_len)
+            else:
+                alpha = 255
+        gradient.putpixel((i, 0) if horizontal else (0, i), alpha)
+    return gradient.resize((fg_width, fg_height))
+
+
+def check_masks():
+    for position in ("top", "bottom", "left", "right"):
+        for edge_only in (True, False):
+            for size in ((1200, 700), (900, 1600), (1200, 1500), (2133, 1600)):
+                args = (size, position, 0.4, 0.5, edge_only)
+                assert ImageChops.difference(legacy_blend_mask(*args), tools._blend_mask(*args)).getbbox() is None, args
+
+
+def time_merge(output: str, aspect_ratio: float, position: str, repeat: int = 5) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        tools.merge_foreground_background_with_blending(
+            FOREGROUND, BACKGROUND, output,
+            merge_position=position, aspect_ratio=aspect_ratio, foreground_ratio=1/2,
+        )
+    return (time.perf_counter() - start) / repeat * 1e3
+
+
+def time_mask(fn, args, repeat: int = 20) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(*args)
+    return (time.perf_counter() - start) / repeat * 1e3
+
+
+def main():
+    check_masks()
+    vectorized = tools._blend_mask
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, "merged.png")
+        print(f"{'canvas':>7} {'position':>9} {'legacy mask (ms)':>17} {'new mask (ms)':>14} {'legacy merge (ms)':>18} {'new merge (ms)':>15}")
+        for label, aspect_ratio, position, size in (("3:4", 3/4, "top", (1200, 1200)), ("4:3", 4/3, "right", (1600, 1600))):
+            args = (size, position, 0.4, 0.5, False)
+            legacy_mask = time_mask(legacy_blend_mask, args)
+            tools._blend_ramp.cache_clear()
+            new_mask = time_mask(vectorized, args)
+            tools._blend_mask = legacy_blend_mask
+            try:
+                legacy_merge = time_merge(output, aspect_ratio, position)
+            finally:
+                tools._blend_mask = vectorized
+            new_merge = time_merge(output, aspect_ratio, position)
+            print(f"{label:>7} {position:>9} {legacy_mask:>17.2f} {new_mask:>14.2f} {legacy_merge:>18.1f} {new_merge:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
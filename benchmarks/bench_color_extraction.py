@@ -0,0 +1,59 @@
+"""
+Benchmark and accuracy comparison of the numpy and ColorThief color extractors
+on the library backgrounds and foregrounds.
+
+Usage:
+    python -m benchmarks.bench_color_extraction
+"""
+import glob
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from core_ai.utils.color_index import hex_to_rgb_array, rgb_to_lab
+from core_ai.utils.tools import get_dominant_color
+
+IMAGE_GLOBS = ["static/images/backgrounds/*", "static/images/foregrounds/*"]
+
+
+def delta_e(color1: str, color2: str) -> float:
+    lab = rgb_to_lab(hex_to_rgb_array([color1, color2]))
+    return float(((lab[0] - lab[1]) ** 2).sum() ** 0.5)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1e3
+
+
+def main():
+    paths = sorted(p for pattern in IMAGE_GLOBS for p in glob.glob(pattern) if os.path.isfile(p))
+    rows = []
+    print(f"{'image':<40} {'megapixels':>10} {'colorthief (ms)':>16} {'numpy (ms)':>11} {'delta E':>8}")
+    for path in paths:
+        with Image.open(path) as img:
+            megapixels = img.width * img.height / 1e6
+        reference, ct_ms = timed(lambda: get_dominant_color(path, quality=100, extractor="colorthief"))
+        fast, np_ms = timed(lambda: get_dominant_color(path, extractor="numpy"))
+        distance = delta_e(reference, fast)
+        rows.append((ct_ms, np_ms, distance))
+        print(f"{os.path.relpath(path, 'static/images'):<40} {megapixels:>10.2f} {ct_ms:>16.1f} {np_ms:>11.1f} {distance:>8.2f}")
+
+    ct_total = sum(r[0] for r in rows)
+    np_total = sum(r[1] for r in rows)
+    distances = [r[2] for r in rows]
+    print()
+    print(f"images: {len(rows)}  total colorthief: {ct_total:.0f} ms  total numpy: {np_total:.0f} ms  speedup: {ct_total / np_total:.1f}x")
+    print(f"delta E (CIE76) between dominant colors: median {statistics.median(distances):.2f}  "
+          f"mean {statistics.mean(distances):.2f}  max {max(distances):.2f}  "
+          f"<= 10: {sum(d <= 10 for d in distances) / len(distances):.0%}")
+
+
+if __name__ == "__main__":
+    main()
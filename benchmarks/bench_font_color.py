@@ -0,0 +1,77 @@
+"""
+Benchmark the local font color selection on every 3:4 and 4:3 template:
+the time the contrast-based pick adds to a card and the WCAG contrast ratios
+it reaches. With --llm, also time the LLM font color call it replaces
+(needs OPENAI_* / MODEL_NAME).
+
+Usage:
+    python -m benchmarks.bench_font_color [--llm]
+"""
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core_ai.utils import nodes, tools
+from core_ai.utils.contrast import FONT_CONTRAST_TARGET
+from core_ai.utils.state import State
+from core_ai.utils.store import get_metadata_store
+
+TEXT = {
+    "title": "Chúc mừng",
+    "greeting_text": ("Chúc bạn thật nhiều niềm vui, sức khỏe dồi dào, công việc thuận lợi "
+                      "và luôn giữ được nụ cười rạng rỡ trên môi mỗi ngày."),
+    "font_path": "static/fonts/text_fonts/DancingScript-Bold.ttf",
+    "title_font_path": "static/fonts/title_fonts/DancingScript-Bold.ttf",
+}
+
+pick_times = []
+_pick_font_color = tools.pick_font_color
+
+
+def timed_pick(*args, **kwargs):
+    start = time.perf_counter()
+    result = _pick_font_color(*args, **kwargs)
+    pick_times.append((time.perf_counter() - start) * 1e3)
+    return result
+
+
+def llm_font_color_ms(template, card_type):
+    state = State(card_type=card_type, dominant_color=tools.get_dominant_color_cached(template["background_path"]))
+    start = time.perf_counter()
+    nodes.font_color_node(state)
+    return (time.perf_counter() - start) * 1e3
+
+
+def main(with_llm=False):
+    tools.pick_font_color = timed_pick
+    nodes.FONT_COLOR_LLM = with_llm
+    print(f"contrast target {FONT_CONTRAST_TARGET}:1")
+    print(f"{'card':>5} {'templates':>9} {'pick ms':>8} {'min':>6} {'median':>7} {'below target':>13}" + (f" {'LLM ms':>8}" if with_llm else ""))
+    for label, aspect_ratio in (("3:4", 3/4), ("4:3", 4/3)):
+        pick_times.clear()
+        contrasts, llm_times = [], []
+        for template in get_metadata_store().get_templates(aspect_ratio=aspect_ratio):
+            state = State(**TEXT, card_type=template["card_type"], aspect_ratio=aspect_ratio,
+                          foreground_path=template["foreground_path"],
+                          background_path=template["background_path"],
+                          merged_image_path=template["merged_image_path"])
+            state = nodes.add_text_node(nodes.merge_node(state))
+            os.remove(state.card_path)
+            contrasts.append(state.font_contrast)
+            if with_llm:
+                llm_times.append(llm_font_color_ms(template, template["card_type"]))
+        if not contrasts:
+            continue
+        below = sum(c < FONT_CONTRAST_TARGET for c in contrasts)
+        row = (f"{label:>5} {len(contrasts):>9} {statistics.median(pick_times):>8.1f} {min(contrasts):>6.2f} "
+               f"{statistics.median(contrasts):>7.2f} {below:>13}")
+        if with_llm:
+            row += f" {statistics.median(llm_times):>8.0f}"
+        print(row)
+
+
+if __name__ == "__main__":
+    main("--llm" in sys.argv)
@@ -0,0 +1,105 @@
+"""
+Benchmark the card graph wall-clock time against its LLM latency and image
+work: with an uploaded foreground or a given template the image preparation
+(prepare ms) runs alongside the LLM call. Drawing the text and encoding the
+card (after ms, from the end of both to the card) need the greeting, so they
+always follow the LLM, and a card should take about
+max(LLM, prepare) + after instead of LLM + prepare + after. A template
+picked from the LLM's card type has nothing to prepare.
+
+The LLM is stubbed with a fixed delay and replies are not cached. Every run
+uses fresh copies of the images so nothing comes from the decode or
+composite caches. prepare and after are measured with an instant LLM.
+
+Usage:
+    python -m benchmarks.bench_graph_overlap [llm_seconds]
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core_ai.graph import build_card_gen_graph
+from core_ai.utils import nodes
+from core_ai.utils.tools import COMPOSITE_DIR
+
+FOREGROUND = "static/images/foregrounds/birthday_4.png"
+BACKGROUND = "static/images/backgrounds/back_23.png"
+REPLY = json.dumps({
+    "title": "Chúc mừng sinh nhật",
+    "greeting_text": "Chúc bạn tuổi mới thật nhiều niềm vui, sức khỏe dồi dào và thành công trong công việc lẫn cuộc sống nhé!",
+    "card_type": "birthday",
+})
+
+
+class StubLLM:
+    """Answers like the real model after a fixed delay."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def invoke(self, messages):
+        time.sleep(self.delay)
+        return type("Response", (), {"content": REPLY})()
+
+
+def run(graph, inputs, tmp):
+    """
+    Generate one card from fresh copies of its images and return the
+    wall-clock, prepare and after ms.
+    """
+    copies = {}
+    for key, path in inputs.items():
+        copies[key] = os.path.join(tmp, f"{time.perf_counter_ns()}_{os.path.basename(path)}")
+        shutil.copy(path, copies[key])
+    if "background_path" in copies:
+        copies["merged_image_path"] = copies["background_path"]  # any existing path marks a template
+    result, done = {}, {}
+    start = time.perf_counter()
+    for chunk in graph.stream({"greeting_text_instructions": "Chúc mừng sinh nhật bạn thân", "no_cache": True, **copies},
+                              stream_mode="updates"):
+        for node, update in chunk.items():
+            done[node] = time.perf_counter()
+            result.update(update or {})
+    end = time.perf_counter()
+    os.remove(result["card_path"])
+    joined = max(done["llm"], done["prepare_images"])
+    return [(end - start) * 1e3, (done["prepare_images"] - start) * 1e3, (end - joined) * 1e3]
+
+
+def median_ms(graph, inputs, tmp, repeat=3):
+    runs = [run(graph, inputs, tmp) for _ in range(repeat)]
+    return [sorted(values)[repeat // 2] for values in zip(*runs)]
+
+
+def main(llm_seconds=1.0):
+    graph = build_card_gen_graph()
+    composites = set(os.listdir(COMPOSITE_DIR)) if os.path.isdir(COMPOSITE_DIR) else set()
+    print(f"stub LLM latency {llm_seconds * 1e3:.0f} ms")
+    print(f"{'card':>18} {'prepare ms':>11} {'after ms':>9} {'sum ms':>8} {'bound ms':>9} {'wall ms':>8}")
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for label, inputs in (
+                ("uploaded fg", {"foreground_path": FOREGROUND}),
+                ("given template", {"foreground_path": FOREGROUND, "background_path": BACKGROUND}),
+                ("LLM card type", {}),
+            ):
+                nodes._get_model = lambda model=None: StubLLM(0)
+                _, prepare_ms, after_ms = median_ms(graph, inputs, tmp)
+                nodes._get_model = lambda model=None: StubLLM(llm_seconds)
+                wall_ms = median_ms(graph, inputs, tmp)[0]
+                llm_ms = llm_seconds * 1e3
+                print(f"{label:>18} {prepare_ms:>11.0f} {after_ms:>9.0f} {llm_ms + prepare_ms + after_ms:>8.0f} "
+                      f"{max(llm_ms, prepare_ms) + after_ms:>9.0f} {wall_ms:>8.0f}")
+    finally:
+        if os.path.isdir(COMPOSITE_DIR):
+            for name in set(os.listdir(COMPOSITE_DIR)) - composites:
+                os.remove(os.path.join(COMPOSITE_DIR, name))
+
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 1.0)
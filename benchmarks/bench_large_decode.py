@@ -0,0 +1,99 @@
+"""
+Benchmark decoding large uploads into a 1200x1600 card background: the legacy
+full decode + crop + resize vs decode_resized (JPEG draft mode, Image.reduce).
+Each measurement runs in a fresh process to report its own peak RSS.
+
+Usage:
+    python -m benchmarks.bench_large_decode
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+from core_ai.utils.assets import center_crop_box, decode_resized
+
+# (label, width, height, format)
+UPLOADS = (
+    ("2 MP", 1732, 1155, "JPEG"),
+    ("12 MP", 4000, 3000, "JPEG"),
+    ("24 MP", 6000, 4000, "JPEG"),
+    ("48 MP", 8000, 6000, "JPEG"),
+    ("24 MP", 6000, 4000, "PNG"),
+)
+TARGET = (1200, 1600)
+
+
+def make_photo(path, width, height, fmt):
+    """A smooth photo-like image with some grain."""
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    rgb = np.stack([
+        128 + 100 * np.sin(x / width * 6 + y / height * 2),
+        128 + 100 * np.cos(y / height * 5),
+        128 + 100 * np.sin((x + y) / (width + height) * 9),
+    ], axis=-1)
+    rgb += np.random.default_rng(0).normal(0, 8, rgb.shape).astype(np.float32)
+    Image.fromarray(np.clip(rgb, 0, 255).astype(np.uint8)).save(path, fmt, **({"quality": 90} if fmt == "JPEG" else {}))
+
+
+def legacy_decode(path, size):
+    with Image.open(path) as img:
+        bg = img.convert('RGB')
+    return bg.crop(center_crop_box(bg.size, size[0] / size[1])).resize(size, Image.LANCZOS)
+
+
+def fast_decode(path, size):
+    with Image.open(path) as img:
+        box = center_crop_box(img.size, size[0] / size[1])
+    return decode_resized(path, size, 'RGB', box=box)
+
+
+def peak_rss_kb():
+    """Peak resident set size of this process (VmHWM, Linux), unlike ru_maxrss it is not inherited across exec."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    raise RuntimeError("VmHWM not available")
+
+
+def child(method, path):
+    """Decode once in this process and print the peak RSS increase (MB) and time (ms)."""
+    base = peak_rss_kb()
+    start = time.perf_counter()
+    (legacy_decode if method == "legacy" else fast_decode)(path, TARGET)
+    elapsed = (time.perf_counter() - start) * 1e3
+    print(f"{(peak_rss_kb() - base) / 1024:.1f} {elapsed:.1f}")
+
+
+def measure(method, path):
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_large_decode", "--child", method, path],
+        capture_output=True, text=True, check=True,
+    ).stdout.split()
+    return float(output[0]), float(output[1])
+
+
+def main():
+    print(f"target {TARGET[0]}x{TARGET[1]}, peak RSS increase and time of one decode")
+    print(f"{'upload':>12} {'MB on disk':>11} {'legacy MB':>10} {'legacy ms':>10} {'fast MB':>8} {'fast ms':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, width, height, fmt in UPLOADS:
+            path = os.path.join(tmp, f"{width}x{height}.{fmt.lower()}")
+            make_photo(path, width, height, fmt)
+            legacy_mb, legacy_ms = measure("legacy", path)
+            fast_mb, fast_ms = measure("fast", path)
+            print(f"{label + ' ' + fmt:>12} {os.path.getsize(path) / 2**20:>11.1f} {legacy_mb:>10.1f} {legacy_ms:>10.1f} {fast_mb:>8.1f} {fast_ms:>8.1f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        child(sys.argv[2], sys.argv[3])
+    else:
+        main()
@@ -0,0 +1,121 @@
+"""
+Benchmark line breaking: the legacy wrapper, which measures the whole growing
+line for every word, vs wrap_text, which measures each distinct word once per
+font. Wraps Vietnamese greetings (with and without emoji) at every font size a
+fit search may try, and reports font measurement calls, time, line counts and
+the worst overflow of a wrapped line past the width (as Pilmoji lays it out:
+emoji with an image in the glyph store take font.size, others are drawn with
+the font). Emoji missing from the store are measured as font glyphs, so the
+emoji results depend on the store being populated
+(python -m core_ai.utils.emoji_source --all).
+
+Usage:
+    python -m benchmarks.bench_line_wrap
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import ImageFont
+from pilmoji.helpers import EMOJI_REGEX
+
+from core_ai.utils.emoji_source import get_emoji_source
+from core_ai.utils.tools import _word_runs, get_font, wrap_text
+
+FONT = "static/fonts/text_fonts/DancingScript-Bold.ttf"
+MAX_WIDTH = 1104
+SIZES = range(20, 161, 4)
+TEXTS = {
+    "vi 50 words": ("Chúc bạn tuổi mới thật nhiều niềm vui, sức khỏe dồi dào, công việc thuận lợi, "
+                    "gia đình hạnh phúc và luôn giữ được nụ cười rạng rỡ trên môi mỗi ngày. ") * 2,
+    "vi + emoji": ("Chúc mừng sinh nhật 🎂🎉 Chúc bạn luôn vui vẻ 😊, hạnh phúc ❤️ và thành công 🌟 "
+                   "trong mọi việc! Mong mọi điều tốt đẹp nhất sẽ đến với bạn 🎁🥳 ") * 2,
+}
+
+
+def legacy_wrap(text, font, max_width):
+    lines = []
+    for paragraph in text.split('\n'):
+        line = ''
+        for word in paragraph.split(' '):
+            test_line = line + (' ' if line else '') + word
+            bbox = font.getbbox(test_line)
+            if bbox[2] - bbox[0] > max_width and line:
+                lines.append(line)
+                line = word
+            else:
+                line = test_line
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+class CallCounter:
+    """Count FreeTypeFont measurement calls (getbbox and getlength)."""
+
+    def __init__(self):
+        self.calls = 0
+        self._originals = {}
+
+    def __enter__(self):
+        for name in ("getbbox", "getlength"):
+            original = getattr(ImageFont.FreeTypeFont, name)
+            self._originals[name] = original
+
+            def counted(font, *args, _original=original, **kwargs):
+                self.calls += 1
+                return _original(font, *args, **kwargs)
+
+            setattr(ImageFont.FreeTypeFont, name, counted)
+        return self
+
+    def __exit__(self, *exc):
+        for name, original in self._originals.items():
+            setattr(ImageFont.FreeTypeFont, name, original)
+
+
+def rendered_width(line, font):
+    """
+    Width of a line laid out like Pilmoji does: text runs measured whole, emoji
+    as font.size when they have an image and with the font otherwise.
+    """
+    source = get_emoji_source()
+    width = 0
+    for i, chunk in enumerate(EMOJI_REGEX.split(line)):
+        if chunk:
+            width += font.size if i % 2 and source.has_image(chunk) else font.getlength(chunk)
+    return width
+
+
+def run(wrap, text):
+    lines = overflow = 0
+    with CallCounter() as counter:
+        start = time.perf_counter()
+        wrapped = [wrap(text, get_font(FONT, size), MAX_WIDTH) for size in SIZES]
+        elapsed = (time.perf_counter() - start) * 1e3
+    for size, result in zip(SIZES, wrapped):
+        font = get_font(FONT, size)
+        lines += result.count('\n') + 1
+        overflow = max(overflow, max(rendered_width(line, font) for line in result.split('\n')) - MAX_WIDTH)
+    return counter.calls, elapsed, lines, overflow
+
+
+def main():
+    emoji = {chunk for text in TEXTS.values() for chunk in EMOJI_REGEX.findall(text)}
+    print(f"{len(SIZES)} font sizes, max width {MAX_WIDTH}px, "
+          f"{sum(get_emoji_source().has_image(e) for e in emoji)}/{len(emoji)} emoji in the glyph store")
+    print(f"{'text':>12} {'wrapper':>10} {'calls':>7} {'ms':>8} {'lines':>6} {'overflow px':>12}")
+    for label, text in TEXTS.items():
+        for name, wrap in (
+            ("legacy", legacy_wrap),
+            ("wrap_text", wrap_text),
+            ("balanced", lambda t, f, w: wrap_text(t, f, w, balance=True)),
+        ):
+            _word_runs.cache_clear()
+            calls, elapsed, lines, overflow = run(wrap, text)
+            print(f"{label:>12} {name:>10} {calls:>7} {elapsed:>8.1f} {lines:>6} {max(overflow, 0):>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
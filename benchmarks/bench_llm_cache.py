@@ -0,0 +1,68 @@
+"""
+Benchmark the LLM response cache on a skewed workload: a few instructions
+("chúc mừng sinh nhật đồng nghiệp") make up most requests, as from HR teams.
+Reports the hit rate, the lookup overhead and the LLM time saved, for the
+memory and SQLite backends and a few variety settings.
+
+Usage:
+    python -m benchmarks.bench_llm_cache
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from core_ai.utils.llm_cache import LLMCache, cache_key
+from core_ai.utils.prompt import system_prompt, user_prompt_template
+from core_ai.utils.store import MetadataStore
+
+REQUESTS = 5000
+INSTRUCTIONS = 300
+LLM_SECONDS = 1.5  # typical greeting round trip, not slept
+OCCASIONS = ("sinh nhật", "năm mới", "giáng sinh", "trung thu", "tốt nghiệp", "ngày nhà giáo")
+
+
+def workload(seed=0):
+    """Instruction texts with Zipf-like popularity and varying spacing and case."""
+    rng = random.Random(seed)
+    texts = [f"Chúc mừng {OCCASIONS[i % len(OCCASIONS)]} {'đồng nghiệp' if i % 2 else 'sếp'} số {i}" for i in range(INSTRUCTIONS)]
+    weights = [1 / (rank + 1) for rank in range(INSTRUCTIONS)]
+    for text in rng.choices(texts, weights, k=REQUESTS):
+        yield rng.choice((text, text.lower(), f"  {text} "))
+
+
+def run(cache, variety, seed=0):
+    rng = random.Random(seed)
+    calls, lookup = 0, 0.0
+    for text in workload(seed):
+        messages = [SystemMessage(content=system_prompt),
+                    HumanMessage(content=user_prompt_template.format(greeting_text_instructions=' '.join(text.split())))]
+        start = time.perf_counter()
+        key = cache_key(messages, "model", 0.7, rng.randrange(variety) if variety > 1 else 0)
+        hit = cache.get(key) is not None
+        lookup += time.perf_counter() - start
+        if not hit:
+            calls += 1
+            cache.set(key, '{"title": "...", "greeting_text": "...", "card_type": "birthday"}')
+    return calls, lookup / REQUESTS * 1e6
+
+
+def main():
+    print(f"{REQUESTS} requests over {INSTRUCTIONS} instructions (Zipf), LLM call {LLM_SECONDS}s")
+    print(f"{'backend':>8} {'variety':>8} {'LLM calls':>10} {'hit rate':>9} {'lookup us':>10} {'LLM s saved':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in ("memory", "sqlite"):
+            for variety in (1, 3, 10):
+                store = MetadataStore(os.path.join(tmp, f"{backend}_{variety}.db")) if backend == "sqlite" else None
+                calls, lookup_us = run(LLMCache(store=store), variety)
+                print(f"{backend:>8} {variety:>8} {calls:>10} {1 - calls / REQUESTS:>9.1%} {lookup_us:>10.0f} "
+                      f"{(REQUESTS - calls) * LLM_SECONDS:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark card encoding: encode time and byte size of a rendered 3:4 and 4:3
+card (template composite + greeting text) per output format and setting.
+
+Usage:
+    python -m benchmarks.bench_output_formats
+"""
+import io
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core_ai.utils.encoding import save_image
+from core_ai.utils.tools import draw_text_on_image, render_foreground_background
+
+FOREGROUND = "static/images/foregrounds/birthday_4.png"
+BACKGROUND = "static/images/backgrounds/back_23.png"
+FONT = "static/fonts/text_fonts/DancingScript-Bold.ttf"
+TITLE_FONT = "static/fonts/title_fonts/DancingScript-Bold.ttf"
+TEXT = ("Chúc bạn tuổi mới thật nhiều niềm vui, sức khỏe dồi dào, công việc thuận lợi, "
+        "gia đình hạnh phúc và luôn giữ được nụ cười rạng rỡ trên môi mỗi ngày.")
+
+SETTINGS = (
+    ("png (Pillow default)", "png", {"compress_level": 6}),
+    ("png compress_level=1", "png", {"compress_level": 1}),
+    ("png compress_level=9", "png", {"compress_level": 9}),
+    ("webp q=85 method=4", "webp", {}),
+    ("webp q=85 method=0", "webp", {"method": 0}),
+    ("webp lossless", "webp", {"lossless": True, "method": 0}),
+    ("jpeg q=88 progressive", "jpeg", {}),
+)
+
+
+def render_card(aspect_ratio, merge_position, text_position):
+    img, _ = render_foreground_background(
+        foreground_path=FOREGROUND,
+        background_path=BACKGROUND,
+        merge_position=merge_position,
+        margin_ratio=0.02,
+        aspect_ratio=aspect_ratio,
+    )
+    draw_text_on_image(img, TEXT, font_path=FONT, font_size=80, title="Chúc mừng sinh nhật",
+                       title_font_path=TITLE_FONT, text_position=text_position)
+    return img
+
+
+def main(repeat=3):
+    print(f"{'card':>5} {'format':>22} {'encode ms':>10} {'KB':>8}")
+    for label, aspect_ratio, merge_position, text_position in (
+        ("3:4", 3/4, "top", "bottom"),
+        ("4:3", 4/3, "right", "left"),
+    ):
+        img = render_card(aspect_ratio, merge_position, text_position)
+        for name, output_format, options in SETTINGS:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                buffer = io.BytesIO()
+                save_image(img, buffer, output_format, **options)
+            elapsed = (time.perf_counter() - start) / repeat * 1e3
+            print(f"{label:>5} {name:>22} {elapsed:>10.1f} {buffer.tell() / 1024:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
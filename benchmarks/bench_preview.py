@@ -0,0 +1,57 @@
+"""
+Benchmark preview vs full-resolution rendering of the same card recipe
+(merge + text + encode, the graph nodes after text and color generation),
+for a template composite and an uploaded (blended) foreground at 3:4 and 4:3.
+
+Usage:
+    python -m benchmarks.bench_preview
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core_ai.utils.nodes import add_text_node, merge_node
+from core_ai.utils.state import State
+from core_ai.utils.tools import PREVIEW_HEIGHT, STANDARD_HEIGHT
+
+RECIPE = {
+    "title": "Chúc mừng sinh nhật",
+    "greeting_text": ("Chúc bạn tuổi mới thật nhiều niềm vui, sức khỏe dồi dào, công việc thuận lợi, "
+                      "gia đình hạnh phúc và luôn giữ được nụ cười rạng rỡ trên môi mỗi ngày."),
+    "font_color": "#8a3b12",
+    "font_path": "static/fonts/text_fonts/DancingScript-Bold.ttf",
+    "title_font_path": "static/fonts/title_fonts/DancingScript-Bold.ttf",
+    "foreground_path": "static/images/foregrounds/birthday_4.png",
+    "background_path": "static/images/backgrounds/back_23.png",
+    "card_type": "birthday",
+}
+
+
+def render(preview, **fields):
+    state = add_text_node(merge_node(State(**RECIPE, **fields, preview=preview)))
+    os.remove(state.card_path)
+
+
+def timed(fn, repeat=5):
+    fn()  # warm the asset, composite and font caches
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e3
+
+
+def main():
+    print(f"preview height {PREVIEW_HEIGHT}px, full height {STANDARD_HEIGHT}px")
+    print(f"{'merge':>9} {'card':>5} {'full ms':>9} {'preview ms':>11} {'speedup':>8}")
+    for merge_mode in ("template", "blend"):
+        for label, aspect_ratio in (("3:4", 3/4), ("4:3", 4/3)):
+            fields = {"merge_mode": merge_mode, "aspect_ratio": aspect_ratio}
+            full_ms = timed(lambda: render(False, **fields))
+            preview_ms = timed(lambda: render(True, **fields))
+            print(f"{merge_mode:>9} {label:>5} {full_ms:>9.1f} {preview_ms:>11.1f} {full_ms / preview_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmark card rendering throughput (merge, text and encoding) in the
+request process against the render pool with a growing number of worker
+processes. Rendering is CPU-bound, so throughput should grow about
+linearly with the workers up to the number of cores.
+
+The cards are the templates the workers are warmed with, as template
+composites and as blends of their foreground onto their background, with
+the output written to a temporary directory. Pool start and warm-up are
+not timed.
+
+Usage:
+    python -m benchmarks.bench_render_pool [cards] [max_workers]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core_ai.utils import nodes
+from core_ai.utils.render import RenderPool, render_card
+
+
+def card_recipes(count, output_dir):
+    warm = nodes._warm_recipes()
+    variants = warm + [recipe.model_copy(update={"merge_mode": "blend"}) for recipe in warm]
+    return [variants[i % len(variants)].model_copy(update={"output_path": os.path.join(output_dir, f"card_{i}.webp"),
+                                                           "output_format": "webp"})
+            for i in range(count)]
+
+
+def main(cards=96, max_workers=None):
+    max_workers = max_workers or max(os.cpu_count() or 1, 2)
+    counts = sorted({1, max_workers} | {2 ** i for i in range(1, max_workers.bit_length()) if 2 ** i <= max_workers})
+    print(f"{cards} cards, {os.cpu_count()} CPUs")
+    print(f"{'workers':>8} {'cards/s':>8} {'speedup':>8} {'efficiency':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        recipes = card_recipes(cards, tmp)
+        for recipe in recipes[:len(recipes) // 4]:
+            render_card(recipe)
+        start = time.perf_counter()
+        for recipe in recipes:
+            render_card(recipe)
+        inline = cards / (time.perf_counter() - start)
+        print(f"{'inline':>8} {inline:>8.1f}")
+
+        base = None
+        for workers in counts:
+            pool = RenderPool(workers, queue_depth=cards, warm_recipes=nodes._warm_recipes())
+            pool.start()
+            try:
+                start = time.perf_counter()
+                for future in [pool.submit(recipe) for recipe in recipes]:
+                    future.result()
+                throughput = cards / (time.perf_counter() - start)
+            finally:
+                pool.shutdown()
+            base = base or throughput
+            print(f"{workers:>8} {throughput:>8.1f} {throughput / base:>7.2f}x {throughput / base / workers:>10.0%}")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,89 @@
+"""
+Benchmark how soon a user sees something of a card: the blocking graph call
+shows nothing until the card is encoded, the streamed one (as used by
+/generate-card/stream) yields the first greeting token after the LLM's time
+to first token, and the rest of the greeting as it is generated.
+
+The LLM is stubbed with a time to first token and a per-token delay; replies
+are not cached.
+
+Usage:
+    python -m benchmarks.bench_stream_latency [first_token_seconds] [token_seconds]
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core_ai.graph import build_card_gen_graph
+from core_ai.utils import nodes
+
+REPLY = json.dumps({
+    "title": "Chúc mừng sinh nhật",
+    "greeting_text": "Chúc bạn tuổi mới thật nhiều niềm vui, sức khỏe dồi dào và thành công trong công việc lẫn cuộc sống nhé!",
+    "card_type": "birthday",
+}, ensure_ascii=False)
+CHUNK_CHARS = 4
+
+
+class StubLLM:
+    """Answers like the real model, chunk by chunk after a first token delay."""
+
+    def __init__(self, first_token: float, per_token: float):
+        self.first_token = first_token
+        self.per_token = per_token
+
+    def stream(self, messages):
+        time.sleep(self.first_token)
+        for i in range(0, len(REPLY), CHUNK_CHARS):
+            if i:
+                time.sleep(self.per_token)
+            yield type("Chunk", (), {"content": REPLY[i:i + CHUNK_CHARS]})()
+
+    def invoke(self, messages):
+        return type("Response", (), {"content": "".join(chunk.content for chunk in self.stream(messages))})()
+
+
+def run(graph, inputs, stream):
+    """Return the ms to the first token, the full greeting and the card, removing the card."""
+    start = time.perf_counter()
+    first_token = greeting = None
+    if not stream:
+        result = graph.invoke({**inputs, "no_cache": True})
+    else:
+        result = {}
+        for mode, chunk in graph.stream({**inputs, "no_cache": True, "stream": True}, stream_mode=["custom", "updates"]):
+            if mode == "custom":
+                first_token = first_token or time.perf_counter()
+            else:
+                for node, update in chunk.items():
+                    if node == "llm":
+                        greeting = time.perf_counter()
+                    result.update(update or {})
+    card = time.perf_counter()
+    os.remove(result["card_path"])
+    # A blocking call shows everything with the card
+    first_token, greeting = first_token or card, greeting or card
+    return [(t - start) * 1e3 for t in (first_token, greeting, card)]
+
+
+def main(first_token=0.5, per_token=0.03):
+    graph = build_card_gen_graph()
+    nodes._get_model = lambda model=None: StubLLM(first_token, per_token)
+    print(f"stub LLM: first token {first_token * 1e3:.0f} ms, {per_token * 1e3:.0f} ms per {CHUNK_CHARS} chars")
+    print(f"{'card':>14} {'mode':>9} {'first token ms':>15} {'greeting ms':>12} {'card ms':>8}")
+    for label, inputs in (
+        ("LLM card type", {"greeting_text_instructions": "Chúc mừng sinh nhật bạn thân"}),
+        ("uploaded fg", {"greeting_text_instructions": "Chúc mừng sinh nhật bạn thân",
+                         "foreground_path": "static/images/foregrounds/birthday_4.png"}),
+    ):
+        for stream in (False, True):
+            runs = sorted(run(graph, inputs, stream) for _ in range(3))
+            first_ms, greeting_ms, card_ms = runs[1]
+            print(f"{label:>14} {'stream' if stream else 'blocking':>9} {first_ms:>15.0f} {greeting_ms:>12.0f} {card_ms:>8.0f}")
+
+
+if __name__ == "__main__":
+    main(*(float(arg) for arg in sys.argv[1:3]))
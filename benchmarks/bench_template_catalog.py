@@ -0,0 +1,71 @@
+"""
+Benchmark template listing and random picks against synthetic catalogs.
+
+Usage:
+    python -m benchmarks.bench_template_catalog
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core_ai.utils.catalog import TemplateCatalog
+from core_ai.utils.store import MetadataStore
+
+CARD_TYPES = ["birthday", "christmas", "graduation", "newyear", "lunar_newyear", "valentine", "general"]
+
+
+def make_templates(size: int) -> list:
+    data = []
+    for i in range(size):
+        card_type = CARD_TYPES[i % len(CARD_TYPES)]
+        data.append({
+            "foreground_path": f"static/images/foregrounds/fg_{i}.png",
+            "background_path": f"static/images/backgrounds/bg_{i % 500}.png",
+            "merged_image_path": f"static/images/card_types/{card_type}/{uuid.uuid4()}.png",
+            "aspect_ratio": 0.75 if i % 2 == 0 else 4/3,
+            "merge_position": "top",
+            "merge_margin_ratio": 0.05,
+            "merge_foreground_ratio": 0.5,
+            "card_type": card_type,
+        })
+    return data
+
+
+def naive_list(path: str, card_type: str, aspect_ratio: float) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return [item for item in data if item.get("card_type") == card_type and item.get("aspect_ratio") == aspect_ratio]
+
+
+def timeit(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'templates':>10} {'naive list (us)':>16} {'catalog list (us)':>18} {'catalog random (us)':>20}")
+        for size in (1_000, 10_000, 100_000):
+            data = make_templates(size)
+            path = os.path.join(tmp, f"templates_{size}.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            store = MetadataStore(os.path.join(tmp, f"metadata_{size}.db"))
+            store.upsert_templates(data)
+            catalog = TemplateCatalog(store)
+            catalog.refresh()
+            naive = timeit(lambda: naive_list(path, "birthday", 0.75), 5)
+            listed = timeit(lambda: catalog.get("birthday", 0.75)[:10], 10_000)
+            picked = timeit(lambda: catalog.random("birthday", 0.75), 10_000)
+            print(f"{size:>10} {naive:>16.1f} {listed:>18.2f} {picked:>20.2f}")
+
+
+if __name__ == "__main__":
+    main()
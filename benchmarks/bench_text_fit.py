@@ -0,0 +1,96 @@
+"""
+Benchmark body font fitting: the legacy 2pt step-down loop vs binary search
+with the font cache, on 20-, 50- and 100-word greetings at both aspect ratios.
+
+Usage:
+    python -m benchmarks.bench_text_fit
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw, ImageFont
+
+from core_ai.utils.tools import fit_text, get_font
+
+FONT = "static/fonts/text_fonts/DancingScript-Bold.ttf"
+TITLE_FONT = "static/fonts/title_fonts/DancingScript-Bold.ttf"
+WORDS = ("Chúc bạn tuổi mới thật nhiều niềm vui, sức khỏe dồi dào, công việc thuận lợi, "
+         "gia đình hạnh phúc và luôn giữ được nụ cười rạng rỡ trên môi mỗi ngày. ").split()
+
+# (label, canvas size, text area ratio, start font size, title font size) as set by merge_node
+LAYOUTS = (
+    ("3:4", (1200, 1600), 1 - 1/3 + 0.05, 80, 100),
+    ("4:3", (2133, 1600), 1 - 1/3 - 0.02, 100, 150),
+)
+
+
+def greeting(n_words: int) -> str:
+    return " ".join(WORDS[i % len(WORDS)] for i in range(n_words))
+
+
+def legacy_wrap(text, font, max_width):
+    lines = []
+    for paragraph in text.split('\n'):
+        line = ''
+        for word in paragraph.split(' '):
+            test_line = line + (' ' if line else '') + word
+            bbox = font.getbbox(test_line)
+            if bbox[2] - bbox[0] > max_width and line:
+                lines.append(line)
+                line = word
+            else:
+                line = test_line
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def legacy_fit(draw, text, font_path, max_width, max_height, size):
+    passes = 0
+    font = ImageFont.truetype(font_path, size)
+    while True:
+        passes += 1
+        wrapped = legacy_wrap(text, font, max_width)
+        bbox = draw.multiline_textbbox((0, 0), wrapped, font=font)
+        if (bbox[2] - bbox[0] <= max_width and bbox[3] - bbox[1] <= max_height) or size <= 10:
+            return size, passes
+        size -= 2
+        font = ImageFont.truetype(font_path, size)
+
+
+def timed(fn, repeat=5):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - start) / repeat * 1e3
+
+
+def main():
+    print(f"{'canvas':>6} {'start':>6} {'words':>6} {'legacy size':>12} {'passes':>7} {'ms':>8} {'new size':>9} {'passes':>7} {'ms (cold)':>10} {'ms (warm)':>10}")
+    for label, (width, height), text_ratio, start_size, title_size in LAYOUTS:
+        img = Image.new("RGB", (width, height))
+        draw = ImageDraw.Draw(img)
+        margin = int(min(width, height) * 0.06)
+        if width > height:
+            area_w, area_h = int(width * text_ratio) - margin, height - 2 * margin
+        else:
+            area_w, area_h = width - 2 * margin, int(height * text_ratio) - margin
+        title_font = ImageFont.truetype(TITLE_FONT, title_size)
+        title_bbox = draw.multiline_textbbox((0, 0), "Chúc mừng sinh nhật", font=title_font)
+        max_h = area_h - (title_bbox[3] - title_bbox[1])
+        # merge_node's font size, and add_text_to_image's default (a third of the text area)
+        for start in (start_size, area_h // 3):
+            for n_words in (20, 50, 100):
+                text = greeting(n_words)
+                (legacy_size, legacy_passes), legacy_ms = timed(lambda: legacy_fit(draw, text, FONT, area_w, max_h, start))
+                get_font.cache_clear()
+                fit, cold_ms = timed(lambda: fit_text(draw, text, FONT, area_w, max_h, start), repeat=1)
+                fit, warm_ms = timed(lambda: fit_text(draw, text, FONT, area_w, max_h, start))
+                print(f"{label:>6} {start:>6} {n_words:>6} {legacy_size:>12} {legacy_passes:>7} {legacy_ms:>8.1f} "
+                      f"{fit['font_size']:>9} {fit['layout_passes']:>7} {cold_ms:>10.1f} {warm_ms:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark normalizing uploads at ingest: the one-time cost, and the per-use
+cost of a raw vs normalized upload in a merge (decode + resize) and a color
+extraction, for a padded transparent foreground and large photo backgrounds.
+
+Usage:
+    python -m benchmarks.bench_upload_normalize
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+from core_ai.utils.assets import asset_cache
+from core_ai.utils.tools import get_dominant_color, render_foreground_background
+from core_ai.utils.uploads import normalize_image
+
+FOREGROUND = "static/images/foregrounds/birthday_4.png"
+BACKGROUND = "static/images/backgrounds/back_23.png"
+
+
+def make_padded_foreground(path, size=4000):
+    """A large foreground with wide fully transparent borders, as exported by design tools."""
+    canvas = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+    with Image.open(FOREGROUND) as fg:
+        fg = fg.convert("RGBA").resize((size // 2, size // 2 * fg.height // fg.width), Image.LANCZOS)
+    canvas.paste(fg, (size // 4, size // 4))
+    canvas.save(path, "PNG")
+
+
+def make_photo(path, width, height, fmt):
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    rgb = np.stack([
+        128 + 100 * np.sin(x / width * 6 + y / height * 2),
+        128 + 100 * np.cos(y / height * 5),
+        128 + 100 * np.sin((x + y) / (width + height) * 9),
+    ], axis=-1)
+    rgb += np.random.default_rng(0).normal(0, 8, rgb.shape).astype(np.float32)
+    Image.fromarray(np.clip(rgb, 0, 255).astype(np.uint8)).save(path, fmt, **({"quality": 90} if fmt == "JPEG" else {}))
+
+
+def timed(fn, repeat=3):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        asset_cache.clear()  # every use decodes, as in a fresh worker
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e3
+
+
+def report(label, kind, raw_path, tmp):
+    start = time.perf_counter()
+    normalized = normalize_image(raw_path, os.path.join(tmp, "normalized", os.path.basename(raw_path)), kind)
+    ingest_ms = (time.perf_counter() - start) * 1e3
+
+    def merge(path):
+        fg, bg = (path, BACKGROUND) if kind == "foreground" else (FOREGROUND, path)
+        for aspect_ratio in (3/4, 4/3):
+            render_foreground_background(fg, bg, aspect_ratio=aspect_ratio, logo_path=None)
+
+    row = [label, os.path.getsize(raw_path) / 2**20, os.path.getsize(normalized["path"]) / 2**20, ingest_ms]
+    for path in (raw_path, normalized["path"]):
+        row.append(timed(lambda: merge(path)))
+    for path in (raw_path, normalized["path"]):
+        row.append(timed(lambda: get_dominant_color(path)))
+    print("{:>18} {:>7.1f} {:>8.2f} {:>9.0f} {:>10.0f} {:>10.0f} {:>10.0f} {:>10.0f}".format(*row))
+
+
+def main():
+    print("sizes in MB, times in ms; merge renders a 3:4 and a 4:3 card")
+    print(f"{'upload':>18} {'raw MB':>7} {'norm MB':>8} {'ingest ms':>9} {'merge raw':>10} {'merge norm':>10} {'color raw':>10} {'color norm':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "padded.png")
+        make_padded_foreground(path)
+        report("fg 16 MP PNG", "foreground", path, tmp)
+        for label, width, height, fmt in (("bg 24 MP JPEG", 6000, 4000, "JPEG"), ("bg 12 MP PNG", 4000, 3000, "PNG")):
+            path = os.path.join(tmp, f"{width}x{height}.{fmt.lower()}")
+            make_photo(path, width, height, fmt)
+            report(label, "background", path, tmp)
+
+
+if __name__ == "__main__":
+    main()
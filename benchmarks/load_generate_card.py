@@ -0,0 +1,113 @@
+"""
+Load test /generate-card with a stubbed LLM: many concurrent LLM-bound
+requests against one worker. The async endpoint (graph.ainvoke, image work
+in the image executor) keeps every request's LLM call in flight at once,
+the blocking one (a sync endpoint calling graph.invoke, as before) holds
+one of Starlette's threadpool threads per request and so queues past its
+40 threads.
+
+Cards are rendered as previews with cached greetings turned off, so the
+LLM wait dominates; the requests go through the ASGI app in process.
+
+Usage:
+    python -m benchmarks.load_generate_card [concurrency] [llm_seconds]
+"""
+import asyncio
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import Request
+
+from api.main import app
+from api.models import GenerateRequest
+from api.services import graph
+from core_ai.utils import nodes
+
+REPLY = json.dumps({
+    "title": "Chúc mừng sinh nhật",
+    "greeting_text": "Chúc bạn tuổi mới thật nhiều niềm vui, sức khỏe dồi dào và thành công!",
+    "card_type": "birthday",
+}, ensure_ascii=False)
+BODY = {"greeting_text_instructions": "Chúc mừng sinh nhật bạn thân", "preview": True, "no_cache": True,
+        "output_format": "jpeg"}
+
+
+class StubLLM:
+    """Answers like the real model after a fixed delay, counting the calls in flight."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.in_flight = self.peak = 0
+        self._lock = threading.Lock()
+
+    def _enter(self):
+        with self._lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+
+    def _exit(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def invoke(self, messages):
+        self._enter()
+        time.sleep(self.delay)
+        self._exit()
+        return type("Response", (), {"content": REPLY})()
+
+    async def ainvoke(self, messages):
+        self._enter()
+        await asyncio.sleep(self.delay)
+        self._exit()
+        return type("Response", (), {"content": REPLY})()
+
+
+@app.post("/bench/generate-card-blocking", include_in_schema=False)
+def generate_card_blocking(req: GenerateRequest, request: Request):
+    """The card endpoint before the async path: a sync endpoint calling graph.invoke."""
+    result = graph.invoke({"greeting_text_instructions": req.greeting_text_instructions, "preview": req.preview,
+                           "no_cache": req.no_cache, "output_format": req.output_format.value})
+    return {"card_path": result["card_path"]}
+
+
+async def load(path, concurrency):
+    """Send concurrency requests at once; return the wall-clock seconds and the latencies."""
+    async def one(client):
+        start = time.perf_counter()
+        resp = await client.post(path, json=BODY)
+        resp.raise_for_status()
+        return time.perf_counter() - start
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(one(client) for _ in range(concurrency)))
+        return time.perf_counter() - start, sorted(latencies)
+
+
+def main(concurrency=200, llm_seconds=2.0):
+    cards = set(os.listdir("static/images/cards"))
+    print(f"{concurrency} concurrent requests, stub LLM latency {llm_seconds * 1e3:.0f} ms, "
+          f"{nodes.IMAGE_WORKERS} image workers")
+    print(f"{'endpoint':>9} {'wall s':>7} {'cards/s':>8} {'p50 s':>6} {'p95 s':>6} {'peak LLM calls':>15}")
+    try:
+        for label, path in (("blocking", "/bench/generate-card-blocking"), ("async", "/generate-card")):
+            llm = StubLLM(llm_seconds)
+            nodes._get_model = lambda model=None: llm
+            wall, latencies = asyncio.run(load(path, concurrency))
+            print(f"{label:>9} {wall:>7.1f} {concurrency / wall:>8.1f} {statistics.median(latencies):>6.1f} "
+                  f"{latencies[int(len(latencies) * 0.95) - 1]:>6.1f} {llm.peak:>15}")
+    finally:
+        for name in set(os.listdir("static/images/cards")) - cards:
+            os.remove(os.path.join("static/images/cards", name))
+
+
+if __name__ == "__main__":
+    main(*(type_(arg) for type_, arg in zip((int, float), sys.argv[1:3])))
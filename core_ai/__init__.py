@@ -1,4 +1,11 @@
 import logging
+import os
+
+from dotenv import load_dotenv
+
+# Settings are read from the environment when their modules are imported,
+# so the .env of the project root is loaded before any of them
+load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env"))
 
 console_handler = logging.StreamHandler()
 file_handler = logging.FileHandler('app.log')
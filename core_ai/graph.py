@@ -1,34 +1,51 @@
 from core_ai.utils.nodes import (
     llm_node,
+    allm_node,
     dominant_color_node,
     merge_node,
     add_text_node,
+    aadd_text_node,
     random_template_node,
     font_color_node, 
-    upload_image_node,
-    route_random_template
+    afont_color_node,
+    prepare_images_node,
+    route_random_template,
+    route_input,
+    in_image_executor,
 )
 
 from core_ai.utils.state import State
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph
 from langgraph.graph.state import CompiledStateGraph
 
+def _node(func, afunc=None) -> RunnableLambda:
+    """
+    A node running func with graph.invoke and afunc with graph.ainvoke.
+    Without afunc, ainvoke runs func in the image executor: LangGraph would
+    otherwise run a sync node on the event loop.
+    """
+    return RunnableLambda(func, afunc=afunc or in_image_executor(func), name=func.__name__)
+
 def build_card_gen_graph() -> CompiledStateGraph:
+    """Build the card graph, for both graph.invoke / stream and graph.ainvoke / astream."""
     graph_builder = StateGraph(State)
 
     graph_builder.add_node("input", lambda state: state)
-    graph_builder.add_node("upload_image", upload_image_node)
-    graph_builder.add_node("dominant_color", dominant_color_node)
-    graph_builder.add_node("llm", llm_node)
-    graph_builder.add_node("random_template", random_template_node)
-    graph_builder.add_node("font_color", font_color_node)
-    graph_builder.add_node("merge", merge_node)
-    graph_builder.add_node("add_text", add_text_node)
+    graph_builder.add_node("prepare_images", _node(prepare_images_node))
+    graph_builder.add_node("dominant_color", _node(dominant_color_node))
+    graph_builder.add_node("llm", _node(llm_node, allm_node))
+    graph_builder.add_node("join", lambda state: {})
+    graph_builder.add_node("random_template", _node(random_template_node))
+    graph_builder.add_node("font_color", _node(font_color_node, afont_color_node))
+    graph_builder.add_node("merge", _node(merge_node))
+    graph_builder.add_node("add_text", _node(add_text_node, aadd_text_node))
 
-    graph_builder.add_edge("input", "llm")
-    graph_builder.add_conditional_edges("llm", route_random_template, {"dominant_color":"dominant_color", "random_template":"random_template", "upload_image":"upload_image"})
+    # The LLM call and the image work that does not need its output run in parallel
+    graph_builder.add_conditional_edges("input", route_input, ["llm", "prepare_images", "merge"])
+    graph_builder.add_edge(["llm", "prepare_images"], "join")
+    graph_builder.add_conditional_edges("join", route_random_template, {"font_color": "font_color", "random_template": "random_template"})
     graph_builder.add_edge("random_template", "dominant_color")
-    graph_builder.add_edge("upload_image", "font_color")
     graph_builder.add_edge("dominant_color", "font_color")
     graph_builder.add_edge("font_color", "merge")
     graph_builder.add_edge("merge", "add_text")
@@ -37,4 +54,4 @@ def build_card_gen_graph() -> CompiledStateGraph:
     graph_builder.set_entry_point("input")
 
     graph = graph_builder.compile()
-    return graph
\ No newline at end of file
+    return graph
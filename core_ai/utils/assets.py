@@ -0,0 +1,198 @@
+import logging
+import math
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+ASSET_CACHE_MB = int(os.getenv("ASSET_CACHE_MB", "256"))
+COMPOSITE_CACHE_MB = int(os.getenv("COMPOSITE_CACHE_MB", "128"))
+# Decompression bomb guard: images above this many pixels are refused.
+# Pillow's own check (warns above it, raises above twice it) covers libraries such as ColorThief.
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", "50000000"))
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+# Shrink by whole factors with Image.reduce until within this factor of the
+# target size before the final LANCZOS pass
+REDUCING_GAP = 3.0
+
+
+class ImageTooLargeError(ValueError):
+    """Raised when an image exceeds MAX_IMAGE_PIXELS."""
+
+
+def _image_bytes(img: Image.Image) -> int:
+    return img.width * img.height * len(img.getbands())
+
+
+class ImageCache:
+    """
+    Thread-safe, byte-size-bounded LRU of decoded images.
+
+    Images are returned as copies so callers may draw on or paste into them
+    without corrupting the cached version. Concurrent misses of a key load it
+    once: the other callers wait for that load (counted as coalesced).
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[Hashable, Image.Image]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._loading: Dict[Hashable, Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, loader: Callable[[], Image.Image]) -> Image.Image:
+        with self._lock:
+            img = self._items.get(key)
+            if img is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return img.copy()
+            loading = self._loading.get(key)
+            if loading is None:
+                self.misses += 1
+                loading = self._loading[key] = Future()
+                owner = True
+            else:
+                self.coalesced += 1
+                owner = False
+
+        if not owner:
+            # Raises the loader's error as well
+            return loading.result().copy()
+
+        try:
+            img = loader()
+        except BaseException as e:
+            with self._lock:
+                del self._loading[key]
+            loading.set_exception(e)
+            raise
+        size = _image_bytes(img)
+        with self._lock:
+            del self._loading[key]
+            if size <= self.max_bytes and key not in self._items:
+                self._items[key] = img
+                self._bytes += size
+                while self._bytes > self.max_bytes:
+                    _, evicted = self._items.popitem(last=False)
+                    self._bytes -= _image_bytes(evicted)
+                    self.evictions += 1
+        loading.set_result(img)
+        return img.copy()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "items": len(self._items),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+            }
+
+
+asset_cache = ImageCache(ASSET_CACHE_MB * 1024 * 1024)
+composite_cache = ImageCache(COMPOSITE_CACHE_MB * 1024 * 1024)
+
+
+def get_mtime(path: str) -> int:
+    return os.stat(path).st_mtime_ns
+
+
+@lru_cache(maxsize=1024)
+def _image_size(path: str, mtime_ns: int) -> Tuple[int, int]:
+    with Image.open(path) as img:
+        return img.size
+
+
+def get_image_size(path: str) -> Tuple[int, int]:
+    """Return the (width, height) of an image by reading its header only."""
+    return _image_size(path, get_mtime(path))
+
+
+def open_image(path: str, max_pixels: int = MAX_IMAGE_PIXELS) -> Image.Image:
+    """
+    Open an image lazily (header only), refusing it if it has more than max_pixels.
+    """
+    try:
+        img = Image.open(path)
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(str(e)) from e
+    if img.width * img.height > max_pixels:
+        img.close()
+        raise ImageTooLargeError(f"Image {path} is {img.width}x{img.height}, above the {max_pixels} pixel limit")
+    return img
+
+
+def _draft(img: Image.Image, mode: str, box: Tuple[int, int, int, int], size: Tuple[int, int]) -> Tuple[int, int, int, int]:
+    """
+    Let the JPEG decoder downscale by 1/2, 1/4 or 1/8 while the box region
+    stays at least size, and return the box in the drafted image coordinates.
+    """
+    if img.format != 'JPEG':
+        return box
+    left, top, right, bottom = box
+    factor = max(size[0] / (right - left), size[1] / (bottom - top))
+    full_w, full_h = img.size
+    img.draft('RGB' if mode in ('RGB', 'RGBA') else mode, (math.ceil(full_w * factor), math.ceil(full_h * factor)))
+    sx, sy = img.width / full_w, img.height / full_h
+    return left * sx, top * sy, right * sx, bottom * sy
+
+
+def decode_resized(path: str, size: Tuple[int, int], mode: str = 'RGBA', box: Optional[Tuple[int, int, int, int]] = None) -> Image.Image:
+    """
+    Decode an image (or the box region of it) converted to mode and resized to size.
+
+    JPEGs are decoded close to the target size (draft mode), other formats
+    are shrunk with Image.reduce before the final LANCZOS pass.
+    """
+    with open_image(path) as img:
+        box = _draft(img, mode, box or (0, 0, img.width, img.height), size)
+        if img.mode != mode:
+            img = img.convert(mode)
+        return img.resize(size, Image.LANCZOS, box=box, reducing_gap=REDUCING_GAP)
+
+
+def center_crop_box(image_size: Tuple[int, int], aspect_ratio: float) -> Tuple[int, int, int, int]:
+    """The largest box of aspect_ratio centered in an image."""
+    bg_w, bg_h = image_size
+    if bg_w / bg_h > aspect_ratio:
+        new_w = int(bg_h * aspect_ratio)
+        left = (bg_w - new_w) // 2
+        return left, 0, left + new_w, bg_h
+    new_h = int(bg_w / aspect_ratio)
+    top = (bg_h - new_h) // 2
+    return 0, top, bg_w, top + new_h
+
+
+def load_resized(path: str, size: Tuple[int, int], mode: str = 'RGBA') -> Image.Image:
+    """
+    Load an image converted to mode and LANCZOS-resized to size, through the asset cache.
+    """
+    return asset_cache.get(('resized', path, get_mtime(path), mode, size), lambda: decode_resized(path, size, mode))
+
+
+def load_background(path: str, aspect_ratio: float, size: Tuple[int, int]) -> Image.Image:
+    """
+    Load a background center-cropped to aspect_ratio and LANCZOS-resized to size, through the asset cache.
+    """
+    def loader():
+        return decode_resized(path, size, 'RGB', box=center_crop_box(get_image_size(path), aspect_ratio))
+    return asset_cache.get(('background', path, get_mtime(path), aspect_ratio, size), loader)
@@ -0,0 +1,70 @@
+import logging
+import os
+import random
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from .store import MetadataStore, get_metadata_store
+
+logger = logging.getLogger(__name__)
+
+
+class TemplateCatalog:
+    """
+    In-memory index of template metadata grouped by (card_type, aspect_ratio).
+
+    The templates are read from the metadata store once and only reloaded when
+    the store version changes, so listing and random sampling stay flat as the
+    library grows.
+    """
+
+    def __init__(self, store: MetadataStore):
+        self.store = store
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._index: Dict[Tuple[str, float], List[dict]] = {}
+
+    def _load(self, version: int) -> None:
+        index: Dict[Tuple[str, float], List[dict]] = {}
+        for item in self.store.get_templates():
+            key = (item.get('card_type'), item.get('aspect_ratio'))
+            index.setdefault(key, []).append(item)
+        self._index = index
+        self._version = version
+        logger.info(f"Loaded template catalog from {self.store.db_path}: {sum(len(v) for v in index.values())} templates")
+
+    def refresh(self) -> None:
+        """Reload the index if the metadata store changed since the last load."""
+        version = self.store.version()
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                self._load(version)
+
+    def get(self, card_type: str, aspect_ratio: float = 3/4) -> List[dict]:
+        """Return the templates of a type and aspect ratio (shared list, do not mutate)."""
+        self.refresh()
+        return self._index.get((card_type, aspect_ratio), [])
+
+    def random(self, card_type: str, aspect_ratio: float = 3/4) -> Optional[dict]:
+        """Return a random template of a type and aspect ratio, or None."""
+        bucket = self.get(card_type, aspect_ratio)
+        if not bucket:
+            return None
+        return bucket[random.randrange(len(bucket))]
+
+
+_catalogs: Dict[str, TemplateCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_template_catalog(db_path: Optional[str] = None) -> TemplateCatalog:
+    """Return the process-wide catalog for a metadata store."""
+    store = get_metadata_store(db_path)
+    key = os.path.abspath(store.db_path)
+    catalog = _catalogs.get(key)
+    if catalog is None:
+        with _catalogs_lock:
+            catalog = _catalogs.setdefault(key, TemplateCatalog(store))
+    return catalog
@@ -0,0 +1,152 @@
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .store import MetadataStore, get_metadata_store
+
+logger = logging.getLogger(__name__)
+
+COLOR_SPACES = ('hsv', 'lab')
+
+
+def hex_to_rgb_array(hex_colors: Sequence[str]) -> np.ndarray:
+    """Convert hex color strings to an (N, 3) float array of RGB values in [0, 1]."""
+    values = np.array([int(c.lstrip('#')[:6], 16) for c in hex_colors], dtype=np.uint32)
+    rgb = np.stack([(values >> 16) & 0xFF, (values >> 8) & 0xFF, values & 0xFF], axis=-1)
+    return rgb.astype(np.float64) / 255.0
+
+
+def rgb_to_hsv_cone(rgb: np.ndarray) -> np.ndarray:
+    """
+    Map RGB values to cartesian coordinates of the HSV cone, (v, s*cos(h), s*sin(h)).
+
+    Euclidean distances between these points equal color_distance_hsv.
+    """
+    maxc = rgb.max(axis=-1)
+    minc = rgb.min(axis=-1)
+    delta = maxc - minc
+    s = np.divide(delta, maxc, out=np.zeros_like(maxc), where=maxc > 0)
+    safe = np.where(delta > 0, delta, 1.0)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    rc, gc, bc = (maxc - r) / safe, (maxc - g) / safe, (maxc - b) / safe
+    h = np.where(r == maxc, bc - gc, np.where(g == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+    h = np.where(delta > 0, (h / 6.0) % 1.0, 0.0)
+    angle = h * 2 * np.pi
+    return np.stack([maxc, s * np.cos(angle), s * np.sin(angle)], axis=-1)
+
+
+def rgb_to_lab(rgb: np.ndarray) -> np.ndarray:
+    """Convert sRGB values in [0, 1] to CIELAB (D65 white point)."""
+    linear = np.where(rgb > 0.04045, ((rgb + 0.055) / 1.055) ** 2.4, rgb / 12.92)
+    m = np.array([
+        [0.4124564, 0.3575761, 0.1804375],
+        [0.2126729, 0.7151522, 0.0721750],
+        [0.0193339, 0.1191920, 0.9503041],
+    ])
+    xyz = linear @ m.T / np.array([0.95047, 1.0, 1.08883])
+    f = np.where(xyz > (6 / 29) ** 3, np.cbrt(xyz), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+    return np.stack([
+        116 * f[..., 1] - 16,
+        500 * (f[..., 0] - f[..., 1]),
+        200 * (f[..., 1] - f[..., 2]),
+    ], axis=-1)
+
+
+def color_coordinates(rgb: np.ndarray, color_space: str = 'hsv') -> np.ndarray:
+    """Project RGB values into the coordinate space used for distance queries."""
+    if color_space == 'hsv':
+        return rgb_to_hsv_cone(rgb)
+    if color_space == 'lab':
+        return rgb_to_lab(rgb)
+    raise ValueError(f"color_space must be one of {COLOR_SPACES}")
+
+
+class BackgroundColorIndex:
+    """
+    Precomputed matrices of background color coordinates (HSV cone and CIELAB).
+
+    Built once from the metadata store and rebuilt when the store version
+    changes; nearest and top-k queries are a single vectorized distance pass.
+    """
+
+    def __init__(self, store: MetadataStore):
+        self.store = store
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._snapshot: Tuple[List[dict], Dict[str, np.ndarray]] = ([], {})
+
+    def _load(self, version: int) -> None:
+        backgrounds = []
+        colors = []
+        for background in self.store.get_backgrounds():
+            try:
+                color = background['color']
+                if len(color.lstrip('#')) != 6:
+                    raise ValueError("expected 6 hex digits")
+                int(color.lstrip('#'), 16)
+            except Exception as e:
+                logger.warning(f"Error processing background color {background.get('color', 'unknown')}: {e}")
+                continue
+            backgrounds.append(background)
+            colors.append(color)
+        rgb = hex_to_rgb_array(colors) if colors else np.empty((0, 3))
+        self._snapshot = (backgrounds, {space: color_coordinates(rgb, space) for space in COLOR_SPACES})
+        self._version = version
+        logger.info(f"Built background color index: {len(backgrounds)} backgrounds")
+
+    def refresh(self) -> None:
+        """Rebuild the index if the metadata store changed since the last build."""
+        version = self.store.version()
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                self._load(version)
+
+    def __len__(self) -> int:
+        self.refresh()
+        return len(self._snapshot[0])
+
+    def nearest(self, target_color: str, k: int = 1, color_space: str = 'hsv') -> List[Tuple[dict, float]]:
+        """
+        Find the backgrounds closest to a target color.
+
+        Args:
+            target_color (str): The target color in hex format (e.g., '#ff0000').
+            k (int): Number of backgrounds to return.
+            color_space (str): 'hsv' for the HSV cone distance or 'lab' for CIE76 delta E.
+        Returns:
+            List[Tuple[dict, float]]: (background metadata, distance) pairs, closest first.
+        """
+        self.refresh()
+        backgrounds, coords = self._snapshot
+        if not backgrounds or k <= 0:
+            return []
+        points = coords[color_space]
+        target = color_coordinates(hex_to_rgb_array([target_color]), color_space)[0]
+        distances = np.sqrt(((points - target) ** 2).sum(axis=1))
+        k = min(k, len(backgrounds))
+        if k < len(backgrounds):
+            candidates = np.argpartition(distances, k - 1)[:k]
+        else:
+            candidates = np.arange(len(backgrounds))
+        order = candidates[np.argsort(distances[candidates], kind='stable')]
+        return [(backgrounds[i], float(distances[i])) for i in order]
+
+
+_indexes: Dict[str, BackgroundColorIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_background_color_index(db_path: Optional[str] = None) -> BackgroundColorIndex:
+    """Return the process-wide background color index for a metadata store."""
+    store = get_metadata_store(db_path)
+    key = os.path.abspath(store.db_path)
+    index = _indexes.get(key)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.setdefault(key, BackgroundColorIndex(store))
+    return index
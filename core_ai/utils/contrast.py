@@ -0,0 +1,94 @@
+import colorsys
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageColor
+
+# WCAG 2 contrast ratio the text must reach: 4.5 is AA for normal text, 3 for large text
+FONT_CONTRAST_TARGET = float(os.getenv("FONT_CONTRAST_TARGET", "4.5"))
+# The text must reach the target against this share of the pixels behind it,
+# the rest (small highlights or shadows) may be busier
+CONTRAST_COVERAGE = 0.95
+REGION_SAMPLE_SIZE = 64
+LIGHTNESS_STEPS = 64
+
+
+def relative_luminance(rgb) -> np.ndarray:
+    """WCAG relative luminance (0-1) of sRGB colors given as 0-255 values in the last axis."""
+    c = np.asarray(rgb, dtype=np.float64) / 255
+    c = np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+    return c @ np.array([0.2126, 0.7152, 0.0722])
+
+
+def contrast_ratio(l1, l2):
+    """WCAG contrast ratio of two relative luminances, from 1 to 21."""
+    return (np.maximum(l1, l2) + 0.05) / (np.minimum(l1, l2) + 0.05)
+
+
+def region_stats(img: Image.Image, box: Tuple[int, int, int, int]) -> dict:
+    """
+    Luminance range and mean color of a region of an image, from a small sample.
+    Returns:
+        dict: low / high (relative luminance of the darkest / brightest pixels
+            within CONTRAST_COVERAGE) and mean (RGB tuple).
+    """
+    region = img.crop(box).convert('RGB')
+    region.thumbnail((REGION_SAMPLE_SIZE, REGION_SAMPLE_SIZE), Image.BOX)
+    pixels = np.asarray(region, dtype=np.float64).reshape(-1, 3)
+    luminance = relative_luminance(pixels)
+    tail = (1 - CONTRAST_COVERAGE) * 100
+    return {
+        "low": float(np.percentile(luminance, tail)),
+        "high": float(np.percentile(luminance, 100 - tail)),
+        "mean": tuple(int(round(v)) for v in pixels.mean(axis=0)),
+    }
+
+
+def _hex(rgb) -> str:
+    return '#{:02x}{:02x}{:02x}'.format(*(int(round(v)) for v in rgb))
+
+
+def pick_font_color(img: Image.Image, box: Tuple[int, int, int, int], hint: Optional[str] = None, target: float = FONT_CONTRAST_TARGET) -> Tuple[str, float]:
+    """
+    Pick a text color for a region of an image that reaches a WCAG contrast target.
+
+    The hue and saturation come from hint (e.g. a suggested color, any CSS
+    color Pillow parses) or else from the mean color of the region, so the text is a darker or lighter tint of
+    its background. Only the lightness is changed, as little as needed: dark
+    text must contrast with the darkest pixels of the region, light text
+    with the brightest. When no lightness reaches the target, the side with the
+    highest contrast is taken (black or white at the extreme).
+    Returns:
+        Tuple[str, float]: The hex color and its worst-case contrast ratio in the region.
+    """
+    stats = region_stats(img, box)
+    seed = stats["mean"]
+    if hint:
+        try:
+            seed = ImageColor.getrgb(hint)[:3]
+        except ValueError:
+            # Not a color: pick a tint of the background as without a hint
+            hint = None
+    hue, seed_lightness, saturation = colorsys.rgb_to_hls(*(v / 255 for v in seed))
+
+    lightness = np.linspace(0, 1, LIGHTNESS_STEPS + 1)
+    candidates = np.array([colorsys.hls_to_rgb(hue, l, saturation) for l in lightness]) * 255
+    luminance = relative_luminance(candidates)
+    # Worst case: the background pixels closest to the text luminance
+    contrast = np.where(
+        luminance <= stats["low"], contrast_ratio(luminance, stats["low"]),
+        np.where(luminance >= stats["high"], contrast_ratio(luminance, stats["high"]), 1.0),
+    )
+
+    passing = np.flatnonzero(contrast >= target)
+    if hint is None:
+        # A tint of the background: keep to the side that can contrast most
+        best_dark, best_light = contrast[0], contrast[-1]
+        side = lightness <= seed_lightness if best_dark >= best_light else lightness >= seed_lightness
+        passing = passing[side[passing]]
+    if len(passing):
+        index = passing[np.argmin(np.abs(lightness[passing] - seed_lightness))]
+    else:
+        index = int(np.argmax(contrast))
+    return _hex(candidates[index]), round(float(contrast[index]), 2)
@@ -0,0 +1,276 @@
+"""
+Emoji images for Pilmoji.
+
+Emoji are read from a local glyph store (one PNG per emoji under
+EMOJI_DIR/<style>/) instead of being downloaded on every card. Emoji missing
+from the store are downloaded from the emoji CDN once, in the background, and
+added to it; cards drawn meanwhile use the font glyph. The store can be filled
+ahead of time with:
+
+    python -m core_ai.utils.emoji_source "Chúc mừng sinh nhật 🎂🎉" path/to/greetings.txt
+    python -m core_ai.utils.emoji_source --all
+"""
+import argparse
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+from pilmoji.helpers import EMOJI_REGEX
+from pilmoji.source import BaseSource, EmojiCDNSource
+
+logger = logging.getLogger(__name__)
+
+EMOJI_DIR = os.getenv("EMOJI_DIR", "static/emoji")
+EMOJI_STYLE = os.getenv("EMOJI_STYLE", "google")
+EMOJI_CACHE_SIZE = int(os.getenv("EMOJI_CACHE_SIZE", "512"))
+# Download emoji missing from the glyph store from the emoji CDN (in the background); off for offline deployments
+EMOJI_CDN_FALLBACK = os.getenv("EMOJI_CDN_FALLBACK", "true").lower() == "true"
+EMOJI_CDN_TIMEOUT = float(os.getenv("EMOJI_CDN_TIMEOUT", "5"))
+
+
+def emoji_filename(emoji: str) -> str:
+    """File name of an emoji in the glyph store, e.g. '2764.png' for '❤️' (variation selectors are dropped)."""
+    return "-".join(f"{ord(c):x}" for c in emoji if c != "\ufe0f") + ".png"
+
+
+class _CDNSource(EmojiCDNSource):
+    """Pilmoji's emoji CDN source with a request timeout."""
+
+    def __init__(self, style: str = EMOJI_STYLE, timeout: float = EMOJI_CDN_TIMEOUT):
+        super().__init__()
+        self.STYLE = style
+        self.REQUEST_KWARGS = {**EmojiCDNSource.REQUEST_KWARGS, "timeout": timeout}
+
+
+def _store_glyph(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+class LocalEmojiSource(BaseSource):
+    """
+    Pilmoji source backed by the on-disk glyph store, with an in-memory LRU of
+    the glyph bytes. hits are served from memory, loads from disk and
+    downloads from the emoji CDN.
+
+    Rendering never waits on the network: an emoji missing from the store is
+    returned as None, so Pilmoji draws the font glyph, and (with cdn_fallback)
+    queued for download by a background thread, which writes it to the store.
+    One that cannot be found at all is logged once, counted and not
+    downloaded again. Discord emoji are not supported.
+    """
+
+    def __init__(self, emoji_dir: str = EMOJI_DIR, style: str = EMOJI_STYLE, max_items: int = EMOJI_CACHE_SIZE,
+                 cdn_fallback: bool = EMOJI_CDN_FALLBACK):
+        self.directory = Path(emoji_dir) / style
+        self.style = style
+        self.max_items = max_items
+        self._cdn = _CDNSource(style) if cdn_fallback else None
+        self._downloader: Optional[ThreadPoolExecutor] = None
+        self._items: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._missing: Dict[str, int] = {}
+        self._pending: Set[str] = set()
+        self.hits = 0
+        self.loads = 0
+        self.downloads = 0
+        self.misses = 0
+
+    def get_emoji(self, emoji: str, /) -> Optional[BytesIO]:
+        data = self._load(emoji)
+        return BytesIO(data) if data is not None else None
+
+    def has_image(self, emoji: str) -> bool:
+        """Whether Pilmoji draws an emoji as an image (font.size wide) rather than with the font, for now."""
+        if emoji.startswith("<"):
+            return False
+        with self._lock:
+            if emoji_filename(emoji) in self._items:
+                return True
+        return self._load(emoji) is not None
+
+    def _load(self, emoji: str) -> Optional[bytes]:
+        name = emoji_filename(emoji)
+        with self._lock:
+            data = self._items.get(name)
+            if data is not None:
+                self._items.move_to_end(name)
+                self.hits += 1
+                return data
+            if emoji in self._missing or emoji in self._pending:
+                self.misses += 1
+                if emoji in self._missing:
+                    self._missing[emoji] += 1
+                return None
+
+        try:
+            data = (self.directory / name).read_bytes()
+        except OSError:
+            self._queue_download(emoji)
+            return None
+        with self._lock:
+            self.loads += 1
+            self._add(name, data)
+        return data
+
+    def _add(self, name: str, data: bytes) -> None:
+        self._items[name] = data
+        self._items.move_to_end(name)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def _queue_download(self, emoji: str) -> None:
+        """Count a miss of an emoji not in the store and download it in the background, once."""
+        with self._lock:
+            self.misses += 1
+            if self._cdn is None:
+                first = emoji not in self._missing
+                self._missing[emoji] = self._missing.get(emoji, 0) + 1
+            else:
+                first = False
+                if emoji in self._pending or emoji in self._missing:
+                    return
+                self._pending.add(emoji)
+                if self._downloader is None:
+                    self._downloader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="emoji-download")
+                self._downloader.submit(self._download, emoji)
+        if first:
+            logger.warning(f"Emoji {emoji!r} ({emoji_filename(emoji)}) not in {self.directory}, rendering the font glyph instead")
+
+    def _download(self, emoji: str) -> None:
+        name = emoji_filename(emoji)
+        try:
+            stream = self._cdn.get_emoji(emoji)
+        except Exception as e:
+            logger.warning(f"Failed to download emoji {emoji!r}: {e}")
+            stream = None
+        data = stream.getvalue() if stream else None
+        if data is not None:
+            try:
+                _store_glyph(self.directory / name, data)
+            except OSError as e:
+                logger.warning(f"Failed to store emoji {emoji!r} in {self.directory}: {e}")
+        with self._lock:
+            self._pending.discard(emoji)
+            if data is None:
+                self._missing[emoji] = self._missing.get(emoji, 0) + 1
+            else:
+                self.downloads += 1
+                self._add(name, data)
+        if data is None:
+            logger.warning(f"Emoji {emoji!r} ({name}) not in {self.directory} nor on the emoji CDN, "
+                           f"rendering the font glyph instead")
+
+    def get_discord_emoji(self, id: int, /) -> Optional[BytesIO]:
+        return None
+
+    def missing(self) -> Dict[str, int]:
+        """Emoji requested but not found in the store, with their request counts."""
+        with self._lock:
+            return dict(self._missing)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "items": len(self._items),
+                "max_items": self.max_items,
+                "hits": self.hits,
+                "loads": self.loads,
+                "downloads": self.downloads,
+                "pending": len(self._pending),
+                "misses": self.misses,
+                "missing": len(self._missing),
+            }
+
+
+_sources: Dict[tuple, LocalEmojiSource] = {}
+_sources_lock = threading.Lock()
+
+
+def get_emoji_source(emoji_dir: Optional[str] = None, style: Optional[str] = None) -> LocalEmojiSource:
+    """Return the process-wide emoji source for a glyph store directory and style."""
+    key = (os.path.abspath(emoji_dir or EMOJI_DIR), style or EMOJI_STYLE)
+    source = _sources.get(key)
+    if source is None:
+        with _sources_lock:
+            source = _sources.setdefault(key, LocalEmojiSource(emoji_dir or EMOJI_DIR, style or EMOJI_STYLE))
+    return source
+
+
+def find_emoji(texts: Iterable[str]) -> List[str]:
+    """Return the distinct emoji in some texts, in order of appearance."""
+    found = {}
+    for text in texts:
+        for match in EMOJI_REGEX.finditer(text):
+            if not match.group().startswith("<"):
+                found.setdefault(match.group(), None)
+    return list(found)
+
+
+def populate(emoji: Iterable[str], emoji_dir: str = EMOJI_DIR, style: str = EMOJI_STYLE, overwrite: bool = False) -> dict:
+    """
+    Download emoji images from the emoji CDN into the glyph store.
+
+    Returns:
+        dict: Counts of downloaded, skipped (already present) and failed emoji,
+            and the list of failed emoji.
+    """
+    directory = Path(emoji_dir) / style
+    directory.mkdir(parents=True, exist_ok=True)
+    cdn = _CDNSource(style)
+    result = {"downloaded": 0, "skipped": 0, "failed": 0, "failed_emoji": []}
+    for item in emoji:
+        path = directory / emoji_filename(item)
+        if path.exists() and not overwrite:
+            result["skipped"] += 1
+            continue
+        try:
+            stream = cdn.get_emoji(item)
+        except Exception as e:
+            logger.warning(f"Failed to download emoji {item!r}: {e}")
+            stream = None
+        if not stream:
+            result["failed"] += 1
+            result["failed_emoji"].append(item)
+            continue
+        _store_glyph(path, stream.getvalue())
+        result["downloaded"] += 1
+    return result
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Pre-populate the local emoji glyph store.")
+    parser.add_argument("sources", nargs="*", help="Text files or literal strings to collect emoji from")
+    parser.add_argument("--all", action="store_true", help="Download every emoji known to the emoji package")
+    parser.add_argument("--dir", default=EMOJI_DIR, help="Glyph store directory (default: EMOJI_DIR)")
+    parser.add_argument("--style", default=EMOJI_STYLE, help="Emoji style (default: EMOJI_STYLE)")
+    parser.add_argument("--overwrite", action="store_true", help="Download emoji that are already stored")
+    args = parser.parse_args()
+
+    if args.all:
+        import emoji as emoji_package
+        wanted = list(emoji_package.EMOJI_DATA)
+    else:
+        texts = []
+        for source in args.sources:
+            if os.path.isfile(source):
+                with open(source, "r", encoding="utf-8") as f:
+                    texts.append(f.read())
+            else:
+                texts.append(source)
+        wanted = find_emoji(texts)
+    if not wanted:
+        parser.error("no emoji to download, pass texts/files containing emoji or --all")
+
+    result = populate(wanted, args.dir, args.style, overwrite=args.overwrite)
+    print(f"{len(wanted)} emoji: {result['downloaded']} downloaded, {result['skipped']} already stored, {result['failed']} failed")
+    if result["failed_emoji"]:
+        print("Failed: " + " ".join(result["failed_emoji"]))
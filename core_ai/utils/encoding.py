@@ -0,0 +1,100 @@
+import logging
+import os
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FORMATS = ('png', 'webp', 'jpeg')
+EXTENSIONS = {'png': '.png', 'webp': '.webp', 'jpeg': '.jpg'}
+_ALIASES = {'jpg': 'jpeg', 'image/png': 'png', 'image/webp': 'webp', 'image/jpeg': 'jpeg', 'image/jpg': 'jpeg'}
+
+CARD_FORMAT = os.getenv("CARD_FORMAT", "webp")
+TEMPLATE_FORMAT = os.getenv("TEMPLATE_FORMAT", CARD_FORMAT)
+PNG_COMPRESS_LEVEL = int(os.getenv("PNG_COMPRESS_LEVEL", "6"))
+JPEG_QUALITY = int(os.getenv("JPEG_QUALITY", "88"))
+WEBP_QUALITY = int(os.getenv("WEBP_QUALITY", "85"))
+WEBP_METHOD = int(os.getenv("WEBP_METHOD", "4"))
+
+
+def get_output_format(output_format: Optional[str] = None) -> str:
+    """
+    Normalize an output format name ('png', 'webp', 'jpeg'/'jpg' or a media type),
+    defaulting to CARD_FORMAT.
+    """
+    name = (output_format or CARD_FORMAT).strip().lower()
+    name = _ALIASES.get(name, name)
+    if name not in OUTPUT_FORMATS:
+        raise ValueError(f"output format must be one of {OUTPUT_FORMATS}, got {output_format!r}")
+    return name
+
+
+def format_from_path(path: str) -> Optional[str]:
+    """Return the output format matching a file extension, or None."""
+    suffix = Path(path).suffix.lower()
+    for name, extension in EXTENSIONS.items():
+        if suffix == extension or (name == 'jpeg' and suffix == '.jpeg'):
+            return name
+    return None
+
+
+def with_format_extension(path: str, output_format: Optional[str] = None) -> str:
+    """Replace the extension of path with the one of output_format."""
+    return str(Path(path).with_suffix(EXTENSIONS[get_output_format(output_format)]))
+
+
+def save_options(output_format: str) -> dict:
+    """Pillow save() keyword arguments of an output format."""
+    if output_format == 'png':
+        return {'format': 'PNG', 'compress_level': PNG_COMPRESS_LEVEL}
+    if output_format == 'webp':
+        return {'format': 'WEBP', 'quality': WEBP_QUALITY, 'method': WEBP_METHOD}
+    return {'format': 'JPEG', 'quality': JPEG_QUALITY, 'progressive': True, 'optimize': True}
+
+
+def save_image(img: Image.Image, path, output_format: Optional[str] = None, **options) -> None:
+    """
+    Encode an image to path (or a file object) in an output format.
+
+    Args:
+        img (Image.Image): The image to save.
+        path: Destination path or binary file object.
+        output_format (str): 'png', 'webp' or 'jpeg'. Defaults to the format of
+            the path extension, then CARD_FORMAT.
+        **options: Overrides of the format's Pillow save options.
+    """
+    if output_format is None and isinstance(path, (str, os.PathLike)):
+        output_format = format_from_path(str(path))
+    output_format = get_output_format(output_format)
+    if output_format == 'jpeg' and img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    img.save(path, **{**save_options(output_format), **options})
+
+
+def negotiate_format(accept: Optional[str], default: Optional[str] = None) -> str:
+    """
+    Pick an output format from an HTTP Accept header.
+
+    The image type with the highest q-value wins, ties going to the order of
+    the header. Wildcards, non-image types and an empty header give default.
+    """
+    default = get_output_format(default)
+    best, best_q = default, 0.0
+    for part in (accept or '').split(','):
+        media_type, _, params = part.strip().partition(';')
+        name = _ALIASES.get(media_type.strip().lower())
+        if name is None:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > best_q:
+            best, best_q = name, q
+    return best
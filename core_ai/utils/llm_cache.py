@@ -0,0 +1,142 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence, Tuple
+
+from .store import MetadataStore, get_metadata_store
+
+logger = logging.getLogger(__name__)
+
+# 'memory' (per-process LRU), 'sqlite' (LRU in front of the metadata database) or 'none'
+LLM_CACHE = os.getenv("LLM_CACHE", "memory")
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1024"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_BACKENDS = ('memory', 'sqlite', 'none')
+
+
+def normalize_prompt(text: str) -> str:
+    """Prompt text as compared by the cache: NFC, case-folded, whitespace collapsed."""
+    return ' '.join(unicodedata.normalize('NFC', text).casefold().split())
+
+
+def cache_key(messages: Sequence, model: Optional[str], temperature: Optional[float], variant: int = 0) -> str:
+    """
+    Key of an LLM call: its normalized messages, model and temperature.
+    Calls with another variant number are cached separately.
+    """
+    payload = json.dumps({
+        "messages": [[message.type, normalize_prompt(message.content)] for message in messages],
+        "model": model,
+        "temperature": temperature,
+        "variant": variant,
+    }, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class LLMCache:
+    """
+    Thread-safe LRU of LLM responses with a time to live.
+
+    With a store, responses are also written to its SQLite database, so they
+    survive restarts and are shared by worker processes; memory misses are
+    looked up there before counting as a miss.
+    """
+
+    def __init__(self, max_entries: int = LLM_CACHE_SIZE, ttl: float = LLM_CACHE_TTL, store: Optional[MetadataStore] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.store = store
+        self._items: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        if store is not None:
+            purged = store.purge_llm_responses(time.time() - ttl)
+            if purged:
+                logger.info(f"Purged {purged} expired LLM responses")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                if now - item[0] < self.ttl:
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return item[1]
+                del self._items[key]
+        if self.store is not None:
+            response = self.store.get_llm_response(key, now - self.ttl)
+            if response is not None:
+                with self._lock:
+                    self.store_hits += 1
+                self._remember(key, response, now)
+                return response
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, response: str) -> None:
+        now = time.time()
+        self._remember(key, response, now)
+        if self.store is not None:
+            self.store.set_llm_response(key, response, now)
+
+    def bypass(self) -> None:
+        """Count a call that skipped the cache (no_cache)."""
+        with self._lock:
+            self.bypasses += 1
+
+    def _remember(self, key: str, response: str, created_at: float) -> None:
+        with self._lock:
+            self._items[key] = (created_at, response)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.store_hits + self.misses
+            return {
+                "backend": "sqlite" if self.store is not None else "memory",
+                "items": len(self._items),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "store_hits": self.store_hits,
+                "misses": self.misses,
+                "bypasses": self.bypasses,
+                "hit_rate": round((self.hits + self.store_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+
+_caches: Dict[tuple, Optional[LLMCache]] = {}
+_caches_lock = threading.Lock()
+
+
+def get_llm_cache(backend: Optional[str] = None, db_path: Optional[str] = None) -> Optional[LLMCache]:
+    """Return the process-wide LLM response cache of a backend (default LLM_CACHE), None for 'none'."""
+    backend = (backend or LLM_CACHE).lower()
+    if backend not in LLM_CACHE_BACKENDS:
+        raise ValueError(f"LLM cache backend must be one of {LLM_CACHE_BACKENDS}, got {backend!r}")
+    key = (backend, os.path.abspath(db_path) if db_path else None)
+    if key not in _caches:
+        with _caches_lock:
+            if key not in _caches:
+                if backend == 'none':
+                    _caches[key] = None
+                else:
+                    store = get_metadata_store(db_path) if backend == 'sqlite' else None
+                    _caches[key] = LLMCache(store=store)
+    return _caches[key]
@@ -1,30 +1,44 @@
+import asyncio
 import os
-from typing import Optional
+import random
+from typing import Awaitable, Callable, List, Optional, Sequence, Tuple, Union
 import logging
 import json
 import re
+import threading
 import uuid
-from dotenv import load_dotenv
-from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, wraps
+from PIL import Image
 
 from langchain_openai import ChatOpenAI
 from langchain_core.runnables import Runnable
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
-from .tools import (merge_foreground_background,
-                    merge_foreground_background_with_blending,
+from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage, AIMessage
+from langgraph.config import get_stream_writer
+from .tools import (PREVIEW_HEIGHT,
+                    STANDARD_HEIGHT,
+                    draw_text_on_image,
                     add_text_to_image, 
                     get_random_font,
-                    get_dominant_color,
+                    get_dominant_color_cached,
                     get_random_template_by_type,
                     get_best_matching_background,
                     )
+from .encoding import get_output_format, save_image, with_format_extension
+from .llm_cache import LLMCache, cache_key, get_llm_cache
+from .render import RENDER_QUEUE_DEPTH, RENDER_WARM_TEMPLATES, RENDER_WORKERS, RenderPool, RenderQueueFullError, RenderRecipe, prefetch_merged, render_merged
+from .store import get_metadata_store
 
 from .prompt import system_prompt, user_prompt_template, system_color_prompt, dominant_color_prompt_template
 from .state import State
 
-load_dotenv()
 logger = logging.getLogger(__name__)
 
+# Ask the LLM for a font color hint; the color is always adjusted for contrast on the card
+FONT_COLOR_LLM = os.getenv("FONT_COLOR_LLM", "false").lower() in ("1", "true", "yes")
+# Threads running the image nodes of async graph calls (PIL releases the GIL while decoding, resizing and encoding)
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", str(os.cpu_count() or 4)))
+
 @lru_cache(maxsize=4)
 def _get_model(model: Optional[str] = None) -> Runnable:
     try:
@@ -55,19 +69,195 @@ def extract_json(text):
             return None
     return None
 
+def partial_json_string(text: str, field: str) -> Optional[str]:
+    """
+    Value so far of a string field in the JSON of a reply still being generated.
+    Returns None until the field's value has started.
+    """
+    match = re.search(r'"%s"\s*:\s*"' % re.escape(field), text)
+    if not match:
+        return None
+    raw, i = [], match.end()
+    while i < len(text) and text[i] != '"':
+        length = 1
+        if text[i] == '\\':
+            length = 6 if text[i + 1:i + 2] == 'u' else 2
+            if i + length > len(text):
+                # Escape sequence cut off by the end of the chunk
+                break
+        raw.append(text[i:i + length])
+        i += length
+    try:
+        value = json.loads('"' + ''.join(raw) + '"', strict=False)
+    except ValueError:
+        return None
+    # Drop half of a surrogate pair, the other half is still to come
+    return value[:-1] if value and '\ud800' <= value[-1] <= '\udbff' else value
+
+def _field_streamer(fields: Sequence[str]) -> Callable[[str], None]:
+    """
+    Callback writing the new text of string fields of a JSON reply, as it
+    grows, to the custom stream of the graph as {"field", "text"} events.
+    """
+    writer = get_stream_writer()
+    sent = dict.fromkeys(fields, "")
+
+    def on_content(content: str) -> None:
+        for field in fields:
+            value = partial_json_string(content, field)
+            if value and len(value) > len(sent[field]) and value.startswith(sent[field]):
+                writer({"field": field, "text": value[len(sent[field]):]})
+                sent[field] = value
+    return on_content
+
+def _call_llm(llm: Runnable, messages: List[BaseMessage], on_content: Optional[Callable[[str], None]] = None) -> str:
+    """Call the LLM, streaming its reply to on_content (the text so far) when given."""
+    if on_content is None:
+        return llm.invoke(messages).content
+    content = ""
+    for chunk in llm.stream(messages):
+        content += chunk.content
+        on_content(content)
+    return content
+
+async def _acall_llm(llm: Runnable, messages: List[BaseMessage], on_content: Optional[Callable[[str], None]] = None) -> str:
+    """Async version of _call_llm."""
+    if on_content is None:
+        return (await llm.ainvoke(messages)).content
+    content = ""
+    async for chunk in llm.astream(messages):
+        content += chunk.content
+        on_content(content)
+    return content
+
+def _cached_reply(messages: List[BaseMessage], state: State, llm: Runnable) -> Tuple[Optional[LLMCache], Optional[str], Optional[str]]:
+    """
+    Look an LLM call up in the response cache.
+
+    state.no_cache skips the lookup (the fresh reply still replaces the cached
+    one); state.variety spreads the calls over that many separately cached
+    replies, picked at random.
+    Returns:
+        Tuple: The cache (None when disabled), the key of the call and the cached reply, if any.
+    """
+    cache = get_llm_cache()
+    if cache is None:
+        return None, None, None
+    variant = random.randrange(state.variety) if state.variety > 1 else 0
+    key = cache_key(messages, getattr(llm, "model_name", None), getattr(llm, "temperature", None), variant)
+    if state.no_cache:
+        cache.bypass()
+        return cache, key, None
+    return cache, key, cache.get(key)
+
+def _parse_reply(content: str, cache: Optional[LLMCache], key: Optional[str]) -> Optional[dict]:
+    """Parse the JSON of a fresh LLM reply, caching the reply when it parses."""
+    parsed = extract_json(content)
+    if parsed and cache is not None:
+        cache.set(key, content)
+    return parsed
+
+def _invoke_json(messages: List[BaseMessage], state: State, on_content: Optional[Callable[[str], None]] = None) -> Tuple[str, Optional[dict]]:
+    """
+    Call the LLM through the response cache (see _cached_reply) and parse the JSON of its reply.
+    Only replies that parse are cached. on_content gets the reply text as it
+    is streamed, or at once when cached.
+    Returns:
+        Tuple[str, Optional[dict]]: The reply text and its parsed JSON.
+    """
+    llm = _get_model()
+    cache, key, content = _cached_reply(messages, state, llm)
+    if content is not None:
+        if on_content is not None:
+            on_content(content)
+        return content, extract_json(content)
+    content = _call_llm(llm, messages, on_content)
+    return content, _parse_reply(content, cache, key)
+
+async def _ainvoke_json(messages: List[BaseMessage], state: State, on_content: Optional[Callable[[str], None]] = None) -> Tuple[str, Optional[dict]]:
+    """Async version of _invoke_json."""
+    llm = _get_model()
+    cache, key, content = _cached_reply(messages, state, llm)
+    if content is not None:
+        if on_content is not None:
+            on_content(content)
+        return content, extract_json(content)
+    content = await _acall_llm(llm, messages, on_content)
+    return content, _parse_reply(content, cache, key)
+
+@lru_cache(maxsize=1)
+def get_image_executor() -> ThreadPoolExecutor:
+    """Executor of the image work of async graph calls, shared by all requests of the process."""
+    return ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="card-image")
+
+def in_image_executor(node: Callable[[State], Union[State, dict]]) -> Callable[[State], Awaitable[Union[State, dict]]]:
+    """Async version of a sync node, run in the image executor to keep the event loop free."""
+    @wraps(node)
+    async def run(state: State):
+        return await asyncio.get_running_loop().run_in_executor(get_image_executor(), node, state)
+    return run
+
+_render_pool: Optional[RenderPool] = None
+_render_pool_lock = threading.Lock()
+
+# Text of the cards the render workers are warmed with
+WARM_TITLE = "Chúc mừng sinh nhật"
+WARM_GREETING = "Chúc bạn tuổi mới thật nhiều niềm vui, sức khỏe dồi dào và thành công trong công việc lẫn cuộc sống nhé!"
+
+def _warm_recipes() -> List[RenderRecipe]:
+    """
+    Cards rendering the first RENDER_WARM_TEMPLATES templates of each aspect
+    ratio in the default layout, with every font, to warm the render workers.
+    """
+    fonts = [(os.path.join("static/fonts/text_fonts", text), os.path.join("static/fonts/title_fonts", title))
+             for text, title in zip(sorted(os.listdir("static/fonts/text_fonts")), sorted(os.listdir("static/fonts/title_fonts")))]
+    recipes = []
+    for aspect_ratio in (3/4, 4/3):
+        for i, template in enumerate(get_metadata_store().get_templates(aspect_ratio=aspect_ratio)[:RENDER_WARM_TEMPLATES]):
+            font_path, title_font_path = fonts[i % len(fonts)]
+            state = State(aspect_ratio=aspect_ratio, foreground_path=template["foreground_path"],
+                          background_path=template["background_path"], merged_image_path=template["merged_image_path"],
+                          title=WARM_TITLE, greeting_text=WARM_GREETING, font_path=font_path, title_font_path=title_font_path)
+            _set_layout(state, len(WARM_GREETING.split()))
+            recipes.append(_card_recipe(state, _text_kwargs(state)))
+    return recipes
+
+def get_render_pool() -> Optional[RenderPool]:
+    """
+    The process-wide pool of RENDER_WORKERS render processes, started and
+    warmed on first use; None when cards are rendered in the request thread.
+    """
+    global _render_pool
+    if RENDER_WORKERS <= 0:
+        return None
+    if _render_pool is None:
+        with _render_pool_lock:
+            if _render_pool is None:
+                pool = RenderPool(RENDER_WORKERS, RENDER_QUEUE_DEPTH, _warm_recipes())
+                pool.start()
+                _render_pool = pool
+    return _render_pool
+
+def shutdown_render_pool() -> None:
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is not None:
+            _render_pool.shutdown()
+            _render_pool = None
+
 def dominant_color_node(state: State) -> State:
     """Extract dominant color from the background image."""
     bg_path = state.background_path
     if not bg_path:
         logger.warning("No background_path provided for dominant color extraction.")
         return state
-    color = get_dominant_color(bg_path)
+    color = get_dominant_color_cached(bg_path)
     state.dominant_color = color
     logger.info(f"Dominant color: {color}")
     return state
 
 def upload_image_node(state: State) -> State:
-    foreground_color = get_dominant_color(state.foreground_path, quality=50)
+    foreground_color = get_dominant_color_cached(state.foreground_path, quality=50)
     best_background = get_best_matching_background(foreground_color)
     state.background_path = best_background.get("background_path")
     state.dominant_color = best_background.get("color")
@@ -76,32 +266,54 @@ def upload_image_node(state: State) -> State:
     logger.info(f"Selected background path: {state.background_path}")
     return state
 
-def llm_node(state: State) -> State:
-    llm = _get_model()
-    user_prompt = user_prompt_template.format(**state.model_dump())
+def _greeting_messages(state: State) -> List[BaseMessage]:
+    # Trimmed so instructions differing only in spacing share a cached reply
+    instructions = ' '.join((state.greeting_text_instructions or '').split())
+    user_prompt = user_prompt_template.format(**{**state.model_dump(), "greeting_text_instructions": instructions})
+    return [
+        SystemMessage(content=system_prompt),
+        HumanMessage(content=user_prompt)
+    ]
+
+def _greeting_update(state: State, content: str, parsed: Optional[dict]) -> dict:
+    if not parsed:
+        logger.error("Failed to parse JSON from LLM response.")
+        logger.error(f"LLM response content: {content}")
 
+    logger.info(f"Response from LLM: {parsed}")
+    return {
+        "messages": state.messages + [AIMessage(content=content)],
+        "title": parsed.get("title"),
+        "greeting_text": parsed.get("greeting_text"),
+        "card_type": parsed.get("card_type"),
+    }
+
+def _greeting_streamer(state: State) -> Optional[Callable[[str], None]]:
+    # The title and greeting are streamed as they are generated when the graph is streamed
+    return _field_streamer(("title", "greeting_text")) if state.stream else None
+
+def llm_node(state: State) -> dict:
+    """
+    Generate the title, greeting text and card type.
+    Returns only the fields it sets, since it runs in parallel with prepare_images_node.
+    """
     try:
-        messages = [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=user_prompt)
-        ]
-
-        response = llm.invoke(messages)
-        parsed = extract_json(response.content)
-        if not parsed:
-            logger.error("Failed to parse JSON from LLM response.")
-            logger.error(f"LLM response content: {response.content}")
-            
-        logger.info(f"Response from LLM: {parsed}")
-        state.messages.append(AIMessage(content=response.content))
-        state.title = parsed.get("title")
-        state.greeting_text = parsed.get("greeting_text")
-        state.card_type = parsed.get("card_type")
+        messages = _greeting_messages(state)
+        content, parsed = _invoke_json(messages, state, _greeting_streamer(state))
+        return _greeting_update(state, content, parsed)
     except Exception as e:
         logger.error(f"Error creating messages: {e}")
-        return state
-    
-    return state
+        return {}
+
+async def allm_node(state: State) -> dict:
+    """Async version of llm_node."""
+    try:
+        messages = _greeting_messages(state)
+        content, parsed = await _ainvoke_json(messages, state, _greeting_streamer(state))
+        return _greeting_update(state, content, parsed)
+    except Exception as e:
+        logger.error(f"Error creating messages: {e}")
+        return {}
 
 def random_template_node(state: State) -> State:
     """Select a random template for the card."""
@@ -118,45 +330,61 @@ def random_template_node(state: State) -> State:
     logger.info(f"Merged image path: {state.merged_image_path}")
     return state
     
-def font_color_node(state: State) -> State:
-    """Select font color using LLM based on dominant_color and card_type."""
-    llm = _get_model()
+def _font_color_messages(state: State) -> List[BaseMessage]:
     user_prompt = dominant_color_prompt_template.format(**state.model_dump())
     sys_prompt = system_color_prompt.format()
+    return [
+        SystemMessage(content=sys_prompt),
+        HumanMessage(content=user_prompt)
+    ]
+
+def _set_font_color_hint(state: State, content: str, parsed: Optional[dict]) -> None:
+    state.messages.append(AIMessage(content=content))
+    state.font_color_hint = parsed.get("font_color")
+    logger.info(f"Response from LLM: {parsed}")
+
+def font_color_node(state: State) -> State:
+    """
+    Ask the LLM for a font color hint based on dominant_color and card_type (FONT_COLOR_LLM only).
+
+    The font color itself is picked in add_text_node from the pixels behind the text.
+    """
+    if not FONT_COLOR_LLM or state.font_color:
+        return state
     try:
-        messages = [
-            SystemMessage(content=sys_prompt),
-            HumanMessage(content=user_prompt)
-        ]
-
-        response = llm.invoke(messages)
-        parsed = extract_json(response.content)
-        state.messages.append(AIMessage(content=response.content))
-        state.font_color = parsed.get("font_color")
-        logger.info(f"Response from LLM: {parsed}")
+        content, parsed = _invoke_json(_font_color_messages(state), state)
+        _set_font_color_hint(state, content, parsed)
     except Exception as e:
         logger.error(f"Error in font_color_node: {e}")
 
     return state
 
-def merge_node(state: State) -> State:
-    """Process merging foreground and background images with updated state."""
-    if not state.foreground_path or not state.background_path:
-        logger.warning(f"Missing foreground or background for merge: {state.foreground_path}, {state.background_path}")
+async def afont_color_node(state: State) -> State:
+    """Async version of font_color_node."""
+    if not FONT_COLOR_LLM or state.font_color:
         return state
+    try:
+        content, parsed = await _ainvoke_json(_font_color_messages(state), state)
+        _set_font_color_hint(state, content, parsed)
+    except Exception as e:
+        logger.error(f"Error in font_color_node: {e}")
+
+    return state
 
+# Greetings with at least this many words get a smaller foreground
+LONG_GREETING_WORDS = 40
+
+def _set_layout(state: State, greeting_words: int) -> None:
+    """Set the merge and text layout of a card from its aspect ratio and greeting length."""
     position_map = {
         "left": "right",
         "right": "left",
         "top": "bottom",
         "bottom": "top"
     }
-    
-
-    greeting_words = len(state.greeting_text.split()) if state.greeting_text else 0
 
     # Set merge_foreground_ratio based on aspect ratio and greeting length
-    if greeting_words < 40:
+    if greeting_words < LONG_GREETING_WORDS:
         state.merge_foreground_ratio = 1/2
     else:
         state.merge_foreground_ratio = 1/3
@@ -173,76 +401,192 @@ def merge_node(state: State) -> State:
         state.font_size = 80
 
     state.text_position = position_map.get(state.merge_position)
+
+    # A user upload has no merged_image_path, a template does
+    if state.merge_mode is None:
+        state.merge_mode = "template" if state.merged_image_path else "blend"
+
+def _merge_recipe(state: State, **kwargs) -> RenderRecipe:
+    """The render recipe of a card laid out by _set_layout; kwargs set its text and output."""
+    return RenderRecipe(
+        merge_mode=state.merge_mode,
+        foreground_path=state.foreground_path,
+        background_path=state.background_path,
+        merge_position=state.merge_position,
+        merge_margin_ratio=state.merge_margin_ratio,
+        aspect_ratio=state.aspect_ratio,
+        merge_foreground_ratio=state.merge_foreground_ratio,
+        height=PREVIEW_HEIGHT if state.preview else STANDARD_HEIGHT,
+        **kwargs,
+    )
+
+def _render_merged(state: State) -> Image.Image:
+    """Render the merged image of a card laid out by _set_layout."""
+    return render_merged(_merge_recipe(state))
+
+def prepare_images_node(state: State) -> dict:
+    """
+    Image work that does not depend on the LLM output, run alongside llm_node.
+
+    With an uploaded foreground the background is matched, with a given
+    template the dominant color is extracted. Both merge layouts the greeting
+    length can select are then prefetched: the decoded images of an upload, so merge_node only composites the one it picks, or the
+    (stored) template composites.
+    Returns only the fields it sets, since it runs in parallel with llm_node.
+    """
+    if state.foreground_path and not state.background_path:
+        upload_image_node(state)
+    elif state.foreground_path and state.background_path:
+        dominant_color_node(state)
+    else:
+        # The template depends on the card type picked by the LLM
+        return {}
+    if get_render_pool() is not None:
+        # Cards are rendered by the workers, with their own caches
+        return {"background_path": state.background_path, "dominant_color": state.dominant_color}
+    try:
+        for greeting_words in (0, LONG_GREETING_WORDS):
+            variant = state.model_copy()
+            _set_layout(variant, greeting_words)
+            prefetch_merged(_merge_recipe(variant))
+    except Exception as e:
+        # merge_node renders (and reports) it again
+        logger.warning(f"Error prefetching merge: {e}")
+    return {"background_path": state.background_path, "dominant_color": state.dominant_color}
+
+def merge_node(state: State) -> State:
+    """Process merging foreground and background images with updated state."""
+    if not state.foreground_path or not state.background_path:
+        logger.warning(f"Missing foreground or background for merge: {state.foreground_path}, {state.background_path}")
+        return state
+
+    greeting_words = len(state.greeting_text.split()) if state.greeting_text else 0
+    _set_layout(state, greeting_words)
+
     # Generate output path
-    output_path = f"static/images/cards/{uuid.uuid4().hex}.png"
+    state.output_format = get_output_format(state.output_format)
+    output_path = with_format_extension(f"static/images/cards/{uuid.uuid4().hex}", state.output_format)
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    
-    # Check if this is a user upload (no merged_image_path provided)
-    if not state.merged_image_path:
-        # User upload - use merge with blending
-        logger.info("Using merge with blending for user upload")
-        merge_foreground_background_with_blending(
-            foreground_path=state.foreground_path,
-            background_path=state.background_path,
-            output_path=output_path,
-            aspect_ratio=state.aspect_ratio,
-            foreground_ratio=state.merge_foreground_ratio,
-            merge_position=state.merge_position,
-        )
-    else:
-        # Template selection - use normal merge
-        logger.info("Using normal merge for template")
-        merge_foreground_background(
-            foreground_path=state.foreground_path,
-            background_path=state.background_path,
-            output_path=output_path,
-            merge_position=state.merge_position,
-            margin_ratio=state.merge_margin_ratio,
-            aspect_ratio=state.aspect_ratio,
-            foreground_ratio=state.merge_foreground_ratio,
-        )
-    
+
+    if get_render_pool() is not None:
+        # Merged with the text by a render worker in add_text_node
+        state.merged_image_path = output_path
+        state.render_deferred = True
+        return state
+
+    logger.info(f"Merging with mode: {state.merge_mode}")
+    merged_image = _render_merged(state)
+
+    # The card is encoded once, by add_text_node, at this path
+    state.merged_image = merged_image
     state.merged_image_path = output_path
     return state
 
-def add_text_node(state: State) -> State:
-    image_path = state.merged_image_path
-    state.card_path = image_path
-    logger.info(f"Card generated at: {state.card_path}")
+def _set_text_info(state: State, info: dict) -> None:
+    """Record the fonts and the (possibly picked) font color a card was drawn with."""
+    state.font_path = info["font_path"]
+    if state.font_color is None:
+        state.font_color = info["font_color"]
+        state.font_contrast = info["font_contrast"]
+        logger.info(f"Font color: {state.font_color} (contrast {state.font_contrast}:1)")
 
-    font_path = get_random_font("static/fonts/text_fonts")
-    title_font_path = get_random_font("static/fonts/title_fonts")
+def _text_kwargs(state: State) -> dict:
+    """Pick the fonts of a card (once, a recipe replay reuses them) and return the arguments of draw_text_on_image."""
+    font_path = state.font_path or get_random_font("static/fonts/text_fonts")
+    title_font_path = state.title_font_path or get_random_font("static/fonts/title_fonts")
+    state.title_font_path = title_font_path
 
     logger.info(f"Font path: {font_path}")
     logger.info(f"Title font path: {title_font_path}")
 
+    return dict(
+        text=state.greeting_text,
+        title=state.title,
+        title_font_path=title_font_path,
+        title_font_size=state.title_font_size,
+        font_color=state.font_color,
+        font_color_hint=state.font_color_hint,
+        font_path=font_path,
+        font_size=state.font_size,
+        text_position=state.text_position,
+        margin_ratio=state.text_margin_ratio,
+        text_ratio=state.text_ratio,
+        scale=(PREVIEW_HEIGHT if state.preview else STANDARD_HEIGHT) / STANDARD_HEIGHT,
+    )
+
+def _card_recipe(state: State, text_kwargs: dict) -> RenderRecipe:
+    return _merge_recipe(state, text_kwargs=text_kwargs, output_path=state.merged_image_path, output_format=state.output_format)
+
+def _set_card(state: State, info: dict) -> State:
+    """Record a card drawn (with _set_text_info's fields) and encoded at merged_image_path."""
+    _set_text_info(state, info)
+    state.card_path = state.merged_image_path
+    logger.info(f"Card generated at: {state.card_path}")
+    return state
+
+def add_text_node(state: State) -> State:
+    """
+    Draw the text onto the merged image and encode the card at merged_image_path.
+    A card whose text cannot be drawn is not saved and gets no card_path.
+    """
+    text_kwargs = _text_kwargs(state)
+
+    if state.render_deferred:
+        try:
+            info = get_render_pool().render(_card_recipe(state, text_kwargs))
+        except RenderQueueFullError:
+            raise
+        except Exception as e:
+            logger.error(f"Error rendering card: {e}")
+            return state
+        return _set_card(state, info)
+
+    if state.merged_image is None:
+        # Merged image only exists on disk
+        try:
+            info = add_text_to_image(image_path=state.merged_image_path, output_path=state.merged_image_path, **text_kwargs)
+        except Exception as e:
+            logger.error(f"Error adding text to image: {e}")
+            return state
+        return _set_card(state, info)
+
+    img = state.merged_image
+    state.merged_image = None
     try:
-        add_text_to_image(
-            image_path=image_path,
-            output_path=state.card_path,
-            text=state.greeting_text,
-            title=state.title,
-            title_font_path=title_font_path,
-            title_font_size=state.title_font_size,
-            font_color=state.font_color,
-            font_path=font_path,
-            font_size=state.font_size,
-            text_position=state.text_position,
-            margin_ratio=state.text_margin_ratio,
-            text_ratio=state.text_ratio,
-        )
+        info = draw_text_on_image(img, **text_kwargs)
+        save_image(img, state.merged_image_path, state.output_format)
     except Exception as e:
         logger.error(f"Error adding text to image: {e}")
         return state
+    finally:
+        img.close()
+    return _set_card(state, info)
 
-    state.font_path = font_path
-    return state
+async def aadd_text_node(state: State) -> State:
+    """Async version of add_text_node: awaits the render worker, or runs in the image executor."""
+    if not state.render_deferred:
+        return await in_image_executor(add_text_node)(state)
+    text_kwargs = _text_kwargs(state)
+    try:
+        info = await get_render_pool().arender(_card_recipe(state, text_kwargs))
+    except RenderQueueFullError:
+        raise
+    except Exception as e:
+        logger.error(f"Error rendering card: {e}")
+        return state
+    return _set_card(state, info)
 
-def route_random_template(state: State) -> State:
-    """Route to a random template based on card type."""
+def route_input(state: State) -> Union[str, List[str]]:
+    """
+    Skip text and color generation when replaying a recipe that already has them,
+    otherwise run the LLM and the image preparation in parallel.
+    """
+    if state.greeting_text and state.font_color and state.foreground_path and state.background_path:
+        return "merge"
+    return ["llm", "prepare_images"]
+
+def route_random_template(state: State) -> str:
+    """Route to a random template based on card type, unless the images are already known."""
     if state.foreground_path and state.background_path:
-        return "dominant_color"
-    
-    if state.foreground_path and not state.background_path:
-        return "upload_image"
-    return "random_template"
\ No newline at end of file
+        return "font_color"
+    return "random_template"
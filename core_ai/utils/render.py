@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional, Sequence
+
+from PIL import Image
+from pydantic import BaseModel
+
+from .encoding import save_image
+from .tools import (
+    draw_text_on_image,
+    get_template_composite,
+    prefetch_foreground_background,
+    render_foreground_background_with_blending,
+)
+
+logger = logging.getLogger(__name__)
+
+# Worker processes rendering cards (merge, text and encoding); 0 renders in the request thread
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "0"))
+# Cards waiting for or being rendered by the workers before new ones are refused
+RENDER_QUEUE_DEPTH = int(os.getenv("RENDER_QUEUE_DEPTH", "256"))
+# Templates whose composites every worker loads at start, per aspect ratio
+RENDER_WARM_TEMPLATES = int(os.getenv("RENDER_WARM_TEMPLATES", "8"))
+
+
+class RenderQueueFullError(RuntimeError):
+    """Raised when RENDER_QUEUE_DEPTH cards are already waiting for the render workers."""
+
+
+class RenderRecipe(BaseModel):
+    """
+    Everything needed to render a card from its source images, without any
+    image object, so it can be sent to a render worker process.
+    """
+    merge_mode: str
+    foreground_path: str
+    background_path: str
+    merge_position: str
+    merge_margin_ratio: float
+    aspect_ratio: float
+    merge_foreground_ratio: float
+    height: int
+    # Keyword arguments of draw_text_on_image
+    text_kwargs: dict = {}
+    output_path: Optional[str] = None
+    output_format: Optional[str] = None
+
+
+def render_merged(recipe: RenderRecipe) -> Image.Image:
+    """Render the merged image (foreground on background, no text) of a card."""
+    if recipe.merge_mode == "blend":
+        # User upload - use merge with blending
+        merged_image, _ = render_foreground_background_with_blending(
+            foreground_path=recipe.foreground_path,
+            background_path=recipe.background_path,
+            aspect_ratio=recipe.aspect_ratio,
+            foreground_ratio=recipe.merge_foreground_ratio,
+            merge_position=recipe.merge_position,
+            height=recipe.height,
+        )
+        return merged_image
+    # Template selection - reuse the cached composite of this variant
+    return get_template_composite(
+        foreground_path=recipe.foreground_path,
+        background_path=recipe.background_path,
+        merge_position=recipe.merge_position,
+        margin_ratio=recipe.merge_margin_ratio,
+        aspect_ratio=recipe.aspect_ratio,
+        foreground_ratio=recipe.merge_foreground_ratio,
+        height=recipe.height,
+    )
+
+
+def prefetch_merged(recipe: RenderRecipe) -> None:
+    """Load what the merged image of a card needs into the caches, see prefetch_foreground_background."""
+    prefetch_foreground_background(
+        merge_mode=recipe.merge_mode,
+        foreground_path=recipe.foreground_path,
+        background_path=recipe.background_path,
+        merge_position=recipe.merge_position,
+        margin_ratio=recipe.merge_margin_ratio,
+        aspect_ratio=recipe.aspect_ratio,
+        foreground_ratio=recipe.merge_foreground_ratio,
+        height=recipe.height,
+    )
+
+
+def render_card(recipe: RenderRecipe) -> dict:
+    """
+    Render a card and encode it to recipe.output_path. Like add_text_node, the
+    card is not written when drawing its text fails.
+    Returns:
+        dict: The text layout parameters (see draw_text_on_image).
+    """
+    img = render_merged(recipe)
+    try:
+        info = draw_text_on_image(img, **recipe.text_kwargs)
+        save_image(img, recipe.output_path, recipe.output_format)
+        return info
+    finally:
+        img.close()
+
+
+def _warm_worker(recipes: Sequence[RenderRecipe]) -> None:
+    """
+    Initializer of a render worker: render the given cards without saving them,
+    so the fonts, the logo and the template composites they use are
+    loaded before the first request.
+    """
+    start = time.perf_counter()
+    for recipe in recipes:
+        try:
+            img = render_merged(recipe)
+            draw_text_on_image(img, **recipe.text_kwargs)
+            img.close()
+        except Exception as e:
+            logger.warning(f"Error warming render worker with {recipe.background_path}: {e}")
+    logger.info(f"Render worker {os.getpid()} warmed with {len(recipes)} cards in {time.perf_counter() - start:.2f}s")
+
+
+def _ready() -> int:
+    return os.getpid()
+
+
+class RenderPool:
+    """
+    Pool of worker processes rendering cards from RenderRecipes.
+
+    Each worker has its own image caches and is warmed at start. Submissions
+    beyond queue_depth cards in flight raise RenderQueueFullError rather than
+    queue without bound.
+    """
+
+    def __init__(self, workers: int, queue_depth: int = RENDER_QUEUE_DEPTH, warm_recipes: Sequence[RenderRecipe] = ()):
+        self.workers = workers
+        self.queue_depth = max(queue_depth, workers)
+        # spawn: the request process has threads (event loop, executors, SQLite) that must not be forked
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_worker,
+            initargs=(list(warm_recipes),),
+        )
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.submitted = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self) -> None:
+        """Start and warm every worker, waiting until they are ready."""
+        pids = {future.result() for future in [self._executor.submit(_ready) for _ in range(self.workers)]}
+        logger.info(f"Render pool started with {self.workers} workers ({len(pids)} ready)")
+
+    def submit(self, recipe: RenderRecipe) -> Future:
+        with self._lock:
+            if self.in_flight >= self.queue_depth:
+                self.rejected += 1
+                raise RenderQueueFullError(f"{self.in_flight} cards are already being rendered, try again later")
+            self.in_flight += 1
+            self.submitted += 1
+        try:
+            future = self._executor.submit(render_card, recipe)
+        except Exception:
+            self._done(None)
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future: Optional[Future]) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            if future is None or future.cancelled() or future.exception() is not None:
+                self.failed += 1
+
+    def render(self, recipe: RenderRecipe) -> dict:
+        """Render a card in a worker, waiting for it."""
+        return self.submit(recipe).result()
+
+    async def arender(self, recipe: RenderRecipe) -> dict:
+        """Render a card in a worker without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(recipe))
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_depth": self.queue_depth,
+                "in_flight": self.in_flight,
+                "submitted": self.submitted,
+                "failed": self.failed,
+                "rejected": self.rejected,
+            }
@@ -1,31 +1,54 @@
 from typing import Optional, List
 from langchain_core.messages import AnyMessage
-from pydantic import BaseModel
+from PIL import Image
+from pydantic import BaseModel, ConfigDict
 
 class State(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
     # Conversation and feedback
     messages: List[AnyMessage] = []
 
     greeting_text_instructions: str = None
+    # Skip the LLM response cache lookup
+    no_cache: bool = False
+    # Number of separately cached LLM replies to pick from
+    variety: int = 1
+    # Stream the title and greeting tokens to the custom stream mode of the graph
+    stream: bool = False
 
     # Image info
     background_path: Optional[str] = None
     foreground_path: Optional[str] = None
     merged_image_path: Optional[str] = None
+    # In-memory merged card handed from merge_node to add_text_node
+    merged_image: Optional[Image.Image] = None
+    # Merge left to a render worker, which renders it with the text in add_text_node
+    render_deferred: bool = False
     dominant_color: Optional[str] = None
     card_path: Optional[str] = None
+    # Card encoding: 'png', 'webp' or 'jpeg', defaults to CARD_FORMAT
+    output_format: Optional[str] = None
+    # Render at PREVIEW_HEIGHT instead of the full card size
+    preview: bool = False
     card_type: Optional[str] = None
     
     # Text info
     greeting_text: Optional[str] = None
     title: Optional[str] = None
     font_color: Optional[str] = None
+    # Suggested font color (FONT_COLOR_LLM), adjusted for contrast when font_color is picked
+    font_color_hint: Optional[str] = None
+    # WCAG contrast ratio of a picked font color against the pixels behind the text
+    font_contrast: Optional[float] = None
     font_path: Optional[str] = None
     font_size: int = 80
     title_font_path: Optional[str] = None
     title_font_size: int = 100
 
     # Merge params
+    # 'blend' for uploaded foregrounds, 'template' for template composites
+    merge_mode: Optional[str] = None
     merge_position: str = "top"
     merge_margin_ratio: float = 0.02
     aspect_ratio: float = 3/4
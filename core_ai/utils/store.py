@@ -0,0 +1,331 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# An empty METADATA_DB_PATH (as in .env.example) means the default, not an in-memory database
+DEFAULT_DB_PATH = os.getenv("METADATA_DB_PATH") or "data/metadata.db"
+DEFAULT_TEMPLATE_JSON = "static/images/template_metadata.json"
+DEFAULT_BACKGROUND_JSON = "static/images/background_metadata.json"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS templates (
+    id INTEGER PRIMARY KEY,
+    foreground_path TEXT NOT NULL,
+    background_path TEXT NOT NULL,
+    aspect_ratio REAL NOT NULL,
+    card_type TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_templates_key
+    ON templates (foreground_path, background_path, aspect_ratio, card_type);
+CREATE INDEX IF NOT EXISTS ix_templates_type
+    ON templates (card_type, aspect_ratio);
+CREATE TABLE IF NOT EXISTS backgrounds (
+    id INTEGER PRIMARY KEY,
+    background_path TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_backgrounds_path
+    ON backgrounds (background_path);
+CREATE TABLE IF NOT EXISTS file_hashes (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    content_hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS color_cache (
+    content_hash TEXT NOT NULL,
+    variant TEXT NOT NULL,
+    color TEXT NOT NULL,
+    palette TEXT NOT NULL,
+    PRIMARY KEY (content_hash, variant)
+);
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', '0');
+"""
+
+
+class MetadataStore:
+    """
+    SQLite (WAL mode) storage for template and background metadata.
+
+    Every template or background write runs in its own transaction and bumps a
+    version counter so in-memory indexes can cheaply detect changes made by any
+    process. Cache tables (file hashes, colors, LLM responses) do not bump the version.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self, bump_version: bool = True):
+        """Run a block in an immediate (write-locked) transaction, optionally bumping the version."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            if bump_version:
+                conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'version'")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def version(self) -> int:
+        """Return a counter that changes whenever the metadata is written."""
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return int(row[0]) if row else 0
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self._connect().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    # Templates
+
+    def get_template(self, foreground_path: str, background_path: str, aspect_ratio: float, card_type: str) -> Optional[dict]:
+        row = self._connect().execute(
+            "SELECT data FROM templates WHERE foreground_path = ? AND background_path = ? AND aspect_ratio = ? AND card_type = ?",
+            (foreground_path, background_path, aspect_ratio, card_type),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_templates(self, card_type: Optional[str] = None, aspect_ratio: Optional[float] = None) -> List[dict]:
+        query = "SELECT data FROM templates"
+        clauses, params = [], []
+        if card_type is not None:
+            clauses.append("card_type = ?")
+            params.append(card_type)
+        if aspect_ratio is not None:
+            clauses.append("aspect_ratio = ?")
+            params.append(aspect_ratio)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY id"
+        return [json.loads(row[0]) for row in self._connect().execute(query, params)]
+
+    def upsert_templates(self, items: Iterable[dict], replace: bool = False) -> List[dict]:
+        """
+        Insert templates in a single transaction.
+
+        Args:
+            items (Iterable[dict]): Template metadata dictionaries.
+            replace (bool): Overwrite existing rows instead of keeping them.
+        Returns:
+            List[dict]: The stored metadata for each item, which is the existing
+                row when the template was already present and replace is False.
+        """
+        conflict = "DO UPDATE SET data = excluded.data" if replace else "DO NOTHING"
+        stored = []
+        with self.transaction() as conn:
+            for item in items:
+                key = (item["foreground_path"], item["background_path"], item["aspect_ratio"], item["card_type"])
+                conn.execute(
+                    "INSERT INTO templates (foreground_path, background_path, aspect_ratio, card_type, data) VALUES (?, ?, ?, ?, ?) "
+                    f"ON CONFLICT (foreground_path, background_path, aspect_ratio, card_type) {conflict}",
+                    (*key, json.dumps(item, ensure_ascii=False)),
+                )
+                row = conn.execute(
+                    "SELECT data FROM templates WHERE foreground_path = ? AND background_path = ? AND aspect_ratio = ? AND card_type = ?",
+                    key,
+                ).fetchone()
+                stored.append(json.loads(row[0]))
+        return stored
+
+    def upsert_template(self, item: dict, replace: bool = False) -> dict:
+        return self.upsert_templates([item], replace=replace)[0]
+
+    def update_template_fields(self, items: Iterable[dict], fields: Iterable[str]) -> int:
+        """
+        Copy some fields of templates into their stored rows in a single transaction,
+        keeping the rest of each row as stored. Templates no longer stored are skipped.
+
+        Does not bump the version: only for derived fields (e.g. thumbnails) that
+        in-memory indexes do not depend on.
+        Returns:
+            int: The number of rows updated.
+        """
+        fields = tuple(fields)
+        updated = 0
+        with self.transaction(bump_version=False) as conn:
+            for item in items:
+                key = (item["foreground_path"], item["background_path"], item["aspect_ratio"], item["card_type"])
+                row = conn.execute(
+                    "SELECT id, data FROM templates WHERE foreground_path = ? AND background_path = ? AND aspect_ratio = ? AND card_type = ?",
+                    key,
+                ).fetchone()
+                if row is None:
+                    continue
+                data = json.loads(row[1])
+                data.update({field: item[field] for field in fields if field in item})
+                conn.execute("UPDATE templates SET data = ? WHERE id = ?", (json.dumps(data, ensure_ascii=False), row[0]))
+                updated += 1
+        return updated
+
+    # Backgrounds
+
+    def get_background(self, background_path: str) -> Optional[dict]:
+        row = self._connect().execute(
+            "SELECT data FROM backgrounds WHERE background_path = ?", (background_path,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_backgrounds(self) -> List[dict]:
+        return [json.loads(row[0]) for row in self._connect().execute("SELECT data FROM backgrounds ORDER BY id")]
+
+    def upsert_backgrounds(self, items: Iterable[dict], replace: bool = False) -> List[dict]:
+        """Insert backgrounds in a single transaction, see upsert_templates."""
+        conflict = "DO UPDATE SET data = excluded.data" if replace else "DO NOTHING"
+        stored = []
+        with self.transaction() as conn:
+            for item in items:
+                conn.execute(
+                    f"INSERT INTO backgrounds (background_path, data) VALUES (?, ?) ON CONFLICT (background_path) {conflict}",
+                    (item["background_path"], json.dumps(item, ensure_ascii=False)),
+                )
+                row = conn.execute(
+                    "SELECT data FROM backgrounds WHERE background_path = ?", (item["background_path"],)
+                ).fetchone()
+                stored.append(json.loads(row[0]))
+        return stored
+
+    def upsert_background(self, item: dict, replace: bool = False) -> dict:
+        return self.upsert_backgrounds([item], replace=replace)[0]
+
+    # Caches
+
+    def get_file_hash(self, path: str, mtime_ns: int, size: int) -> Optional[str]:
+        """Return the recorded content hash of a file if its mtime and size are unchanged."""
+        row = self._connect().execute(
+            "SELECT content_hash FROM file_hashes WHERE path = ? AND mtime_ns = ? AND size = ?",
+            (path, mtime_ns, size),
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_file_hash(self, path: str, mtime_ns: int, size: int, content_hash: str) -> None:
+        with self.transaction(bump_version=False) as conn:
+            conn.execute(
+                "INSERT INTO file_hashes (path, mtime_ns, size, content_hash) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (path) DO UPDATE SET mtime_ns = excluded.mtime_ns, size = excluded.size, content_hash = excluded.content_hash",
+                (path, mtime_ns, size, content_hash),
+            )
+
+    def get_colors(self, content_hash: str, variant: str) -> Optional[dict]:
+        """Return the cached dominant color and palette of an image content hash for an extractor variant."""
+        row = self._connect().execute(
+            "SELECT color, palette FROM color_cache WHERE content_hash = ? AND variant = ?",
+            (content_hash, variant),
+        ).fetchone()
+        return {"color": row[0], "palette": json.loads(row[1])} if row else None
+
+    def set_colors(self, content_hash: str, variant: str, color: str, palette: List[str]) -> None:
+        with self.transaction(bump_version=False) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO color_cache (content_hash, variant, color, palette) VALUES (?, ?, ?, ?)",
+                (content_hash, variant, color, json.dumps(palette)),
+            )
+
+    def get_llm_response(self, key: str, min_created_at: float = 0) -> Optional[str]:
+        """Return a cached LLM response stored at or after min_created_at."""
+        row = self._connect().execute(
+            "SELECT response FROM llm_cache WHERE key = ? AND created_at >= ?",
+            (key, min_created_at),
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_llm_response(self, key: str, response: str, created_at: float) -> None:
+        with self.transaction(bump_version=False) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, response, created_at) VALUES (?, ?, ?)",
+                (key, response, created_at),
+            )
+
+    def purge_llm_responses(self, before: float) -> int:
+        """Delete LLM responses stored before a timestamp and return how many were deleted."""
+        with self.transaction(bump_version=False) as conn:
+            return conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (before,)).rowcount
+
+    # Migration
+
+    def migrate_from_json(self, template_json: str = DEFAULT_TEMPLATE_JSON, background_json: str = DEFAULT_BACKGROUND_JSON) -> bool:
+        """
+        Import the legacy JSON metadata files once.
+
+        Returns:
+            bool: True if the import ran, False if it had already been done.
+        """
+        if self.get_meta("json_migrated"):
+            return False
+        with self.transaction() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+                return False
+            counts = {}
+            for table, path, columns in (
+                ("templates", template_json, ("foreground_path", "background_path", "aspect_ratio", "card_type")),
+                ("backgrounds", background_json, ("background_path",)),
+            ):
+                data = _read_json_list(path)
+                placeholders = ", ".join("?" for _ in columns)
+                conn.executemany(
+                    f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}, data) VALUES ({placeholders}, ?)",
+                    [(*(item[c] for c in columns), json.dumps(item, ensure_ascii=False)) for item in data],
+                )
+                counts[table] = len(data)
+            conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', '1')")
+        logger.info(f"Migrated JSON metadata into {self.db_path}: {counts}")
+        return True
+
+
+def _read_json_list(path: str) -> list:
+    if not path or not os.path.exists(path) or os.path.getsize(path) == 0:
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+_stores: Dict[str, MetadataStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_metadata_store(db_path: Optional[str] = None) -> MetadataStore:
+    """
+    Return the process-wide store for a database file, importing the legacy
+    JSON metadata on first use.
+    """
+    key = os.path.abspath(db_path or DEFAULT_DB_PATH)
+    store = _stores.get(key)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(key)
+            if store is None:
+                store = MetadataStore(db_path or DEFAULT_DB_PATH)
+                store.migrate_from_json()
+                _stores[key] = store
+    return store
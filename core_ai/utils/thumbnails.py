@@ -0,0 +1,110 @@
+import base64
+import hashlib
+import io
+import logging
+import os
+import uuid
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence
+
+from PIL import Image
+
+from .assets import open_image
+from .encoding import save_image
+from .store import get_metadata_store
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_DIR = os.getenv("THUMBNAIL_DIR", "static/images/thumbnails")
+THUMBNAIL_WIDTHS = tuple(int(w) for w in os.getenv("THUMBNAIL_WIDTHS", "160,320,640").split(","))
+PLACEHOLDER_WIDTH = 16
+# Template metadata fields written by make_thumbnails
+THUMBNAIL_FIELDS = ("thumbnails", "placeholder", "placeholder_color")
+
+
+def thumbnail_path(image_path: str, width: int, thumbnail_dir: str = THUMBNAIL_DIR) -> str:
+    """Path of the thumbnail of an image at a width, e.g. static/images/thumbnails/3f2a..._320.webp."""
+    digest = hashlib.sha1(Path(image_path).as_posix().encode()).hexdigest()[:20]
+    return Path(thumbnail_dir, f"{digest}_{width}.webp").as_posix()
+
+
+def _placeholder(img: Image.Image) -> dict:
+    """A one-pixel average color and a tiny WebP data URI of an image."""
+    color = img.resize((1, 1), Image.BOX).getpixel((0, 0))
+    tiny = img.resize((PLACEHOLDER_WIDTH, max(1, round(img.height * PLACEHOLDER_WIDTH / img.width))), Image.BOX)
+    buffer = io.BytesIO()
+    save_image(tiny, buffer, 'webp', quality=30, method=6)
+    return {
+        "placeholder_color": '#{:02x}{:02x}{:02x}'.format(*color[:3]),
+        "placeholder": "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode(),
+    }
+
+
+def make_thumbnails(image_path: str, widths: Sequence[int] = THUMBNAIL_WIDTHS, thumbnail_dir: str = THUMBNAIL_DIR) -> dict:
+    """
+    Write WebP thumbnails of an image at fixed widths and compute its placeholder.
+
+    Widths at or above the image width are skipped. Each thumbnail is
+    downscaled from the next larger one, so the image is decoded once.
+    Returns:
+        dict: thumbnails ({width: path}), placeholder (data URI) and placeholder_color (hex).
+    """
+    with open_image(image_path) as img:
+        img.draft('RGB', (max(widths), max(widths) * img.height // img.width))
+        current = img.convert('RGB')
+    thumbnails = {}
+    os.makedirs(thumbnail_dir, exist_ok=True)
+    for width in sorted(widths, reverse=True):
+        if width >= current.width:
+            continue
+        current = current.resize((width, max(1, round(current.height * width / current.width))), Image.LANCZOS)
+        path = thumbnail_path(image_path, width, thumbnail_dir)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        save_image(current, tmp_path, 'webp')
+        os.replace(tmp_path, path)
+        thumbnails[str(width)] = path
+    return {"thumbnails": dict(reversed(thumbnails.items())), **_placeholder(current)}
+
+
+def remove_thumbnails(item: dict) -> None:
+    """Delete the thumbnail files of a template."""
+    for path in (item.get("thumbnails") or {}).values():
+        Path(path).unlink(missing_ok=True)
+
+
+def _has_thumbnails(item: dict) -> bool:
+    thumbnails = item.get("thumbnails")
+    return thumbnails is not None and "placeholder" in item and all(os.path.exists(p) for p in thumbnails.values())
+
+
+def ensure_thumbnails(items: Iterable[dict], db_path: Optional[str] = None) -> List[dict]:
+    """
+    Return templates with thumbnails, generating and storing the missing ones.
+
+    Templates ingested before thumbnails existed (or whose files were
+    deleted) get them on first listing; only their thumbnail fields are
+    written back, in one batch and without bumping the store version, so
+    in-memory catalogs keep their snapshot. Items of such a snapshot are
+    looked up in the store first, in case their thumbnails were made since.
+    The input dicts are not modified.
+    """
+    store = get_metadata_store(db_path)
+    result, updated = [], []
+    for item in items:
+        if _has_thumbnails(item):
+            result.append(item)
+            continue
+        stored = store.get_template(item["foreground_path"], item["background_path"], item["aspect_ratio"], item["card_type"])
+        if stored is not None and _has_thumbnails(stored):
+            result.append({**item, **{field: stored[field] for field in THUMBNAIL_FIELDS if field in stored}})
+            continue
+        try:
+            item = {**item, **make_thumbnails(item["merged_image_path"])}
+        except Exception as e:
+            logger.warning(f"Error creating thumbnails for {item.get('merged_image_path')}: {e}")
+        else:
+            updated.append(item)
+        result.append(item)
+    if updated:
+        store.update_template_fields(updated, THUMBNAIL_FIELDS)
+    return result
@@ -1,42 +1,235 @@
-import colorsys
-import json
+import hashlib
 import logging
 import math
 import os
 import random
-from typing import Optional
+import uuid
+from functools import lru_cache
+import numpy as np
+from pathlib import Path
+from typing import List, Optional, Tuple
 from PIL import ImageDraw, ImageFont, Image, ImageDraw, ImageFont, ImageChops
 from pilmoji import Pilmoji
-from pilmoji.source import GoogleEmojiSource
+from pilmoji.helpers import EMOJI_REGEX
 from colorthief import ColorThief
 
+from .assets import composite_cache, get_image_size, get_mtime, load_background, load_resized, open_image
+from .catalog import get_template_catalog
+from .color_index import get_background_color_index
+from .contrast import pick_font_color
+from .emoji_source import get_emoji_source
+from .encoding import save_image
+from .store import get_metadata_store
+
 logger = logging.getLogger(__name__)
 
-def get_dominant_color(image_path: str, quality=100) -> str:
+COMPOSITE_DIR = "static/images/composites"
+# Cards are laid out for STANDARD_HEIGHT; previews render the same layout at PREVIEW_HEIGHT
+STANDARD_HEIGHT = 1600
+PREVIEW_HEIGHT = int(os.getenv("PREVIEW_HEIGHT", "480"))
+PALETTE_SIZE = 5
+COLOR_EXTRACTORS = ('colorthief', 'numpy')
+COLOR_SAMPLE_SIZE = 256
+
+def get_color_extractor() -> str:
+    """Return the configured color extractor, 'colorthief' (default) or 'numpy'."""
+    extractor = os.getenv("COLOR_EXTRACTOR", "colorthief").lower()
+    if extractor not in COLOR_EXTRACTORS:
+        raise ValueError(f"COLOR_EXTRACTOR must be one of {COLOR_EXTRACTORS}")
+    return extractor
+
+def get_dominant_color(image_path: str, quality=100, extractor: Optional[str] = None) -> str:
+    return get_palette(image_path, quality=quality, extractor=extractor)[0]
+
+def get_palette(image_path: str, quality=100, extractor: Optional[str] = None) -> List[str]:
+    """
+    Extract a small palette of hex colors, dominant color first.
+
+    Args:
+        image_path (str): Path to the image.
+        quality (int): ColorThief sampling step, ignored by the numpy extractor.
+        extractor (str): 'colorthief' or 'numpy', defaults to COLOR_EXTRACTOR.
+    """
     if not os.path.exists(image_path):
         raise FileNotFoundError(f"Image file not found: {image_path}")
-    color_thief = ColorThief(image_path)
-    dominant_color = color_thief.get_color(quality=quality)
-    return '#{:02x}{:02x}{:02x}'.format(*dominant_color)
+    extractor = extractor or get_color_extractor()
+    if extractor == 'numpy':
+        palette = _quantize_palette(image_path)
+    else:
+        color_thief = ColorThief(image_path)
+        palette = color_thief.get_palette(color_count=PALETTE_SIZE, quality=quality)
+    return ['#{:02x}{:02x}{:02x}'.format(*color) for color in palette]
 
-def merge_foreground_background_with_blending(
+def _quantize_palette(image_path: str, sample_size: int = COLOR_SAMPLE_SIZE) -> List[tuple]:
+    """
+    Fast palette extraction: decode close to sample_size (JPEG draft mode) and
+    subsample with nearest-neighbour resizing, drop transparent and near-white
+    pixels like ColorThief, then median-cut quantize with Pillow and order the
+    colors by population.
+    """
+    with open_image(image_path) as img:
+        img.draft('RGB', (sample_size, sample_size))
+        scale = min(1.0, sample_size / min(img.width, img.height))
+        if scale < 1.0:
+            img = img.resize((max(1, int(img.width * scale)), max(1, int(img.height * scale))), Image.NEAREST)
+        pixels = np.asarray(img.convert('RGBA')).reshape(-1, 4)
+
+    mask = (pixels[:, 3] >= 125) & ~np.all(pixels[:, :3] > 250, axis=1)
+    valid = pixels[mask, :3]
+    if len(valid) == 0:
+        valid = pixels[:, :3]
+    sample = Image.fromarray(np.ascontiguousarray(valid).reshape(1, -1, 3), 'RGB')
+    quantized = sample.quantize(colors=PALETTE_SIZE, method=Image.Quantize.MEDIANCUT)
+    labels = np.asarray(quantized).ravel()
+    palette = np.array(quantized.getpalette()[:3 * (labels.max() + 1)]).reshape(-1, 3)
+
+    counts = np.bincount(labels, minlength=len(palette))
+    order = [i for i in np.argsort(-counts, kind='stable') if counts[i] > 0]
+    return [tuple(int(v) for v in palette[i]) for i in order]
+
+def get_file_hash(file_path: str, db_path: Optional[str] = None) -> str:
+    """
+    Get the SHA-256 content hash of a file, reusing the recorded hash while its mtime and size are unchanged.
+    """
+    stat = os.stat(file_path)
+    store = get_metadata_store(db_path)
+    key = Path(file_path).as_posix()
+    content_hash = store.get_file_hash(key, stat.st_mtime_ns, stat.st_size)
+    if content_hash:
+        return content_hash
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    content_hash = digest.hexdigest()
+    store.set_file_hash(key, stat.st_mtime_ns, stat.st_size, content_hash)
+    return content_hash
+
+def get_image_colors(image_path: str, quality=100, db_path: Optional[str] = None) -> dict:
+    """
+    Get the dominant color and palette of an image, cached by file content hash.
+
+    Args:
+        image_path (str): Path to the image.
+        quality (int): ColorThief sampling step, higher is faster.
+        db_path (str): Path to the metadata database, defaults to METADATA_DB_PATH.
+    Returns:
+        dict: {"color": hex color, "palette": list of hex colors}
+    """
+    extractor = get_color_extractor()
+    if not os.path.exists(image_path):
+        raise FileNotFoundError(f"Image file not found: {image_path}")
+    store = get_metadata_store(db_path)
+    content_hash = get_file_hash(image_path, db_path)
+    variant = f"colorthief:q{quality}" if extractor == 'colorthief' else f"numpy:s{COLOR_SAMPLE_SIZE}"
+    cached = store.get_colors(content_hash, variant)
+    if cached:
+        return cached
+    palette = get_palette(image_path, quality=quality, extractor=extractor)
+    store.set_colors(content_hash, variant, palette[0], palette)
+    return {"color": palette[0], "palette": palette}
+
+def get_dominant_color_cached(image_path: str, quality=100, db_path: Optional[str] = None) -> str:
+    return get_image_colors(image_path, quality=quality, db_path=db_path)["color"]
+
+def _paste_logo(image: Image.Image, logo_path: Optional[str], logo_scale: float) -> None:
+    """Paste the logo in the bottom-right corner, scaled to logo_scale of the image height."""
+    if not logo_path or not os.path.exists(logo_path):
+        return
+    width, height = image.size
+    logo_w, logo_h = get_image_size(logo_path)
+    new_logo_h = int(height * logo_scale)
+    new_logo_w = int(new_logo_h * logo_w / logo_h)
+    logo = load_resized(logo_path, (new_logo_w, new_logo_h))
+
+    logo_margin = int(height * 0.02)
+    logo_x = width - new_logo_w - logo_margin
+    logo_y = height - new_logo_h - logo_margin
+    image.paste(logo, (logo_x, logo_y), logo)
+
+@lru_cache(maxsize=256)
+def _blend_ramp(length: int, merge_position: str, blend_ratio: float, foreground_ratio: float, edge_only: bool) -> np.ndarray:
+    """
+    Build (and memoize) the 1-D alpha ramp along the blending axis of a foreground.
+    The returned array is shared and read-only.
+
+    'top'/'left' keep the start of the foreground opaque and fade towards the
+    center of the card, 'bottom'/'right' mirror that. When the foreground is
+    small (edge_only) only its inner edge is faded, otherwise it fades out
+    around foreground_ratio of its length.
+    """
+    pos = np.arange(length, dtype=np.float64)
+    blend_len = int(length * blend_ratio)
+    fade_from_start = merge_position in ('bottom', 'right')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if edge_only:
+            if fade_from_start:
+                ramp = np.where(pos < blend_len, 255 * pos / blend_len, 255)
+            else:
+                ramp = np.where(pos < length - blend_len, 255, 255 * (length - pos) / blend_len)
+        elif fade_from_start:
+            blend_start = int(length * (1 - foreground_ratio))
+            ramp = np.where(pos < blend_start, 0,
+                            np.where(pos < blend_start + blend_len, 255 * (pos - blend_start) / blend_len, 255))
+        else:
+            blend_start = int(length * foreground_ratio)
+            ramp = np.where(pos > blend_start, 0,
+                            np.where(pos > blend_start - blend_len, 255 * (blend_start - pos) / blend_len, 255))
+    ramp = ramp.astype(np.uint8)
+    ramp.flags.writeable = False
+    return ramp
+
+def _blend_mask(size: tuple, merge_position: str, blend_ratio: float, foreground_ratio: float, edge_only: bool) -> Image.Image:
+    """
+    Build the 'L' alpha mask of a blended foreground by broadcasting its ramp.
+    Only the ramp is memoized: a full mask takes several MB, outside the asset cache budget.
+    """
+    width, height = size
+    if merge_position in ('top', 'bottom'):
+        ramp = _blend_ramp(height, merge_position, blend_ratio, foreground_ratio, edge_only)
+        mask = np.broadcast_to(ramp[:, None], (height, width))
+    else:
+        ramp = _blend_ramp(width, merge_position, blend_ratio, foreground_ratio, edge_only)
+        mask = np.broadcast_to(ramp[None, :], (height, width))
+    return Image.fromarray(np.ascontiguousarray(mask), 'L')
+
+def _blend_foreground_box(fg_size: Tuple[int, int], merge_position: str, size: Tuple[int, int]) -> Tuple[int, int, int, int, bool]:
+    """
+    Size and position of a blended foreground on a card of size.
+    Returns:
+        Tuple[int, int, int, int, bool]: width, height, x, y and whether only its inner edge is faded.
+    """
+    fg_aspect = fg_size[0] / fg_size[1]
+    standard_width, standard_height = size
+    if merge_position in ['top', 'bottom']:
+        fg_width = standard_width
+        fg_height = int(fg_width / fg_aspect)
+        fg_y = 0 if merge_position == 'top' else standard_height - fg_height
+        return fg_width, fg_height, 0, fg_y, fg_height <= standard_height * 2/3
+    if merge_position in ['left', 'right']:
+        fg_height = standard_height
+        fg_width = int(fg_aspect * fg_height)
+        fg_x = 0 if merge_position == 'left' else standard_width - fg_width
+        return fg_width, fg_height, fg_x, 0, fg_width <= standard_width * 2/3
+    raise ValueError("merge_position must be one of 'top', 'bottom', 'left', 'right'")
+
+def render_foreground_background_with_blending(
     foreground_path: str,
     background_path: str,
-    output_path: str,
     merge_position: str = 'top',
     aspect_ratio: float = 3/4,
     foreground_ratio: float = 1/2,
     blend_ratio: float = 0.4,
     logo_path: str = "static/images/Logo-MISA.webp",
     logo_scale: float = 0.03,
-) -> dict:
+    height: int = STANDARD_HEIGHT,
+) -> Tuple[Image.Image, dict]:
     """
-    Merge a foreground image onto a background image with blending effects.
+    Merge a foreground image onto a background image with blending effects, in memory.
     
     Args:
         foreground_path (str): Path to the foreground image.
         background_path (str): Path to the background image.
-        output_path (str): Path to save the merged image.
         merge_position (str): Position to place the foreground image ('top', 'bottom', 'left', 'right').
         margin_ratio (float): Margin ratio relative to the smaller dimension of the background.
         aspect_ratio (float): Aspect ratio of the final image (width/height).
@@ -44,323 +237,374 @@ def merge_foreground_background_with_blending(
         blend_ratio (float): Ratio for blending the foreground with the background.
         logo_path (str): Path to the logo image to be added.
         logo_scale (float): Scale factor for the logo relative to the final image size.
+        height (int): Height of the merged image in pixels, STANDARD_HEIGHT or lower for previews.
     Returns:
-        dict: Information about the merged image including paths and parameters.
+        Tuple[Image.Image, dict]: The merged RGB image and information about it
+            (merged_image_path is None until the image is saved).
     """
     if not os.path.exists(background_path):
         raise FileNotFoundError(f"Background file not found: {background_path}")
     if not os.path.exists(foreground_path):
         raise FileNotFoundError(f"Foreground file not found: {foreground_path}")
 
-    standard_height = 1600
+    standard_height = height
     standard_width = int(standard_height * aspect_ratio)
 
-    # Load and crop background
-    bg = Image.open(background_path).convert('RGB')
-    bg_w, bg_h = bg.size
-    if bg_w / bg_h > aspect_ratio:
-        new_w = int(bg_h * aspect_ratio)
-        left = (bg_w - new_w) // 2
-        bg = bg.crop((left, 0, left + new_w, bg_h))
-    else:
-        new_h = int(bg_w / aspect_ratio)
-        top = (bg_h - new_h) // 2
-        bg = bg.crop((0, top, bg_w, top + new_h))
-    bg = bg.resize((standard_width, standard_height), Image.LANCZOS)
+    # Load cropped and resized background
+    bg = load_background(background_path, aspect_ratio, (standard_width, standard_height))
 
-    # Load foreground
-    fg = Image.open(foreground_path).convert('RGBA')
-    fg_aspect = fg.width / fg.height
-
-    if merge_position in ['top', 'bottom']:
-        fg_width = standard_width
-        fg_height = int(fg_width / fg_aspect)
-        fg = fg.resize((fg_width, fg_height), Image.LANCZOS)
-        fg_x = 0
-        fg_y = 0 if merge_position == 'top' else standard_height - fg_height
-
-        gradient = Image.new('L', (1, fg_height), color=0x00)
-        blend_len = int(fg_height * blend_ratio)
-        if fg_height <= standard_height * 2/3:
-            if merge_position == 'top':
-                # Blend only at the bottom edge
-                blend_start = fg_height - blend_len
-                for y in range(fg_height):
-                    if y < blend_start:
-                        alpha = 255
-                    else:
-                        alpha = int(255 * (fg_height - y) / blend_len)
-                    gradient.putpixel((0, y), alpha)
-                logger.info("Blending at bottom edge")
-            else:  # 'bottom'
-                # Blend only at the top edge
-                for y in range(fg_height):
-                    if y < blend_len:
-                        alpha = int(255 * y / blend_len)
-                    else:
-                        alpha = 255
-                    gradient.putpixel((0, y), alpha)
-        else:
-            if merge_position == 'bottom':
-                blend_start = int(fg_height * (1 - foreground_ratio))
-                for y in range(fg_height):
-                    if y < blend_start:
-                        alpha = 0
-                    elif y < blend_start + blend_len:
-                        alpha = int(255 * (y - blend_start) / blend_len)
-                    else:
-                        alpha = 255
-                    gradient.putpixel((0, y), alpha)
-
-            else:  # 'top'
-                blend_start = int(fg_height * foreground_ratio)
-                for y in range(fg_height):
-                    if y > blend_start:
-                        alpha = 0
-                    elif y > blend_start - blend_len:
-                        alpha = int(255 * (blend_start - y) / blend_len)
-                    else:
-                        alpha = 255
-                    gradient.putpixel((0, y), alpha)
-
-        alpha_mask = gradient.resize((fg_width, fg_height))
-
-    elif merge_position in ['left', 'right']:
-        fg_height = standard_height
-        fg_width = int(fg_aspect * fg_height)
-        fg = fg.resize((fg_width, fg_height), Image.LANCZOS)
-        fg_y = 0
-        fg_x = 0 if merge_position == 'left' else standard_width - fg_width
-
-        gradient = Image.new('L', (fg_width, 1), color=0x00)
-        blend_len = int(fg_width * blend_ratio)
-
-        if fg_width <= standard_width * 2/3:
-            if merge_position == 'left':
-                # Blend only at the right edge
-                blend_start = fg_width - blend_len
-                for x in range(fg_width):
-                    if x < blend_start:
-                        alpha = 255
-                    else:
-                        alpha = int(255 * (fg_width - x) / blend_len)
-                    gradient.putpixel((x, 0), alpha)
-            else:  # 'right'
-                # Blend only at the left edge
-                for x in range(fg_width):
-                    if x < blend_len:
-                        alpha = int(255 * x / blend_len)
-                    else:
-                        alpha = 255
-                    gradient.putpixel((x, 0), alpha)
-                logger.info("Blending at right edge")
-        else:
-            if merge_position == 'right':
-                blend_start = int(fg_width * (1 - foreground_ratio))
-                for x in range(fg_width):
-                    if x < blend_start:
-                        alpha = 0
-                    elif x < blend_start + blend_len:
-                        alpha = int(255 * (x - blend_start) / blend_len)
-                    else:
-                        alpha = 255
-                    gradient.putpixel((x, 0), alpha)
-
-            else:  # 'left'
-                blend_start = int(fg_width * foreground_ratio)
-                for x in range(fg_width):
-                    if x > blend_start:
-                        alpha = 0
-                    elif x > blend_start - blend_len:
-                        alpha = int(255 * (blend_start - x) / blend_len)
-                    else:
-                        alpha = 255
-                    gradient.putpixel((x, 0), alpha)
-
-        alpha_mask = gradient.resize((fg_width, fg_height))
-
-    else:
-        raise ValueError("merge_position must be one of 'top', 'bottom', 'left', 'right'")
+    # Foreground size from its header, the pixels come resized from the asset cache
+    fg_width, fg_height, fg_x, fg_y, edge_only = _blend_foreground_box(
+        get_image_size(foreground_path), merge_position, (standard_width, standard_height))
+    fg = load_resized(foreground_path, (fg_width, fg_height))
 
     # Apply alpha mask
-    r, g, b, a = fg.split()
-    a = ImageChops.multiply(a, alpha_mask)
-    fg = Image.merge('RGBA', (r, g, b, a))
+    alpha_mask = _blend_mask((fg_width, fg_height), merge_position, blend_ratio, foreground_ratio, edge_only)
+    fg.putalpha(ImageChops.multiply(fg.getchannel('A'), alpha_mask))
 
     # Paste onto background
-    result = bg.copy()
+    result = bg
     result.paste(fg, (fg_x, fg_y), fg)
 
     # Add logo if exists
-    if logo_path and os.path.exists(logo_path):
-        logo = Image.open(logo_path).convert("RGBA")
-        logo_h = int(standard_height * logo_scale)
-        logo_ratio = logo.width / logo.height
-        logo_w = int(logo_h * logo_ratio)
-        logo = logo.resize((logo_w, logo_h), Image.LANCZOS)
-
-        logo_margin = int(standard_height * 0.02)
-        logo_x = standard_width - logo_w - logo_margin
-        logo_y = standard_height - logo_h - logo_margin
-        result.paste(logo, (logo_x, logo_y), logo)
-        logo.close()
-
-    result.save(output_path)
-    result.close()
-    bg.close()
+    _paste_logo(result, logo_path, logo_scale)
     fg.close()
 
-    return {
+    return result, {
         "foreground_path": foreground_path,
         "background_path": background_path,
-        "merged_image_path": output_path,
+        "merged_image_path": None,
         "aspect_ratio": aspect_ratio,
         "merge_position": merge_position,
         "merge_foreground_ratio": foreground_ratio,
         "blend_ratio": blend_ratio,
     }
 
-
-def merge_foreground_background(
+def merge_foreground_background_with_blending(
     foreground_path: str,
     background_path: str,
     output_path: str,
+    **kwargs,
+) -> dict:
+    """
+    Merge a foreground image onto a background image with blending effects and save it to output_path,
+    encoded in the format of its extension.
+    See render_foreground_background_with_blending for the parameters.
+    """
+    result, info = render_foreground_background_with_blending(foreground_path, background_path, **kwargs)
+    save_image(result, output_path)
+    result.close()
+    info["merged_image_path"] = output_path
+    return info
+
+
+def _template_foreground_box(fg_size: Tuple[int, int], merge_position: str, size: Tuple[int, int],
+                             margin_ratio: float, foreground_ratio: float) -> Tuple[int, int, int, int]:
+    """
+    Size and position of a template foreground fitted in foreground_ratio of a card of size, within its margins.
+    Returns:
+        Tuple[int, int, int, int]: width, height, x and y.
+    """
+    bg_w, bg_h = size
+    margin = int(min(bg_w, bg_h) * margin_ratio)
+    # Ensure foreground_ratio does not exceed 1
+    if foreground_ratio > 1:
+        foreground_ratio = 1.0
+    fg_ratio = fg_size[0] / fg_size[1]
+
+    # Always allow 4 positions: top, bottom, left, right
+    if merge_position in ['top', 'bottom']:
+        fg_max_h = int(bg_h * foreground_ratio) - margin
+        fg_max_w = bg_w - 2 * margin
+    elif merge_position in ['left', 'right']:
+        fg_max_w = int(bg_w * foreground_ratio) - margin
+        fg_max_h = bg_h - 2 * margin
+    else:
+        raise ValueError("position must be one of 'top', 'bottom', 'left', 'right'")
+    # Fit foreground inside fg_max_w x fg_max_h
+    if fg_max_w / fg_max_h > fg_ratio:
+        new_fg_h = fg_max_h
+        new_fg_w = int(fg_ratio * new_fg_h)
+    else:
+        new_fg_w = fg_max_w
+        new_fg_h = int(new_fg_w / fg_ratio)
+
+    if merge_position in ['top', 'bottom']:
+        x = margin + (fg_max_w - new_fg_w) // 2
+        y = margin if merge_position == 'top' else bg_h - new_fg_h - margin
+    else:
+        y = margin + (fg_max_h - new_fg_h) // 2
+        x = margin if merge_position == 'left' else bg_w - new_fg_w - margin
+    return new_fg_w, new_fg_h, x, y
+
+
+def render_foreground_background(
+    foreground_path: str,
+    background_path: str,
     merge_position: str = 'top',
     margin_ratio: float = 0.05,
     aspect_ratio: float = 3/4,
     foreground_ratio: float = 1/2,
     logo_path: str = "static/images/Logo-MISA.webp",
     logo_scale: float = 0.03,
-) -> dict:
+    height: int = STANDARD_HEIGHT,
+) -> Tuple[Image.Image, dict]:
     """
-    Merge a foreground image onto a background image with specified position.
+    Merge a foreground image onto a background image with specified position, in memory.
     
     Args:
         foreground_path (str): Path to the foreground image.
         background_path (str): Path to the background image.
-        output_path (str): Path to save the merged image.
         merge_position (str): Position to place the foreground image ('top', 'bottom', 'left', 'right').
         margin_ratio (float): Margin ratio relative to the smaller dimension of the background.
         aspect_ratio (float): Aspect ratio of the final image (width/height).
         foreground_ratio (float): Ratio of the foreground image size relative to the background.
         logo_path (str): Path to the logo image to be added.
         logo_scale (float): Scale factor for the logo relative to the final image size.
+        height (int): Height of the merged image in pixels, STANDARD_HEIGHT or lower for previews.
     Returns:
-        dict: Information about the merged image including paths and parameters.
+        Tuple[Image.Image, dict]: The merged RGB image and information about it
+            (merged_image_path is None until the image is saved).
     """
     if not os.path.exists(background_path):
         raise FileNotFoundError(f"Background file not found: {background_path}")
     if not os.path.exists(foreground_path):
         raise FileNotFoundError(f"Foreground file not found: {foreground_path}")
-    bg = Image.open(background_path).convert('RGB')
-    fg = Image.open(foreground_path).convert('RGBA')
-
     # Standard size
-    standard_height = 1600
+    standard_height = height
     standard_width = int(standard_height * aspect_ratio)
-    
-    # Crop background to target aspect ratio
-    target_ratio = aspect_ratio
-    bg_w, bg_h = bg.size
-    if bg_w / bg_h > target_ratio:
-        # Too wide, crop width
-        new_w = int(bg_h * target_ratio)
-        left = (bg_w - new_w) // 2
-        bg = bg.crop((left, 0, left + new_w, bg_h))
-    else:
-        # Too tall, crop height
-        new_h = int(bg_w / target_ratio)
-        top = (bg_h - new_h) // 2
-        bg = bg.crop((0, top, bg_w, top + new_h))
-    
-    # Resize background to standard size early
-    bg = bg.resize((standard_width, standard_height), Image.LANCZOS)
-    bg_w, bg_h = standard_width, standard_height
 
-    margin = int(min(bg_w, bg_h) * margin_ratio)
-    # Ensure foreground_ratio does not exceed 1
+    # Background cropped to the target aspect ratio and resized to standard size
+    bg = load_background(background_path, aspect_ratio, (standard_width, standard_height))
     if foreground_ratio > 1:
         foreground_ratio = 1.0
-    fg_w, fg_h = fg.size
-    fg_ratio = fg_w / fg_h
 
-    # Always allow 4 positions: top, bottom, left, right
-    if merge_position in ['top', 'bottom']:
-        fg_max_h = int(bg_h * foreground_ratio) - margin
-        fg_max_w = bg_w - 2 * margin
-        # Fit foreground inside fg_max_w x fg_max_h
-        if fg_max_w / fg_max_h > fg_ratio:
-            new_fg_h = fg_max_h
-            new_fg_w = int(fg_ratio * new_fg_h)
-        else:
-            new_fg_w = fg_max_w
-            new_fg_h = int(new_fg_w / fg_ratio)
-        fg = fg.resize((new_fg_w, new_fg_h), Image.LANCZOS)
-        x = margin + (fg_max_w - new_fg_w) // 2
-        if merge_position == 'top':
-            y = margin
-        else:
-            y = bg_h - new_fg_h - margin
-    elif merge_position in ['left', 'right']:
-        fg_max_w = int(bg_w * foreground_ratio) - margin
-        fg_max_h = bg_h - 2 * margin
-        if fg_max_w / fg_max_h > fg_ratio:
-            new_fg_h = fg_max_h
-            new_fg_w = int(fg_ratio * new_fg_h)
-        else:
-            new_fg_w = fg_max_w
-            new_fg_h = int(new_fg_w / fg_ratio)
-        fg = fg.resize((new_fg_w, new_fg_h), Image.LANCZOS)
-        y = margin + (fg_max_h - new_fg_h) // 2
-        if merge_position == 'left':
-            x = margin
-        else:
-            x = bg_w - new_fg_w - margin
-    else:
-        raise ValueError("position must be one of 'top', 'bottom', 'left', 'right'")
+    new_fg_w, new_fg_h, x, y = _template_foreground_box(
+        get_image_size(foreground_path), merge_position, (standard_width, standard_height), margin_ratio, foreground_ratio)
+    fg = load_resized(foreground_path, (new_fg_w, new_fg_h))
 
-    result = bg.copy()
+    result = bg
     result.paste(fg, (x, y), fg)
 
     # Add logo if exists
-    if logo_path and os.path.exists(logo_path):
-        logo = Image.open(logo_path).convert("RGBA")
-        logo_h = int(standard_height * logo_scale)
-        logo_ratio = logo.width / logo.height
-        logo_w = int(logo_h * logo_ratio)
-        logo = logo.resize((logo_w, logo_h), Image.LANCZOS)
-
-        logo_margin = int(standard_height * 0.02)
-        logo_x = standard_width - logo_w - logo_margin
-        logo_y = standard_height - logo_h - logo_margin
-        result.paste(logo, (logo_x, logo_y), logo)
-        logo.close()
+    _paste_logo(result, logo_path, logo_scale)
 
     if result.mode == "RGBA":
         result = result.convert("RGB")
-
-    result.save(output_path)
-
-    bg.close()
     fg.close()
-    result.close()
     
-    return {
+    return result, {
         "foreground_path": foreground_path,
         "background_path": background_path,
-        "merged_image_path": output_path,
+        "merged_image_path": None,
         "aspect_ratio": aspect_ratio,
         "merge_position": merge_position,
         "merge_margin_ratio": margin_ratio,
         "merge_foreground_ratio": foreground_ratio,
     }
 
-def add_text_to_image(
-    image_path: str,
-    text: str,
+def merge_foreground_background(
+    foreground_path: str,
+    background_path: str,
     output_path: str,
+    **kwargs,
+) -> dict:
+    """
+    Merge a foreground image onto a background image with specified position and save it to output_path,
+    encoded in the format of its extension.
+    See render_foreground_background for the parameters.
+    """
+    result, info = render_foreground_background(foreground_path, background_path, **kwargs)
+    save_image(result, output_path)
+    result.close()
+    info["merged_image_path"] = output_path
+    return info
+
+def _composite_key(foreground_path: str, background_path: str, merge_position: str, margin_ratio: float,
+                   aspect_ratio: float, foreground_ratio: float, height: int) -> tuple:
+    key = (
+        Path(foreground_path).as_posix(), get_mtime(foreground_path),
+        Path(background_path).as_posix(), get_mtime(background_path),
+        aspect_ratio, merge_position, foreground_ratio, margin_ratio,
+    )
+    if height != STANDARD_HEIGHT:
+        key += (height,)
+    return key
+
+def _composite_file(key: tuple, composite_dir: str = COMPOSITE_DIR) -> str:
+    return os.path.join(composite_dir, hashlib.sha1(repr(key).encode()).hexdigest() + ".png")
+
+def prefetch_foreground_background(
+    merge_mode: str,
+    foreground_path: str,
+    background_path: str,
+    merge_position: str = 'top',
+    margin_ratio: float = 0.05,
+    aspect_ratio: float = 3/4,
+    foreground_ratio: float = 1/2,
+    blend_ratio: float = 0.4,
+    composite_dir: str = COMPOSITE_DIR,
+    height: int = STANDARD_HEIGHT,
+) -> None:
+    """
+    Load what a merge needs into the caches ahead of it. In 'blend' mode that is
+    the resized background and foreground, without compositing them. A template variant is loaded (or rendered and stored) by
+    get_template_composite, since its composite is kept and reused anyway.
+    See render_foreground_background_with_blending and get_template_composite for the parameters.
+    """
+    if merge_mode != "blend":
+        get_template_composite(
+            foreground_path=foreground_path,
+            background_path=background_path,
+            merge_position=merge_position,
+            margin_ratio=margin_ratio,
+            aspect_ratio=aspect_ratio,
+            foreground_ratio=foreground_ratio,
+            composite_dir=composite_dir,
+            height=height,
+        ).close()
+        return
+    size = (int(height * aspect_ratio), height)
+    fg_width, fg_height, _, _, edge_only = _blend_foreground_box(get_image_size(foreground_path), merge_position, size)
+    load_background(background_path, aspect_ratio, size).close()
+    load_resized(foreground_path, (fg_width, fg_height)).close()
+
+def get_template_composite(
+    foreground_path: str,
+    background_path: str,
+    merge_position: str = 'top',
+    margin_ratio: float = 0.05,
+    aspect_ratio: float = 3/4,
+    foreground_ratio: float = 1/2,
+    composite_dir: str = COMPOSITE_DIR,
+    height: int = STANDARD_HEIGHT,
+) -> Image.Image:
+    """
+    Get the merged image of a template variant, rendering it at most once.
+
+    Variants are keyed by (foreground, background, their mtimes, aspect_ratio,
+    merge_position, foreground_ratio, margin_ratio, height) and cached in memory and
+    as PNG files in composite_dir, so other workers and restarts reuse them.
+    Returns:
+        Image.Image: A copy of the merged RGB image.
+    """
+    key = _composite_key(foreground_path, background_path, merge_position, margin_ratio, aspect_ratio, foreground_ratio, height)
+
+    def loader():
+        file_path = _composite_file(key, composite_dir)
+        if os.path.exists(file_path):
+            with Image.open(file_path) as img:
+                return img.convert('RGB')
+        result, _ = render_foreground_background(
+            foreground_path=foreground_path,
+            background_path=background_path,
+            merge_position=merge_position,
+            margin_ratio=margin_ratio,
+            aspect_ratio=aspect_ratio,
+            foreground_ratio=foreground_ratio,
+            height=height,
+        )
+        os.makedirs(composite_dir, exist_ok=True)
+        tmp_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
+        # Lossless and re-decoded on reuse, so favour encode speed over size
+        save_image(result, tmp_path, 'png', compress_level=1)
+        os.replace(tmp_path, file_path)
+        return result
+
+    return composite_cache.get(('composite', *key), loader)
+
+@lru_cache(maxsize=256)
+def get_font(font_path: Optional[str], size: int) -> ImageFont.ImageFont:
+    """
+    Load a font at a size, reusing FreeTypeFont objects across calls.
+    Falls back to Pillow's default font when no font path is given.
+    """
+    if font_path:
+        return ImageFont.truetype(font_path, size)
+    return ImageFont.load_default()
+
+def fit_text(
+    draw: ImageDraw.ImageDraw,
+    text: str,
+    font_path: Optional[str],
+    max_width: int,
+    max_height: int,
+    max_size: int,
+    min_size: int = 10,
+    balance: bool = False,
+) -> dict:
+    """
+    Find the largest font size in [min_size, max_size] whose wrapped text fits
+    max_width x max_height.
+
+    The wrapped height grows roughly with the square of the font size, so each
+    failing size gives an estimate of a fitting one; once a fitting height is
+    found, a binary search between it and the smallest failing size picks the
+    largest size whose height fits. Re-wrapping makes the width jitter by a few
+    pixels from one size to the next, so the width is only checked at the end,
+    stepping down from the chosen size until it fits too.
+
+    Returns:
+        dict: font, font_size, wrapped_text, width, height and layout_passes
+            (number of wrap + measure passes). Falls back to min_size when nothing fits.
+    """
+    layouts = {}
+
+    def layout(size: int) -> dict:
+        if size not in layouts:
+            font = get_font(font_path, size)
+            wrapped = wrap_text(text, font, max_width, balance=balance)
+            bbox = draw.multiline_textbbox((0, 0), wrapped, font=font)
+            layouts[size] = {
+                "font": font,
+                "font_size": size,
+                "wrapped_text": wrapped,
+                "width": bbox[2] - bbox[0],
+                "height": bbox[3] - bbox[1],
+            }
+        return layouts[size]
+
+    def fits_height(size: int) -> bool:
+        return layout(size)["height"] <= max_height
+
+    def fits(size: int) -> bool:
+        return fits_height(size) and layout(size)["width"] <= max_width
+
+    def estimate(size: int) -> int:
+        result = layout(size)
+        scale = min(max_width / max(result["width"], 1), (max_height / max(result["height"], 1)) ** 0.5)
+        return max(min_size, min(int(size * scale), size - 1))
+
+    max_size = max(max_size, min_size)
+    if not font_path or fits(max_size):
+        return {**layout(max_size), "layout_passes": len(layouts)}
+
+    # Bracket: shrink from the smallest failing size until the height fits
+    best = failing = max_size
+    while not fits_height(best) and best > min_size:
+        failing = best
+        best = estimate(best)
+
+    # Binary search for the largest height fit inside the bracket
+    lo, hi = best + 1, failing - 1
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        if fits_height(mid):
+            best = mid
+            lo = mid + 1
+        else:
+            hi = mid - 1
+
+    # Step down until the width fits as well (jumping when a word alone is too wide)
+    while not fits(best) and best > min_size:
+        best = best - 1 if layout(best)["width"] <= max_width * 1.05 else estimate(best)
+    return {**layout(best), "layout_passes": len(layouts)}
+
+def draw_text_on_image(
+    img: Image.Image,
+    text: str,
     font_path: Optional[str] = None,
-    font_color: str = '#000000',
+    font_color: Optional[str] = '#000000',
     font_size: Optional[int] = None,
     title: Optional[str] = None,
     title_font_path: Optional[str] = None,
@@ -368,10 +612,20 @@ def add_text_to_image(
     text_position: str = 'bottom',
     margin_ratio: float = 0.05,
     text_ratio: float = 1/2,
+    balance_lines: bool = False,
+    scale: float = 1.0,
+    font_color_hint: Optional[str] = None,
 ) -> dict:
-    if not os.path.exists(image_path):
-        raise FileNotFoundError(f"Image file not found: {image_path}")
-    img = Image.open(image_path).convert('RGB')
+    """
+    Draw a title and greeting text onto an RGB image in place.
+    With balance_lines, wrapped lines are evened out instead of filled greedily.
+    Font sizes and spacings are given for a STANDARD_HEIGHT card and multiplied
+    by scale, so a preview-size card gets the same layout.
+    With font_color None, the color is picked from the pixels the text covers
+    to reach FONT_CONTRAST_TARGET (see pick_font_color), tinted by font_color_hint if given.
+    Returns:
+        dict: The text layout parameters, including the fitted font size.
+    """
     draw = ImageDraw.Draw(img)
     W, H = img.size
     margin = int(min(W, H) * margin_ratio)
@@ -389,13 +643,9 @@ def add_text_to_image(
 
     # Title
     if title:
-        if title_font_size is None:
-            title_font_size = text_area_h // 4
-        if title_font_path:
-            title_font = ImageFont.truetype(title_font_path, title_font_size)
-        else:
-            title_font = ImageFont.load_default()
-        wrapped_title = _get_wrapped(title, title_font, text_area_w + 10)
+        title_px = text_area_h // 4 if title_font_size is None else max(1, round(title_font_size * scale))
+        title_font = get_font(title_font_path, title_px)
+        wrapped_title = wrap_text(title, title_font, text_area_w + round(10 * scale), balance=balance_lines)
         title_bbox = draw.multiline_textbbox((0, 0), wrapped_title, font=title_font)
         title_w, title_h = title_bbox[2] - title_bbox[0], title_bbox[3] - title_bbox[1]
     else:
@@ -406,26 +656,13 @@ def add_text_to_image(
 
     # Text
     if font_size is None:
-        cur_font_size = text_area_h // 3
-    else:
-        cur_font_size = font_size
-    if font_path:
-        font = ImageFont.truetype(font_path, cur_font_size)
+        font_size = text_area_h // 3
     else:
-        font = ImageFont.load_default()
-
-    while True:
-        wrapped_text = _get_wrapped(text, font, text_area_w)
-        text_bbox = draw.multiline_textbbox((0, 0), wrapped_text, font=font)
-        text_w, text_h = text_bbox[2] - text_bbox[0], text_bbox[3] - text_bbox[1]
-        total_h = title_h + text_h
-        if (text_w <= text_area_w and total_h <= text_area_h) or cur_font_size <= 10:
-            break
-        cur_font_size -= 2
-        if font_path:
-            font = ImageFont.truetype(font_path, cur_font_size)
-        else:
-            font = ImageFont.load_default()
+        font_size = max(1, round(font_size * scale))
+    fit = fit_text(draw, text, font_path, text_area_w, text_area_h - title_h, font_size,
+                   min_size=max(1, round(10 * scale)), balance=balance_lines)
+    font, wrapped_text, text_w, text_h = fit["font"], fit["wrapped_text"], fit["width"], fit["height"]
+    cur_font_size = fit["font_size"]
 
     # Position
     if text_position == 'top':
@@ -445,82 +682,154 @@ def add_text_to_image(
     title_x = base_x + (text_area_w - title_w) // 2 if title else base_x
     text_x = base_x + (text_area_w - text_w) // 2
 
-    with Pilmoji(img, source=GoogleEmojiSource()) as pilmoji:
+    text_y = base_y + title_h + round(70 * scale) if title else base_y
+
+    font_contrast = None
+    if font_color is None:
+        left = min(title_x, text_x) if title else text_x
+        right = max(title_x + title_w, text_x + text_w) if title else text_x + text_w
+        left, top = min(max(0, left), W - 1), min(max(0, base_y), H - 1)
+        text_box = (left, top, max(left + 1, min(W, right)), max(top + 1, min(H, text_y + text_h)))
+        font_color, font_contrast = pick_font_color(img, text_box, font_color_hint)
+
+    with Pilmoji(img, source=get_emoji_source()) as pilmoji:
         if title:
             pilmoji.text((title_x, base_y), wrapped_title, font=title_font, fill=font_color, align='center')
-            text_y = base_y + title_h + 70
-        else:
-            text_y = base_y
-        pilmoji.text((text_x, text_y), wrapped_text, font=font, fill=font_color, align='center', spacing=12)
+        pilmoji.text((text_x, text_y), wrapped_text, font=font, fill=font_color, align='center', spacing=round(12 * scale))
 
-    img.save(output_path)
     return {
-        "image_path": image_path,
-        "image_with_text_path": output_path,
         "text": text,
         "title": title,
         "text_position": text_position,
         "margin_ratio": margin_ratio,
         "text_ratio": text_ratio,
+        "balance_lines": balance_lines,
         "font_path": font_path,
         "font_color": font_color,
+        "font_contrast": font_contrast,
         "font_size": cur_font_size,
+        "layout_passes": fit["layout_passes"],
         "title_font_path": title_font_path,
         "title_font_size": title_font_size,
     }
 
-def _get_wrapped(text, font, max_width):
+def add_text_to_image(
+    image_path: str,
+    text: str,
+    output_path: str,
+    **kwargs,
+) -> dict:
+    """
+    Draw a title and greeting text onto the image at image_path and save it to output_path.
+    See draw_text_on_image for the parameters.
+    """
+    if not os.path.exists(image_path):
+        raise FileNotFoundError(f"Image file not found: {image_path}")
+    img = Image.open(image_path).convert('RGB')
+    info = draw_text_on_image(img, text, **kwargs)
+    save_image(img, output_path)
+    img.close()
+    return {"image_path": image_path, "image_with_text_path": output_path, **info}
+
+@lru_cache(maxsize=8192)
+def _word_runs(font: ImageFont.FreeTypeFont, word: str) -> Tuple[float, Tuple[Tuple[str, float], ...]]:
+    """
+    Measure a word with the font: the width of its text runs, and each emoji
+    with its width as a font glyph. Cached per (font, word).
+    """
+    text_width, emoji = 0.0, []
+    for i, chunk in enumerate(EMOJI_REGEX.split(word)):
+        if chunk:
+            if i % 2:
+                emoji.append((chunk, font.getlength(chunk)))
+            else:
+                text_width += font.getlength(chunk)
+    return text_width, tuple(emoji)
+
+def _word_width(font: ImageFont.FreeTypeFont, word: str) -> float:
+    """
+    Advance width of a word as Pilmoji draws it: emoji drawn as images take
+    font.size each, other runs (and emoji without an image yet, drawn with the
+    font) are measured with the font.
+    """
+    text_width, emoji = _word_runs(font, word)
+    if not emoji:
+        return text_width
+    source = get_emoji_source()
+    return text_width + sum(font.size if source.has_image(chunk) else glyph_width for chunk, glyph_width in emoji)
+
+def _break_lines(widths: List[float], space: float, max_width: float) -> List[Tuple[int, int]]:
+    """
+    Greedily break a sequence of word widths into lines no wider than max_width.
+    A word wider than max_width gets a line of its own.
+    Returns:
+        List[Tuple[int, int]]: (start, end) word index ranges of each line.
+    """
+    lines = []
+    start, line_width = 0, 0.0
+    for i, w in enumerate(widths):
+        if i > start and line_width + space + w > max_width:
+            lines.append((start, i))
+            start, line_width = i, w
+        else:
+            line_width += (space if i > start else 0) + w
+    lines.append((start, len(widths)))
+    return lines
+
+def wrap_text(text: str, font: ImageFont.FreeTypeFont, max_width: int, balance: bool = False) -> str:
     """
     Wrap text to fit within a given width using a given font.
+
+    Each distinct word (and the space) is measured once per font, and lines
+    are built by summing those widths. With balance, each paragraph keeps
+    the same number of lines but is broken at the narrowest width that
+    allows it, which evens out the line lengths.
     """
+    space = _word_width(font, ' ')
     lines = []
     for paragraph in text.split('\n'):
-        line = ''
-        for word in paragraph.split(' '):
-            test_line = line + (' ' if line else '') + word
-            bbox = font.getbbox(test_line)
-            w = bbox[2] - bbox[0]
-            if w > max_width and line:
-                lines.append(line)
-                line = word
-            else:
-                line = test_line
-        lines.append(line)
+        words = paragraph.split(' ')
+        widths = [_word_width(font, word) for word in words]
+        breaks = _break_lines(widths, space, max_width)
+        if balance and len(breaks) > 1:
+            lo, hi = int(max(widths)), max_width
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if len(_break_lines(widths, space, mid)) <= len(breaks):
+                    hi = mid
+                else:
+                    lo = mid + 1
+            breaks = _break_lines(widths, space, hi)
+        lines.extend(' '.join(words[start:end]) for start, end in breaks)
     return '\n'.join(lines)
 
-def get_templates_by_type(card_type: str, aspect_ratio: float = 3/4, json_path: str = 'static/images/template_metadata.json') -> list:
+def get_templates_by_type(card_type: str, aspect_ratio: float = 3/4, db_path: Optional[str] = None) -> list:
     """
-    Get a list of image info dictionaries by type from metadata file.
+    Get a list of image info dictionaries by type from the in-memory template catalog.
     Args:
         card_type (str): The type name (e.g., 'birthday')
         aspect_ratio (float): Aspect ratio of the templates to filter by.
-        json_path (str): Path to the JSON file containing template metadata.
+        db_path (str): Path to the metadata database, defaults to METADATA_DB_PATH.
     Returns:
-        List[dict]: A list of image info dictionaries matching the type
+        List[dict]: A list of image info dictionaries matching the type.
+            The list is shared with the catalog and must not be mutated.
     """
-    if not os.path.exists(json_path):
-        return []
-    with open(json_path, 'r', encoding='utf-8') as f:
-        try:
-            data = json.load(f)
-        except Exception:
-            return []
-    return [item for item in data if item.get('card_type') == card_type and item.get('aspect_ratio') == aspect_ratio]
+    return get_template_catalog(db_path).get(card_type, aspect_ratio)
 
 
 def get_random_template_by_type(card_type: str, aspect_ratio: float = 3/4) -> Optional[dict]:
     """
-    Get a random template image info dictionary by type from the template_card_info.json file.
+    Get a random template image info dictionary by type from the template catalog.
     Args:
         card_type (str): The type name (e.g., 'birthday')
         aspect_ratio (float): Aspect ratio of the templates to filter by.
     Returns:
-        dict: A random image info dictionary matching the type, or None if not found
+        dict: A copy of a random image info dictionary matching the type, or None if not found
     """
-    templates = get_templates_by_type(card_type, aspect_ratio)
-    if not templates:
+    template = get_template_catalog().random(card_type, aspect_ratio)
+    if not template:
         return None
-    return random.choice(templates)
+    return dict(template)
 
 def get_random_font(fonts_dir: str = "static/fonts/text_fonts") -> str:
     """
@@ -569,55 +878,38 @@ def color_distance_hsv(hsv1: tuple, hsv2: tuple) -> float:
     )
     return distance
 
-def get_best_matching_background(target_color: str, json_path: str = 'static/images/background_metadata.json') -> Optional[dict]:
+def get_matching_backgrounds(target_color: str, k: int = 5, color_space: str = 'hsv', db_path: Optional[str] = None) -> List[dict]:
     """
-    Find the best matching background color from the metadata file based on the target color.
+    Find the k backgrounds whose colors are closest to the target color.
     Args:
         target_color (str): The target color in hex format (e.g., '#ff0000').
-        json_path (str): Path to the JSON file containing background metadata.
+        k (int): Number of backgrounds to return.
+        color_space (str): 'hsv' for the HSV cone distance or 'lab' for perceptual CIELAB distance.
+        db_path (str): Path to the metadata database, defaults to METADATA_DB_PATH.
     Returns:
-        Optional[dict]: The background metadata dictionary with the closest color match, or None if not found.
+        List[dict]: Copies of the background metadata dictionaries with a 'distance' key, closest first.
     """
-    if not os.path.exists(json_path):
-        logger.warning(f"Background metadata file not found: {json_path}")
-        return None
-    
     try:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        matches = get_background_color_index(db_path).nearest(target_color, k=k, color_space=color_space)
     except Exception as e:
-        logger.error(f"Error reading background metadata: {e}")
-        return None
-    
-    if not data:
-        logger.warning("No background data found in metadata file")
-        return None
-    
-    target_rgb = hex_to_rgb(target_color)
-    target_hsv = colorsys.rgb_to_hsv(target_rgb[0] / 255.0, target_rgb[1] / 255.0, target_rgb[2] / 255.0)
-    
-    best_match = None
-    min_distance = float('inf')
-    
-    for background in data:
-        if 'color' not in background:
-            continue
-        
-        try:
-            bg_rgb = hex_to_rgb(background['color'])
-            bg_hsv = colorsys.rgb_to_hsv(bg_rgb[0] / 255.0, bg_rgb[1] / 255.0, bg_rgb[2] / 255.0)
-            distance = color_distance_hsv(target_hsv, bg_hsv)
-            
-            if distance < min_distance:
-                min_distance = distance
-                best_match = background
-        except Exception as e:
-            logger.warning(f"Error processing background color {background.get('color', 'unknown')}: {e}")
-            continue
-    
-    if best_match:
-        logger.info(f"Found best matching background: {best_match['background_path']} with color {best_match['color']} (distance: {min_distance:.2f})")
-    else:
+        logger.error(f"Error searching background metadata: {e}")
+        return []
+    return [{**background, "distance": distance} for background, distance in matches]
+
+def get_best_matching_background(target_color: str, color_space: str = 'hsv', db_path: Optional[str] = None) -> Optional[dict]:
+    """
+    Find the best matching background color from the metadata store based on the target color.
+    Args:
+        target_color (str): The target color in hex format (e.g., '#ff0000').
+        color_space (str): 'hsv' for the HSV cone distance or 'lab' for perceptual CIELAB distance.
+        db_path (str): Path to the metadata database, defaults to METADATA_DB_PATH.
+    Returns:
+        Optional[dict]: The background metadata dictionary with the closest color match, or None if not found.
+    """
+    matches = get_matching_backgrounds(target_color, k=1, color_space=color_space, db_path=db_path)
+    if not matches:
         logger.warning("No matching background found")
-    
-    return best_match
\ No newline at end of file
+        return None
+    best_match = matches[0]
+    logger.info(f"Found best matching background: {best_match['background_path']} with color {best_match['color']} (distance: {best_match['distance']:.2f})")
+    return best_match
@@ -0,0 +1,137 @@
+import hashlib
+import logging
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Optional, Tuple
+
+from PIL import Image
+
+from .assets import REDUCING_GAP, open_image
+from .encoding import save_image, with_format_extension
+from .tools import STANDARD_HEIGHT
+
+logger = logging.getLogger(__name__)
+
+# Canonical encodings of uploads: foregrounds keep their alpha, backgrounds
+# are opaque and JPEG decodes fastest (and supports draft mode)
+FOREGROUND_UPLOAD_FORMAT = os.getenv("FOREGROUND_UPLOAD_FORMAT", "webp")
+BACKGROUND_UPLOAD_FORMAT = os.getenv("BACKGROUND_UPLOAD_FORMAT", "jpeg")
+UPLOAD_QUALITY = int(os.getenv("UPLOAD_QUALITY", "92"))
+KEEP_ORIGINAL_UPLOADS = os.getenv("KEEP_ORIGINAL_UPLOADS", "false").lower() in ("1", "true", "yes")
+ORIGINALS_DIR = os.getenv("ORIGINALS_DIR", "static/images/originals")
+# Hex digits of the SHA-256 in upload file names (128 bits)
+UPLOAD_HASH_LENGTH = 32
+# The largest card (4:3 at full height): no renderer draws an upload bigger than what covers it
+MAX_UPLOAD_SIZE = (int(STANDARD_HEIGHT * 4 / 3), STANDARD_HEIGHT)
+
+
+def fit_cover(image_size: Tuple[int, int], max_size: Tuple[int, int] = MAX_UPLOAD_SIZE) -> Tuple[int, int]:
+    """The smallest downscale of image_size that still covers max_size, or image_size if it does not."""
+    width, height = image_size
+    scale = max(max_size[0] / width, max_size[1] / height)
+    if scale >= 1:
+        return image_size
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def normalize_image(source, output_path: str, kind: str = 'foreground', max_size: Tuple[int, int] = MAX_UPLOAD_SIZE) -> dict:
+    """
+    Decode an upload once and store it in its canonical form.
+
+    Foregrounds are cropped to their non-transparent pixels, both kinds are
+    downscaled to the smallest size covering max_size and encoded as
+    FOREGROUND_UPLOAD_FORMAT / BACKGROUND_UPLOAD_FORMAT.
+    Args:
+        source: Path or binary file object of the uploaded image.
+        output_path (str): Destination, its extension is replaced by the canonical format's.
+        kind (str): 'foreground' or 'background'.
+    Returns:
+        dict: path, width, height and the original_size of the upload.
+    """
+    if kind not in ('foreground', 'background'):
+        raise ValueError("kind must be 'foreground' or 'background'")
+    output_format = FOREGROUND_UPLOAD_FORMAT if kind == 'foreground' else BACKGROUND_UPLOAD_FORMAT
+    output_path = with_format_extension(output_path, output_format)
+
+    with open_image(source) as img:
+        original_size = img.size
+        mode = 'RGBA' if kind == 'foreground' else 'RGB'
+        if img.format == 'JPEG':
+            # No transparency to trim, so the decoder may downscale already
+            img.draft('RGB', fit_cover(img.size, max_size))
+        img = img.convert(mode)
+    box = (0, 0, img.width, img.height)
+    if mode == 'RGBA':
+        box = img.getchannel('A').getbbox()
+        if box is None:
+            raise ValueError("Foreground image is fully transparent")
+    size = fit_cover((box[2] - box[0], box[3] - box[1]), max_size)
+    if box != (0, 0, img.width, img.height) or size != img.size:
+        img = img.resize(size, Image.LANCZOS, box=box, reducing_gap=REDUCING_GAP)
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    tmp_path = f"{output_path}.{uuid.uuid4().hex}.tmp"
+    save_image(img, tmp_path, output_format, quality=UPLOAD_QUALITY)
+    os.replace(tmp_path, output_path)
+    return {"path": output_path, "width": img.width, "height": img.height, "original_size": original_size}
+
+
+def content_hash(file: BinaryIO) -> str:
+    """SHA-256 of the rest of a file object, which is rewound afterwards."""
+    start = file.tell()
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file.read(1 << 20), b''):
+        digest.update(chunk)
+    file.seek(start)
+    return digest.hexdigest()
+
+
+def upload_path(digest: str, upload_dir: str, kind: str = 'foreground') -> str:
+    """Path of the normalized upload with a content hash, e.g. static/images/backgrounds/8854...35.jpg."""
+    output_format = FOREGROUND_UPLOAD_FORMAT if kind == 'foreground' else BACKGROUND_UPLOAD_FORMAT
+    return with_format_extension(os.path.join(upload_dir, digest[:UPLOAD_HASH_LENGTH]), output_format)
+
+
+def store_upload(file: BinaryIO, filename: str, upload_dir: str, kind: str = 'foreground', keep_original: Optional[bool] = None) -> dict:
+    """
+    Store an uploaded image normalized (see normalize_image) under upload_dir,
+    named by the SHA-256 of the bytes sent.
+
+    An upload whose hash is already stored is not decoded or written again,
+    so the metadata, colors and thumbnails keyed by its path are reused.
+    With keep_original (default KEEP_ORIGINAL_UPLOADS) the bytes as sent are
+    also kept under ORIGINALS_DIR, mirroring upload_dir.
+    Returns:
+        dict: path of the normalized image, original_path (None unless kept),
+            content_hash and duplicate (whether the upload was already stored).
+    """
+    if keep_original is None:
+        keep_original = KEEP_ORIGINAL_UPLOADS
+    digest = content_hash(file)
+    path = upload_path(digest, upload_dir, kind)
+    original_path = None
+    if keep_original:
+        suffix = os.path.splitext(filename)[1].lower()
+        original_path = os.path.join(ORIGINALS_DIR, os.path.relpath(upload_dir, "static/images"), digest[:UPLOAD_HASH_LENGTH] + suffix)
+    duplicate = os.path.exists(path)
+    if original_path and not os.path.exists(original_path):
+        os.makedirs(os.path.dirname(original_path), exist_ok=True)
+        tmp_path = f"{original_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as buffer:
+            shutil.copyfileobj(file, buffer)
+        os.replace(tmp_path, original_path)
+        file.seek(0)
+    if duplicate:
+        logger.info(f"Upload {filename} is already stored as {path}")
+        return {"path": path, "original_path": original_path, "content_hash": digest, "duplicate": True}
+    try:
+        result = normalize_image(file, path, kind)
+    except Exception:
+        if original_path:
+            Path(original_path).unlink(missing_ok=True)
+        raise
+    if result["original_size"] != (result["width"], result["height"]):
+        logger.info(f"Normalized {filename} from {result['original_size']} to {(result['width'], result['height'])}")
+    return {"path": path, "original_path": original_path, "content_hash": digest, "duplicate": False}
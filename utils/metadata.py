@@ -1,46 +1,49 @@
 import os, sys 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
+import argparse
+import logging
+import multiprocessing
+import time
 import uuid
-import json
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from core_ai.utils.tools import merge_foreground_background, get_dominant_color
+from typing import Iterable, List, Optional, Sequence, Tuple
+from core_ai.utils.tools import merge_foreground_background, get_image_colors
+from core_ai.utils.store import get_metadata_store
+from core_ai.utils.encoding import TEMPLATE_FORMAT, with_format_extension
+from core_ai.utils.thumbnails import make_thumbnails, remove_thumbnails
 
-def add_template_metadata(foreground_path: str, background_path: str, json_path: str, card_type: str, aspect_ratio: float = 3/4):
-    """
-    Merge a foreground and background image, save the merged image, and append its metadata to a JSON file.
+logger = logging.getLogger(__name__)
 
-    Args:
-        foreground_path (str): Path to the foreground image.
-        background_path (str): Path to the background image.
-        json_path (str): Path to the JSON file to append card info.
-        card_type (str): Type/category of the card (e.g., 'birthday', 'graduation').
-    """
-    # Normalize paths to use forward slashes for consistency across OS
-    foreground_path_normalized = Path(foreground_path).as_posix()
-    background_path_normalized = Path(background_path).as_posix()
-    
-    json_file = Path(json_path)
-    if json_file.exists() and json_file.stat().st_size > 0:
-        with open(json_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    else:
-        data = []
-
-    # Check for existing entry using normalized paths
-    for item in data:
-        if (
-            item.get("foreground_path") == foreground_path_normalized and
-            item.get("background_path") == background_path_normalized and
-            item.get("aspect_ratio") == aspect_ratio and
-            item.get("card_type") == card_type
-        ):
-            return item
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+# Aspect ratios served by the API, stored as these exact floats
+ASPECT_RATIOS = (3/4, 4/3)
 
+def snap_aspect_ratio(aspect_ratio: float, tolerance: float = 0.01) -> float:
+    """Return the known aspect ratio within tolerance (relative) of aspect_ratio, e.g. 4/3 for 1.333, or aspect_ratio itself."""
+    for known in ASPECT_RATIOS:
+        if abs(aspect_ratio - known) <= known * tolerance:
+            return known
+    return aspect_ratio
+
+def parse_aspect_ratio(value: str) -> float:
+    """Parse an aspect ratio given as 'W/H', 'W:H' or a number, snapped to the known ratios."""
+    try:
+        for sep in ('/', ':'):
+            if sep in value:
+                width, height = value.split(sep)
+                return snap_aspect_ratio(float(width) / float(height))
+        return snap_aspect_ratio(float(value))
+    except (ValueError, ZeroDivisionError):
+        raise argparse.ArgumentTypeError(f"invalid aspect ratio {value!r}, expected e.g. 3/4, 4:3 or 0.75")
+
+def _render_template(foreground_path: str, background_path: str, card_type: str, aspect_ratio: float) -> dict:
+    """Render the merged image of a template and its thumbnails and return its metadata."""
     output_dir = Path(f"static/images/card_types/{card_type}")
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    output_path = output_dir / f"{uuid.uuid4()}.png"
+    output_path = Path(with_format_extension(str(output_dir / str(uuid.uuid4())), TEMPLATE_FORMAT))
 
     img = merge_foreground_background(
         foreground_path=foreground_path,
@@ -51,121 +54,272 @@ def add_template_metadata(foreground_path: str, background_path: str, json_path:
     )
 
     # Use normalized paths in metadata
-    img["foreground_path"] = foreground_path_normalized
-    img["background_path"] = background_path_normalized
+    img["foreground_path"] = Path(foreground_path).as_posix()
+    img["background_path"] = Path(background_path).as_posix()
     img["merged_image_path"] = output_path.as_posix()
     img["card_type"] = card_type
     img["aspect_ratio"] = aspect_ratio
+    img.update(make_thumbnails(str(output_path)))
+    return img
 
-    data.append(img)
+def _render_background(background_path: str, db_path: Optional[str] = None) -> dict:
+    """Compute the metadata of a background image."""
+    colors = get_image_colors(background_path, db_path=db_path)
+    return {
+        "background_path": Path(background_path).as_posix(),
+        "color": colors["color"],
+        "palette": colors["palette"]
+    }
 
-    with open(json_file, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    
-    return img
+def _drop_duplicate_renders(rendered: List[dict], stored: List[dict]) -> None:
+    """Delete merged images and thumbnails that lost an upsert race to an existing template."""
+    for item, row in zip(rendered, stored):
+        if row["merged_image_path"] != item["merged_image_path"]:
+            Path(item["merged_image_path"]).unlink(missing_ok=True)
+            remove_thumbnails(item)
+
+def add_template_metadata(foreground_path: str, background_path: str, card_type: str, aspect_ratio: float = 3/4, db_path: Optional[str] = None):
+    """
+    Merge a foreground and background image, save the merged image, and upsert its metadata into the store.
+
+    Args:
+        foreground_path (str): Path to the foreground image.
+        background_path (str): Path to the background image.
+        card_type (str): Type/category of the card (e.g., 'birthday', 'graduation').
+        aspect_ratio (float): Aspect ratio of the template.
+        db_path (str): Path to the metadata database, defaults to METADATA_DB_PATH.
+    """
+    # Normalize paths to use forward slashes for consistency across OS
+    foreground_path_normalized = Path(foreground_path).as_posix()
+    background_path_normalized = Path(background_path).as_posix()
+    aspect_ratio = snap_aspect_ratio(aspect_ratio)
+
+    store = get_metadata_store(db_path)
+    existing = store.get_template(foreground_path_normalized, background_path_normalized, aspect_ratio, card_type)
+    if existing:
+        return existing
+
+    img = _render_template(foreground_path, background_path, card_type, aspect_ratio)
+    stored = store.upsert_template(img)
+    _drop_duplicate_renders([img], [stored])
+    return stored
 
-def add_background_metadata(background_path: str, json_path: str):
+def add_background_metadata(background_path: str, db_path: Optional[str] = None):
     """
-    Add metadata for a single background image to a JSON file.
+    Add metadata for a single background image to the store.
     Args:
         background_path (str): Path to the background image.
-        json_path (str): Path to the JSON file to append background info.
+        db_path (str): Path to the metadata database, defaults to METADATA_DB_PATH.
     """
     # Normalize path to use forward slashes for consistency across OS
     background_path_normalized = Path(background_path).as_posix()
-    
-    json_file = Path(json_path)
-    if json_file.exists() and json_file.stat().st_size > 0:
-        with open(json_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    else:
-        data = []
-
-    # Check for existing entry using normalized path
-    for item in data:
-        if item.get("background_path") == background_path_normalized:
-            return item
-
-    color = get_dominant_color(background_path)
-    item = {
-        "background_path": background_path_normalized,
-        "color": color
-    }
-    data.append(item)
 
-    with open(json_file, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    
-    return item
+    store = get_metadata_store(db_path)
+    existing = store.get_background(background_path_normalized)
+    if existing:
+        return existing
+
+    return store.upsert_background(_render_background(background_path, db_path))
 
-def process_background_folder(dir_path: str, json_path: str):
+def bulk_ingest(
+    background_paths: Iterable[str] = (),
+    template_specs: Iterable[Tuple[str, str, str]] = (),
+    aspect_ratios: Sequence[float] = (3/4,),
+    max_workers: Optional[int] = None,
+    db_path: Optional[str] = None,
+) -> dict:
     """
-    Process all background images in a folder and add their metadata to a JSON file.
+    Compute background colors and merged templates across a process pool and
+    commit all new metadata in one batch at the end.
 
     Args:
-        dir_path (str): Path to the directory containing background images.
-        json_path (str): Path to the JSON file to save background info.
+        background_paths (Iterable[str]): Background images to add.
+        template_specs (Iterable[Tuple[str, str, str]]): (foreground_path, background_path, card_type) triples.
+        aspect_ratios (Sequence[float]): Aspect ratios to render every template in, snapped to ASPECT_RATIOS.
+        max_workers (int): Number of worker processes, defaults to the CPU count.
+        db_path (str): Path to the metadata database, defaults to METADATA_DB_PATH.
+    Returns:
+        dict: Counts of added backgrounds and templates, skipped (already known) items,
+            per-item failures, elapsed seconds and throughput in images per second.
+    """
+    store = get_metadata_store(db_path)
+    start = time.perf_counter()
+    aspect_ratios = list(dict.fromkeys(snap_aspect_ratio(aspect_ratio) for aspect_ratio in aspect_ratios))
+
+    background_jobs, template_jobs, skipped = [], [], 0
+    for path in dict.fromkeys(background_paths):
+        if store.get_background(Path(path).as_posix()):
+            skipped += 1
+        else:
+            background_jobs.append(path)
+    for fg_path, bg_path, card_type in dict.fromkeys(template_specs):
+        for aspect_ratio in aspect_ratios:
+            if store.get_template(Path(fg_path).as_posix(), Path(bg_path).as_posix(), aspect_ratio, card_type):
+                skipped += 1
+            else:
+                template_jobs.append((fg_path, bg_path, card_type, aspect_ratio))
+
+    backgrounds, templates, failed = [], [], []
+    if background_jobs or template_jobs:
+        # spawn: a forked worker would share this process's open SQLite connection
+        # while caching file hashes and colors; spawned ones open their own
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = {pool.submit(_render_background, path, db_path): ("background", path) for path in background_jobs}
+            for job in template_jobs:
+                futures[pool.submit(_render_template, *job)] = ("template", f"{job[0]} {job[1]} ({job[2]}, {job[3]:.2f})")
+            for future in as_completed(futures):
+                kind, label = futures[future]
+                try:
+                    item = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to ingest {kind} {label}: {e}")
+                    failed.append({"kind": kind, "path": label, "error": str(e)})
+                    continue
+                (backgrounds if kind == "background" else templates).append(item)
+
+    store.upsert_backgrounds(backgrounds)
+    _drop_duplicate_renders(templates, store.upsert_templates(templates))
+
+    elapsed = time.perf_counter() - start
+    processed = len(backgrounds) + len(templates) + len(failed)
+    report = {
+        "backgrounds_added": len(backgrounds),
+        "templates_added": len(templates),
+        "skipped": skipped,
+        "failed": failed,
+        "elapsed_seconds": round(elapsed, 3),
+        "images_per_second": round(processed / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+    logger.info(f"Bulk ingest finished: {report['backgrounds_added']} backgrounds, {report['templates_added']} templates, "
+                f"{len(failed)} failures in {report['elapsed_seconds']}s ({report['images_per_second']} images/sec)")
+    return report
+
+def list_images(dir_path: str) -> List[str]:
+    """
+    List the image files of a folder.
+
+    Args:
+        dir_path (str): Path to the directory containing images.
     """
-    file_extensions = ['.png', '.jpg', '.jpeg', '.webp']
-    
     dir_path = Path(dir_path)
     if not dir_path.exists():
         raise FileNotFoundError(f"Directory not found: {dir_path}")
-    
-    for ext in file_extensions:
-        for img_path in dir_path.glob(f"*{ext}"):
-            add_background_metadata(
-                background_path=str(img_path),
-                json_path=json_path
-            )
+    return sorted(str(p) for p in dir_path.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
 
-def process_template_txt_file(txt_path: str, json_path: str, card_type: str, aspect_ratio: float = 3/4):
+def read_template_txt_file(txt_path: str, card_type: str, failed: Optional[List[dict]] = None) -> List[Tuple[str, str, str]]:
     """
-    Read a text file containing lines of '<foreground_path> <background_path>',
-    merge each pair, and append their info to a JSON file for the specified card type.
+    Read a text file containing lines of '<foreground_path> <background_path>'.
+    Malformed lines are skipped, logged and recorded in failed (if given) as bulk_ingest reports them.
 
-    Args:
-        txt_path (str): Path to the text file with image path pairs.
-        json_path (str): Path to the JSON file to append card info.
-        card_type (str): Type/category of the card (e.g., 'birthday', 'graduation').
+    Returns:
+        List[Tuple[str, str, str]]: (foreground_path, background_path, card_type) triples.
     """
+    specs = []
     with open(txt_path, "r", encoding="utf-8") as f:
-        for line in f:
+        for number, line in enumerate(f, 1):
             line = line.strip()
             if not line:
                 continue
-            fg_path, bg_path = line.split()
-            add_template_metadata(
-                foreground_path=fg_path,
-                background_path=bg_path,
-                json_path=json_path,
-                card_type=card_type,
-                aspect_ratio=aspect_ratio
-            )
-
-def process_template_folder(dir_path: str, json_path: str, aspect_ratio: float = 3/4):
-    """
-    Process all template images in a folder and add their metadata to a JSON file.
+            try:
+                fg_path, bg_path = line.split()
+            except ValueError:
+                logger.error(f"Invalid line {number} of {txt_path}: {line}")
+                if failed is not None:
+                    failed.append({"kind": "template", "path": f"{txt_path}:{number}", "error": f"Invalid line: {line}"})
+                continue
+            specs.append((fg_path, bg_path, card_type))
+    return specs
+
+def process_background_folder(dir_path: str, db_path: Optional[str] = None, max_workers: Optional[int] = None) -> dict:
+    """
+    Process all background images in a folder and add their metadata to the store in one batch.
+
+    Args:
+        dir_path (str): Path to the directory containing background images.
+        db_path (str): Path to the metadata database, defaults to METADATA_DB_PATH.
+        max_workers (int): Number of worker processes, defaults to the CPU count.
+    """
+    return bulk_ingest(background_paths=list_images(dir_path), max_workers=max_workers, db_path=db_path)
+
+def process_template_txt_file(txt_path: str, card_type: str, aspect_ratio: float = 3/4, db_path: Optional[str] = None, max_workers: Optional[int] = None) -> dict:
+    """
+    Read a text file containing lines of '<foreground_path> <background_path>',
+    merge each pair, and add their info to the store for the specified card type.
+
+    Args:
+        txt_path (str): Path to the text file with image path pairs.
+        card_type (str): Type/category of the card (e.g., 'birthday', 'graduation').
+        db_path (str): Path to the metadata database, defaults to METADATA_DB_PATH.
+        max_workers (int): Number of worker processes, defaults to the CPU count.
+    """
+    failed = []
+    report = bulk_ingest(
+        template_specs=read_template_txt_file(txt_path, card_type, failed),
+        aspect_ratios=(aspect_ratio,),
+        max_workers=max_workers,
+        db_path=db_path
+    )
+    report["failed"] = failed + report["failed"]
+    return report
+
+def collect_template_specs(dir_path: str, failed: Optional[List[dict]] = None) -> List[Tuple[str, str, str]]:
+    """
+    Read every '<card_type>.txt' pair file of a folder.
     Card types are determined by the file names.
 
     Args:
-        dir_path (str): Path to the directory containing template images.
-        json_path (str): Path to the JSON file to save template info.
-        aspect_ratio (float): Aspect ratio for the templates.
+        dir_path (str): Path to the directory containing template pair files.
+        failed (List[dict]): Receives the malformed lines, see read_template_txt_file.
     """
     dir_path = Path(dir_path)
     if not dir_path.exists():
         raise FileNotFoundError(f"Directory not found: {dir_path}")
 
-    for txt_file in dir_path.glob("*.txt"):
-        process_template_txt_file(
-            txt_path=str(txt_file),
-            json_path=json_path,
-            card_type=txt_file.stem,
-            aspect_ratio=aspect_ratio
-        )
+    specs = []
+    for txt_file in sorted(dir_path.glob("*.txt")):
+        specs.extend(read_template_txt_file(str(txt_file), txt_file.stem, failed))
+    return specs
+
+def process_template_folder(dir_path: str, aspect_ratio: float = 3/4, db_path: Optional[str] = None, max_workers: Optional[int] = None) -> dict:
+    """
+    Process all template pair files in a folder and add their metadata to the store in one batch.
+
+    Args:
+        dir_path (str): Path to the directory containing template pair files.
+        aspect_ratio (float): Aspect ratio for the templates.
+        db_path (str): Path to the metadata database, defaults to METADATA_DB_PATH.
+        max_workers (int): Number of worker processes, defaults to the CPU count.
+    """
+    failed = []
+    report = bulk_ingest(
+        template_specs=collect_template_specs(dir_path, failed),
+        aspect_ratios=(aspect_ratio,),
+        max_workers=max_workers,
+        db_path=db_path
+    )
+    report["failed"] = failed + report["failed"]
+    return report
 
 if __name__ == "__main__":
-    process_background_folder("static/images/backgrounds", "static/images/background_metadata.json")
-    process_template_folder("utils/infor_template", "static/images/template_metadata.json", aspect_ratio=3/4)
-    process_template_folder("utils/infor_template", "static/images/template_metadata.json", aspect_ratio=4/3)
+    parser = argparse.ArgumentParser(description="Bulk ingest backgrounds and templates into the metadata store.")
+    parser.add_argument("--backgrounds", default="static/images/backgrounds", help="Folder of background images")
+    parser.add_argument("--templates", default="utils/infor_template", help="Folder of '<card_type>.txt' pair files")
+    parser.add_argument("--aspect-ratio", type=parse_aspect_ratio, action="append", dest="aspect_ratios",
+                        help="Aspect ratio to render as W/H, e.g. 3/4 (repeatable, default 3/4 and 4/3)")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes")
+    parser.add_argument("--db", default=None, help="Metadata database path")
+    args = parser.parse_args()
+
+    failed = []
+    report = bulk_ingest(
+        background_paths=list_images(args.backgrounds) if args.backgrounds else [],
+        template_specs=collect_template_specs(args.templates, failed) if args.templates else [],
+        aspect_ratios=args.aspect_ratios or ASPECT_RATIOS,
+        max_workers=args.workers,
+        db_path=args.db,
+    )
+    report["failed"] = failed + report["failed"]
+    print(f"Added {report['backgrounds_added']} backgrounds and {report['templates_added']} templates, "
+          f"skipped {report['skipped']} known items in {report['elapsed_seconds']}s ({report['images_per_second']} images/sec)")
+    for failure in report["failed"]:
+        print(f"FAILED {failure['kind']} {failure['path']}: {failure['error']}")